@@ -1,11 +1,258 @@
 from typing import Union  # Объединение типов
-from socket import socket, AF_INET, SOCK_STREAM  # Обращаться к LUA скриптам QUIK# будем через соединения
-from threading import Thread, Event, Lock  # Поток/событие выхода для обратного вызова. Блокировка process_request для многопоточных приложений
-from json import loads  # Принимать данные в QUIK будем через JSON
+from socket import socket, AF_INET, SOCK_STREAM, SHUT_RDWR  # Обращаться к LUA скриптам QUIK# будем через соединения
+from threading import Thread, Event, Lock, RLock, current_thread  # Поток/событие выхода для обратного вызова. Блокировка process_request для многопоточных приложений
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError  # Ожидание ответа на запрос в режиме мультиплексирования
+from queue import Queue, Full  # Очередь функций обратного вызова между потоками приема и обработки
+from datetime import datetime  # День получения спецификации
+from time import perf_counter, time, time_ns, sleep  # Время работы обработчиков функций обратного вызова. Время получения стоимости шага цены. Время приема и воспроизведения записи
+from struct import Struct  # Заголовки фрагментов в записи функций обратного вызова
+from os import replace  # Атомарная запись справочника тикеров в файл
+from itertools import count  # Уникальные коды запросов в режиме мультиплексирования
+from json import loads, dumps, load, dump  # Принимать и отправлять данные в QUIK будем через JSON. Справочник тикеров храним в файле JSON
 from json.decoder import JSONDecodeError  # Ошибка декодирования JSON
 import logging  # Будем вести лог
 
 from pytz import timezone  # Работаем с временнОй зоной
+try:  # NumPy нужен только для пакетного перевода цен и количеств
+    import numpy as np  # Массивы цен и количеств
+except ImportError:  # Если NumPy не установлен
+    np = None  # то пакетные функции перевода недоступны
+
+
+class JsonLineCodec:
+    """Инкрементальный разбор потока сообщений QUIK#. Каждое сообщение - JSON в кодировке Windows 1251, сообщения разделены переводом строки
+
+    Принятые байты накапливаются в одном буфере. Конец сообщения ищется только в новых данных, каждое полностью принятое сообщение декодируется один раз
+    """
+    encoding = 'cp1251'  # QUIK# работает в кодировке Windows 1251
+    logger = logging.getLogger('QuikPy.JsonLineCodec')  # Будем вести лог
+
+    def __init__(self, buffer_size=1048576):
+        """Инициализация
+
+        :param int buffer_size: Размер буфера приема в байтах
+        """
+        self.buffer = bytearray()  # Принятые, но еще не разобранные данные
+        self.scanned = 0  # Кол-во байт буфера, в которых уже нет перевода строки
+        self.recv_buffer = bytearray(buffer_size)  # Переиспользуемый буфер приема
+        self.recv_view = memoryview(self.recv_buffer)  # Срезы буфера приема без копирования
+        self.tap = None  # Функция, которой передается каждый принятый фрагмент до разбора. Например, запись CallbackCapture
+
+    @classmethod
+    def encode(cls, request) -> bytes:
+        """Перевод запроса в виде словаря в сообщение QUIK#
+
+        :param dict request: Запрос в виде словаря. Множества (set) отправляются списками
+        :return: Сообщение в кодировке Windows 1251 с переводом строки в конце
+        """
+        return dumps(request, ensure_ascii=False, separators=(',', ':'), default=list).encode(cls.encoding) + b'\r\n'
+
+    def recv(self, sock) -> list:
+        """Прием данных из соединения и разбор полностью принятых сообщений
+
+        :param socket sock: Соединение
+        :return: Список сообщений в формате JSON. Пустой, если ни одно сообщение еще не принято полностью
+        :raises ConnectionError: Соединение закрыто
+        """
+        size = sock.recv_into(self.recv_buffer)  # Читаем фрагмент в буфер приема
+        if size == 0:  # Если ничего не прочитали
+            raise ConnectionError('Соединение с QUIK закрыто')  # то соединение закрыто
+        chunk = self.recv_view[:size]  # Принятый фрагмент
+        if self.tap is not None:  # Если принятые данные нужно передавать
+            self.tap(chunk)  # то передаем фрагмент до разбора
+        return self.feed(chunk)  # Разбираем фрагмент
+
+    def feed(self, data) -> list:
+        """Добавление принятых данных и разбор полностью принятых сообщений
+
+        :param bytes data: Принятые данные
+        :return: Список сообщений в формате JSON
+        """
+        buffer = self.buffer  # Принятые данные
+        buffer += data  # Добавляем новые данные
+        end = buffer.find(b'\n', self.scanned)  # Конец сообщения ищем только в новых данных
+        if end < 0:  # Если ни одно сообщение еще не принято полностью
+            self.scanned = len(buffer)  # то в следующий раз ищем после этих данных
+            return []
+        messages = []  # Полностью принятые сообщения
+        start = 0  # Начало сообщения
+        with memoryview(buffer) as view:  # Сообщения берем из буфера без копирования
+            while end >= 0:  # Пока есть полностью принятые сообщения
+                text = str(view[start:end], self.encoding)  # Декодируем сообщение из Windows 1251
+                if text.strip():  # Если сообщение не пустое
+                    try:  # Пробуем разобрать сообщение
+                        messages.append(loads(text))  # Переводим сообщение в формат JSON
+                    except JSONDecodeError:  # Если разобрать не смогли. Сообщение принято полностью, значит, оно испорчено
+                        self.logger.error(f'Не удалось разобрать сообщение {text[:200]}')
+                start = end + 1  # Следующее сообщение начинается после перевода строки
+                end = buffer.find(b'\n', start)  # Ищем конец следующего сообщения
+        del buffer[:start]  # Удаляем разобранные сообщения из буфера
+        self.scanned = len(buffer)  # В оставшемся неполном сообщении перевода строки нет
+        return messages
+
+
+class CallbackCapture:
+    """Запись потока функций обратного вызова в том виде, в котором он принят из соединения
+
+    Файл начинается с признака magic. Каждый принятый фрагмент записывается с заголовком: время приема в наносекундах (time_ns) и длина фрагмента.
+    Запись воспроизводится QuikPy.replay_callbacks через тот же разбор и вызов обработчиков
+    """
+    magic = b'QUIKCAP1'  # Признак файла записи
+    header = Struct('<qI')  # Заголовок фрагмента: время приема в наносекундах, длина в байтах
+
+    def __init__(self, path):
+        """Инициализация
+
+        :param str path: Файл записи. Если существует, то перезаписывается
+        """
+        self.path = path  # Файл записи
+        self.file = open(path, 'wb', buffering=1048576)  # Пишем через буфер, чтобы запись не задерживала прием
+        self.file.write(self.magic)
+        self.lock = Lock()  # Блокировка записи. Пишет поток приема, закрывает другой поток
+        self.frames = 0  # Кол-во записанных фрагментов
+        self.bytes = 0  # Кол-во записанных байт
+
+    def write(self, chunk, ts=None):
+        """Запись принятого фрагмента
+
+        :param bytes | memoryview chunk: Принятый фрагмент
+        :param int ts: Время приема в наносекундах. None - текущее время
+        """
+        with self.lock:
+            if self.file is None:  # Если запись уже закрыта
+                return  # то фрагмент не записываем
+            self.file.write(self.header.pack(time_ns() if ts is None else ts, len(chunk)))
+            self.file.write(chunk)
+            self.frames += 1
+            self.bytes += len(chunk)
+
+    def close(self):
+        """Завершение записи"""
+        with self.lock:
+            if self.file is not None:  # Если запись еще не закрыта
+                self.file.close()
+                self.file = None
+
+    @classmethod
+    def read(cls, path):
+        """Фрагменты записи по порядку
+
+        :param str path: Файл записи
+        :return: Генератор пар: время приема в наносекундах, фрагмент
+        """
+        with open(path, 'rb') as f:
+            if f.read(len(cls.magic)) != cls.magic:  # Если в начале файла нет признака записи
+                raise ValueError(f'{path} не является записью функций обратного вызова')
+            while True:
+                header = f.read(cls.header.size)  # Заголовок фрагмента
+                if len(header) < cls.header.size:  # Если заголовок не записан полностью (конец файла или прерванная запись)
+                    return  # то фрагментов больше нет
+                ts, size = cls.header.unpack(header)
+                chunk = f.read(size)  # Фрагмент
+                if len(chunk) < size:  # Если фрагмент не записан полностью
+                    return  # то фрагментов больше нет
+                yield ts, chunk
+
+
+class SymbolSpecStore:
+    """Справочник спецификаций тикеров и стоимостей шага цены
+
+    Спецификации (getSecurityInfo) за день не меняются, поэтому считаются актуальными до конца дня (по московскому времени), в который получены.
+    Лот, шаг цены, кол-во знаков могут смениться между днями: спецификация, полученная в прошлый день, считается отсутствующей и получается снова.
+    Стоимость шага цены (STEPPRICE) фьючерсов меняется с курсом валюты, поэтому считается актуальной step_price_ttl секунд. Один справочник можно передать нескольким подключениям QuikPy
+    и сохранять в файл, чтобы после перезапуска он был заполнен сразу
+    """
+    logger = logging.getLogger('QuikPy.SymbolSpecStore')  # Будем вести лог
+    tz_msk = timezone('Europe/Moscow')  # День спецификации считаем по московскому времени
+
+    def __init__(self, path=None, step_price_ttl=3600):
+        """Инициализация
+
+        :param str path: Файл JSON, из которого справочник загружается и в который сохраняется. None - справочник только в памяти
+        :param float step_price_ttl: Сколько секунд стоимость шага цены считается актуальной
+        """
+        self.path = path  # Файл справочника
+        self.step_price_ttl = step_price_ttl  # Время актуальности стоимости шага цены в секундах
+        self.specs = {}  # Спецификации. (Код режима торгов, тикер) -> спецификация
+        self.spec_days = {}  # Дни получения спецификаций. (Код режима торгов, тикер) -> дата ISO по московскому времени
+        self.step_prices = {}  # Стоимости шага цены. (Код режима торгов, тикер) -> (стоимость шага цены, время получения)
+        self.lock = Lock()  # Блокировка справочника. Его заполняют и читают разные потоки
+        self.changed = False  # Справочник изменился после загрузки/сохранения
+        if self.path:  # Если задан файл справочника
+            self.load()  # то загружаем справочник из него
+
+    def load(self):
+        """Загрузка справочника из файла. Записи из файла не заменяют уже полученные из QUIK"""
+        try:  # Файла может не быть, или он может быть поврежден
+            with open(self.path, encoding='utf-8') as f:
+                data = load(f)
+            specs = {tuple(key.split('|', 1)): spec for key, spec in data.get('specs', {}).items()}
+            spec_days = {tuple(key.split('|', 1)): str(day) for key, day in data.get('spec_days', {}).items()}  # В файлах без дней спецификации будут получены снова
+            step_prices = {tuple(key.split('|', 1)): (float(value), float(ts)) for key, (value, ts) in data.get('step_prices', {}).items()}
+        except FileNotFoundError:  # Если файла нет
+            return  # то справочник заполнится из QUIK
+        except (OSError, ValueError, TypeError, AttributeError) as e:  # Если файл не удалось прочитать или разобрать
+            self.logger.warning(f'Справочник тикеров {self.path} не загружен: {e}')
+            return
+        with self.lock:
+            self.specs = {**specs, **self.specs}
+            self.spec_days = {**spec_days, **self.spec_days}
+            self.step_prices = {**step_prices, **self.step_prices}
+        self.logger.debug(f'Загружено спецификаций: {len(specs)}, стоимостей шага цены: {len(step_prices)}')
+
+    def save(self):
+        """Сохранение справочника в файл, если он изменился"""
+        if not self.path or not self.changed:  # Если файл не задан, или справочник не изменился
+            return  # то сохранять нечего
+        with self.lock:
+            data = {'specs': {f'{class_code}|{sec_code}': spec for (class_code, sec_code), spec in self.specs.items()},
+                    'spec_days': {f'{class_code}|{sec_code}': day for (class_code, sec_code), day in self.spec_days.items()},
+                    'step_prices': {f'{class_code}|{sec_code}': list(value) for (class_code, sec_code), value in self.step_prices.items()}}
+            self.changed = False
+        tmp_path = f'{self.path}.tmp'  # Пишем во временный файл, затем заменяем им файл справочника. Прерванная запись не испортит справочник
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                dump(data, f, ensure_ascii=False)
+            replace(tmp_path, self.path)
+        except OSError as e:  # Если записать файл не удалось
+            self.changed = True  # то попробуем в следующий раз
+            self.logger.warning(f'Справочник тикеров {self.path} не сохранен: {e}')
+
+    @staticmethod
+    def today():
+        """Текущий день по московскому времени в виде даты ISO"""
+        return datetime.now(SymbolSpecStore.tz_msk).date().isoformat()
+
+    def get_spec(self, class_code, sec_code):
+        """Спецификация тикера или None, если ее нет в справочнике или она получена в прошлый день"""
+        key = (class_code, sec_code)
+        if self.spec_days.get(key) != self.today():  # Если спецификация не получена сегодня
+            return None  # то она могла измениться
+        return self.specs.get(key)
+
+    def put_spec(self, class_code, sec_code, spec):
+        """Занесение спецификации тикера в справочник"""
+        with self.lock:
+            self.specs[(class_code, sec_code)] = spec
+            self.spec_days[(class_code, sec_code)] = self.today()
+            self.changed = True
+
+    def get_step_price(self, class_code, sec_code):
+        """Стоимость шага цены из справочника
+
+        :return: Стоимость шага цены или None, если ее нет в справочнике. Признак актуальности
+        """
+        value = self.step_prices.get((class_code, sec_code))
+        if value is None:  # Если стоимости шага цены нет в справочнике
+            return None, False
+        step_price, ts = value
+        return step_price, time() - ts < self.step_price_ttl
+
+    def put_step_price(self, class_code, sec_code, step_price):
+        """Занесение стоимости шага цены в справочник"""
+        with self.lock:
+            self.step_prices[(class_code, sec_code)] = (step_price, time())
+            self.changed = True
 
 
 class QuikPy:
@@ -18,14 +265,49 @@ class QuikPy:
     currency = 'SUR'  # Суммы будем получать в рублях
     limit_kind = 1  # Основной режим торгов T1
     futures_firm_id = 'SPBFUT'  # Код фирмы для срочного рынка. Если ваш брокер поставил другую фирму для срочного рынка, то измените ее
+    request_timeout = 60  # Время ожидания ответа на запрос в режиме мультиплексирования в секундах. Потерянный или неразобранный ответ не должен блокировать запрос навсегда. None - без ограничения
     logger = logging.getLogger('QuikPy')  # Будем вести лог
-
-    def __init__(self, host='127.0.0.1', requests_port=34130, callbacks_port=34131):
+    callback_handlers = {  # Функция обратного вызова QUIK LUA / QUIK# -> название обработчика
+        'OnFirm': 'on_firm',  # 1. Новая фирма
+        'OnAllTrade': 'on_all_trade',  # 2. Получение обезличенной сделки
+        'OnTrade': 'on_trade',  # 3. Получение новой / изменение существующей сделки
+        'OnOrder': 'on_order',  # 4. Получение новой / изменение существующей заявки
+        'OnAccountBalance': 'on_account_balance',  # 5. Изменение позиций по счету
+        'OnFuturesLimitChange': 'on_futures_limit_change',  # 6. Изменение ограничений по срочному рынку
+        'OnFuturesLimitDelete': 'on_futures_limit_delete',  # 7. Удаление ограничений по срочному рынку
+        'OnFuturesClientHolding': 'on_futures_client_holding',  # 8. Изменение позиции по срочному рынку
+        'OnMoneyLimit': 'on_money_limit',  # 9. Изменение денежной позиции
+        'OnMoneyLimitDelete': 'on_money_limit_delete',  # 10. Удаление денежной позиции
+        'OnDepoLimit': 'on_depo_limit',  # 11. Изменение позиций по инструментам
+        'OnDepoLimitDelete': 'on_depo_limit_delete',  # 12. Удаление позиции по инструментам
+        'OnAccountPosition': 'on_account_position',  # 13. Изменение денежных средств
+        # on_neg_deal - 14. Получение новой / изменение существующей внебиржевой заявки
+        # on_neg_trade - 15. Получение новой / изменение существующей сделки для исполнения
+        'OnStopOrder': 'on_stop_order',  # 16. Получение новой / изменение существующей стоп заявки
+        'OnTransReply': 'on_trans_reply',  # 17. Ответ на транзакцию пользователя
+        'OnParam': 'on_param',  # 18. Изменение текущих параметров
+        'OnQuote': 'on_quote',  # 19. Изменение стакана котировок
+        'OnDisconnected': 'on_disconnected',  # 20. Отключение терминала от сервера QUIK
+        'OnConnected': 'connected_handler',  # 21. Соединение терминала с сервером QUIK. Сначала возобновляем подписки, затем вызываем on_connected
+        # on_clean_up - 22. Смена сервера QUIK / Пользователя / Сессии
+        'OnClose': 'on_close',  # 23. Закрытие терминала QUIK
+        'OnStop': 'on_stop',  # 24. Остановка LUA скрипта в терминале QUIK / закрытие терминала QUIK
+        'OnInit': 'on_init',  # 25. Запуск LUA скрипта в терминале QUIK
+        'NewCandle': 'on_new_candle',  # QUIK#. Получение новой свечки
+        'lua_error': 'on_error',  # QUIK#. Получено сообщение об ошибке
+    }
+    coalesce_flush = object()  # Признак в очереди функций обратного вызова: вызвать обработчики объединенных функций
+
+    def __init__(self, host='127.0.0.1', requests_port=34130, callbacks_port=34131, multiplex=False, callbacks=True, callback_queue_size=0, symbols_store=None):
         """Инициализация
 
         :param str host: IP адрес или название хоста
         :param int requests_port: Порт для отправки запросов и получения ответов
         :param int callbacks_port: Порт для функций обратного вызова
+        :param bool multiplex: Мультиплексирование запросов. Несколько запросов одновременно ожидают ответа, ответы сопоставляются по коду запроса id
+        :param bool callbacks: Получать функции обратного вызова. False - только запросы, открывается одно соединение
+        :param int callback_queue_size: Размер очереди функций обратного вызова. 0 - обработчики вызываются в потоке приема. Больше 0 - в отдельном потоке, прием и разбор не ждут обработчиков, пока очередь не заполнится
+        :param SymbolSpecStore symbols_store: Справочник тикеров. Передайте один справочник всем подключениям, чтобы он не заполнялся заново. None - новый справочник в памяти
         """
         # 2.2 Функции обратного вызова
         self.on_firm = self.default_handler  # 2.2.1 Новая фирма
@@ -62,31 +344,101 @@ class QuikPy:
         self.host = host  # IP адрес или название хоста
         self.requests_port = requests_port  # Порт для отправки запросов и получения ответов
         self.callbacks_port = callbacks_port  # Порт для функций обратного вызова
+        self.callback_exit_event = Event()  # Определяем событие выхода из потока. Оно же признак закрытия соединений
+        self.socket_callbacks = None  # Соединение для функций обратного вызова
+        self.callback_thread = None  # Поток обработки функций обратного вызова
+        self.callback_queue = Queue(callback_queue_size) if callback_queue_size > 0 else None  # Очередь между потоками приема и обработки функций обратного вызова
+        self.callback_worker_thread = None  # Поток вызова обработчиков из очереди
+        self.callback_stats = {}  # Статистика по функциям обратного вызова. Функция -> [кол-во, суммарное время обработчика, максимальное время обработчика]
+        self.dispatch_lock = RLock()  # Блокировка вызова обработчиков. Обработчики и статистика не вызываются/обновляются из нескольких потоков одновременно. Повторная, т.к. обработчик может вызвать flush_callbacks
+        self.callback_queue_max = 0  # Наибольшая длина очереди функций обратного вызова
+        self.callback_queue_full = 0  # Сколько раз поток приема ждал места в заполненной очереди
+        self.coalesce_cmds = frozenset()  # Функции обратного вызова, которые объединяются по инструменту. Пусто - не объединяются
+        self.coalesce_interval = None  # Период вызова обработчиков объединенных функций в секундах. None - как только обработчики освободятся
+        self.coalesced = {}  # Последние необработанные функции обратного вызова. (Функция, код режима торгов, тикер) -> функция обратного вызова
+        self.coalesce_lock = Lock()  # Блокировка объединенных функций обратного вызова
+        self.coalesce_flush_queued = False  # Признак вызова обработчиков объединенных функций уже стоит в очереди
+        self.coalesce_stats = {}  # Статистика объединения. Функция -> [кол-во принятых, кол-во объединенных]
+        self.coalesce_thread = None  # Поток периодического вызова обработчиков объединенных функций
+        self.requests_thread = None  # Поток приема ответов на запросы в режиме мультиплексирования
+        self.callback_capture = None  # Запись принимаемых функций обратного вызова. None - не пишется. Задаем до подключения: при ошибке подключения close_connection_and_thread вызывается из __del__
         self.socket_requests = socket(AF_INET, SOCK_STREAM)  # Создаем соединение для запросов
         self.socket_requests.connect((self.host, self.requests_port))  # Открываем соединение для запросов
-
-        self.callback_exit_event = Event()  # Определяем событие выхода из потока
-        self.callback_thread = Thread(target=self.callback_handler, name='CallbackThread').start()  # Создаем и запускаем поток обработки функций обратного вызова
-        self.lock = Lock()  # Блокировка process_request для многопоточных приложений
-
-        self.accounts = list()  # Счета
-        money_limits = self.get_money_limits()['data']  # Все денежные лимиты (остатки на счетах)
-        i = 0  # Начальный номер счета
-        for account in self.get_trade_accounts()['data']:  # Пробегаемся по всем торговым счетам
-            firm_id = account['firmid']  # Фирма
-            client_code = next((moneyLimit['client_code'] for moneyLimit in money_limits if moneyLimit['firmid'] == firm_id), '')  # Код клиента
-            class_codes: list[str] = account['class_codes'][1:-1].split('|')  # Список режимов торгов счета. Убираем первую и последнюю вертикальную черту, разбиваем по вертикальной черте
-            self.accounts.append(dict(  # Добавляем торговый счет
-                account_id=i, client_code=client_code, firm_id=firm_id, trade_account_id=account['trdaccid'],  # Номер счета / Код клиента / Фирма / Счет
-                class_codes=class_codes, futures=(firm_id == self.futures_firm_id)))  # Режимы торгов / Счет срочного рынка
-            i += 1  # Смещаем на следующий номер счета
+        self.requests_codec = JsonLineCodec(self.buffer_size)  # Разбор ответов на запросы
+        self.callbacks_codec = JsonLineCodec(self.buffer_size)  # Разбор функций обратного вызова
+
+        if callbacks:  # Если нужно получать функции обратного вызова
+            self.socket_callbacks = socket(AF_INET, SOCK_STREAM)  # Создаем соединение для функций обратного вызова
+            self.socket_callbacks.connect((self.host, self.callbacks_port))  # Открываем соединение до запуска потока, чтобы ошибка подключения была видна сразу
+            self.callback_thread = Thread(target=self.callback_handler, name='CallbackThread', daemon=True)  # Создаем поток обработки функций обратного вызова
+            self.callback_thread.start()  # Запускаем поток обработки функций обратного вызова
+            if self.callback_queue is not None:  # Если обработчики вызываются через очередь
+                self.callback_worker_thread = Thread(target=self.callback_worker, name='CallbackWorkerThread', daemon=True)  # то создаем поток вызова обработчиков
+                self.callback_worker_thread.start()  # Запускаем поток вызова обработчиков
+        self.lock = Lock()  # Блокировка process_request для многопоточных приложений. В режиме мультиплексирования блокируется только отправка запроса
+
+        self.multiplex = multiplex  # Мультиплексирование запросов
+        self.request_ids = count(1)  # Коды запросов, по которым ответы сопоставляются с ожидающими их запросами
+        self.pending_requests = {}  # Запросы, ожидающие ответа. Код запроса -> (Future, код транзакции пользователя)
+        self.pending_lock = Lock()  # Блокировка списка запросов, ожидающих ответа
+        if self.multiplex:  # Если запросы мультиплексируются
+            self.requests_thread = Thread(target=self.requests_handler, name='RequestsThread', daemon=True)  # то ответы на запросы будет принимать отдельный поток
+            self.requests_thread.start()  # Запускаем поток приема ответов на запросы
+
+        self._accounts = None  # Счета. Получаем из QUIK при первом обращении к accounts
+        self._accounts_by_firm_id = None  # Счета по коду фирмы
+        self.accounts_lock = RLock()  # Блокировка получения счетов из нескольких потоков. Повторная, т.к. свойства счетов вызывают refresh_accounts под ней
         self.subscriptions = []  # Список подписок. Для возобновления всех подписок после повторного подключения к серверу QUIK
-        self.symbols = {}  # Справочник тикеров
+        self.symbols_store = symbols_store if symbols_store is not None else SymbolSpecStore()  # Справочник тикеров
+        self.step_price_requests = set()  # Тикеры, стоимость шага цены которых обновляется в фоне
+        self.step_price_lock = Lock()  # Блокировка тикеров, стоимость шага цены которых обновляется в фоне. Их отмечают вызывающие потоки, снимает поток приема ответов
 
     def __enter__(self):
         """Вход в класс, например, с with"""
         return self
 
+    # Счета
+
+    @property
+    def accounts(self) -> list[dict]:
+        """Торговые счета. Получаются из QUIK при первом обращении и запоминаются. Для обновления вызовите refresh_accounts"""
+        if self._accounts is None:  # Если счета еще не получали
+            with self.accounts_lock:  # то ждем, пока их получает другой поток
+                if self._accounts is None:  # Если их так никто и не получил
+                    self.refresh_accounts()  # то получаем их из QUIK
+        return self._accounts
+
+    @property
+    def accounts_by_firm_id(self) -> dict[str, list[dict]]:
+        """Торговые счета по коду фирмы"""
+        if self._accounts_by_firm_id is None:  # Если счета еще не получали
+            with self.accounts_lock:  # то ждем, пока их получает другой поток
+                if self._accounts_by_firm_id is None:  # Если их так никто и не получил
+                    self.refresh_accounts()  # то получаем их из QUIK
+        return self._accounts_by_firm_id
+
+    def refresh_accounts(self) -> list[dict]:
+        """Получение торговых счетов из QUIK
+
+        :return: Торговые счета
+        """
+        with self.accounts_lock:  # Счета из нескольких потоков получаем один раз
+            client_codes = {}  # Код клиента по коду фирмы
+            for money_limit in self.get_money_limits()['data']:  # Пробегаемся по всем денежным лимитам (остаткам на счетах)
+                client_codes.setdefault(money_limit['firmid'], money_limit['client_code'])  # Для фирмы берем код клиента из первого лимита
+            accounts = []  # Счета
+            accounts_by_firm_id = {}  # Счета по коду фирмы
+            for i, account in enumerate(self.get_trade_accounts()['data']):  # Пробегаемся по всем торговым счетам. Номера счетов начинаем с 0
+                firm_id = account['firmid']  # Фирма
+                class_codes: list[str] = account['class_codes'][1:-1].split('|')  # Список режимов торгов счета. Убираем первую и последнюю вертикальную черту, разбиваем по вертикальной черте
+                account = dict(  # Торговый счет
+                    account_id=i, client_code=client_codes.get(firm_id, ''), firm_id=firm_id, trade_account_id=account['trdaccid'],  # Номер счета / Код клиента / Фирма / Счет
+                    class_codes=class_codes, futures=(firm_id == self.futures_firm_id))  # Режимы торгов / Счет срочного рынка
+                accounts.append(account)  # Добавляем торговый счет
+                accounts_by_firm_id.setdefault(firm_id, []).append(account)  # Добавляем торговый счет фирмы
+            self._accounts, self._accounts_by_firm_id = accounts, accounts_by_firm_id  # Запоминаем счета
+        return accounts
+
     # Фукнции отладки QUIK#
 
     def ping(self, trans_id=0):
@@ -646,11 +998,28 @@ class QuikPy:
     def get_param_ex2_bulk(self, class_sec_codes_params, trans_id=0):  # QUIK#
         """Таблица текущих торгов по инструментам с возможностью отказа от получения
 
-        :param set[str] class_sec_codes_params: Список кодов режимов торгов, тикеров, параметров. Например: {'TQBR|SBER|SEC_SCALE', 'SPBFUT|CNYRUBF|SEC_PRICE_STEP'}
+        :param list[str] | set[str] class_sec_codes_params: Список кодов режимов торгов, тикеров, параметров. Например: ['TQBR|SBER|SEC_SCALE', 'SPBFUT|CNYRUBF|SEC_PRICE_STEP']
         :param int trans_id: Код транзакции
+        :return: Значения параметров в порядке списка. Чтобы сопоставить значения с параметрами, передавайте список, а не множество
         """
         return self.process_request({'data': class_sec_codes_params, 'id': trans_id, 'cmd': 'getParamEx2Bulk', 't': ''})
 
+    def get_param_ex2_pipelined(self, class_sec_codes_params):  # QUIK#
+        """Таблица текущих торгов по инструментам. Все запросы отправляются сразу, ответы ожидаются вместе (мультиплексирование)
+
+        :param list[tuple[str, str, str]] class_sec_codes_params: Список кодов режимов торгов, тикеров, параметров. Например: [('TQBR', 'SBER', 'LAST'), ('SPBFUT', 'SiZ5', 'BID')]
+        :return: Список ответов в порядке запросов. Вместо ответа, который не удалось получить, возвращается исключение
+        """
+        futures = [self.send_request({'data': f'{class_code}|{sec_code}|{param_name}', 'id': 0, 'cmd': 'getParamEx2', 't': ''})
+                   for class_code, sec_code, param_name in class_sec_codes_params]  # Отправляем все запросы, не дожидаясь ответов
+        results = []  # Ответы
+        for future in futures:  # Пробегаемся по всем отправленным запросам
+            try:  # Ответ может не прийти
+                results.append(self.wait_response(future))  # Ждем ответ
+            except Exception as e:  # Если ответ не пришел (истекло время ожидания, разрыв соединения)
+                results.append(e)  # то вместо ответа возвращаем исключение
+        return results
+
     # 3.13 Функции для получения параметров таблицы "Клиентский портфель"
 
     def get_portfolio_info(self, firm_id, client_code, trans_id=0):  # 3.13.1 Функция предназначена для получения значений параметров таблицы Клиентский портфель, соответствующих идентификатору участника торгов firmid, коду клиента client_code и сроку расчетов limit_kind со значением 0
@@ -831,22 +1200,85 @@ class QuikPy:
         :param dict request: Запрос в виде словаря
         :returns: Ответ JSON
         """
-        self.lock.acquire()  # Ставим блокировку. Если во время выполнения process_request к нему будет обращение из другого потока, то будем здесь ожидать, пока блокировка не будет снята
-        raw_data = f'{request}\r\n'.replace("'", '"').encode('cp1251')  # Переводим: словарь -> строка, одинарные кавычки -> двойные, кодировка UTF8 -> Windows 1251
-        self.socket_requests.sendall(raw_data)  # Отправляем запрос в QUIK
-        fragments = []  # Гораздо быстрее получать ответ в виде списка фрагментов
-        while True:  # Пока фрагменты есть в буфере
-            fragment = self.socket_requests.recv(self.buffer_size)  # Читаем фрагмент из буфера
-            fragments.append(fragment.decode('cp1251'))  # Переводим фрагмент в Windows кодировку 1251, добавляем в список
-            if len(fragment) < self.buffer_size:  # Если в принятом фрагменте данных меньше чем размер буфера
-                data = ''.join(fragments)  # Собираем список фрагментов в строку
-                try:  # Бывает ситуация, когда данных приходит меньше, но это еще не конец данных
-                    result = loads(data)  # Пробуем перевести ответ в формат JSON в кодировке Windows 1251
-                    # self.logger.debug(f'process_request: Запрос: {raw_data} Ответ: {result}')  # Для отладки
-                    self.lock.release()  # Снимаем блокировку с process_request
-                    return result
-                except JSONDecodeError:  # Если это еще не конец данных
-                    pass  # то ждем фрагментов в буфере дальше
+        if self.multiplex:  # Если запросы мультиплексируются
+            return self.wait_response(self.send_request(request))  # то отправляем запрос и ждем, пока поток приема ответов не получит ответ на него
+        with self.lock:  # Ставим блокировку. Если во время выполнения process_request к нему будет обращение из другого потока, то будем здесь ожидать, пока блокировка не будет снята
+            self.socket_requests.sendall(JsonLineCodec.encode(request))  # Отправляем запрос в QUIK
+            while True:  # Пока ответ не принят полностью
+                results = self.requests_codec.recv(self.socket_requests)  # Читаем фрагмент из буфера, разбираем полностью принятые ответы
+                if results:  # Если ответ принят полностью
+                    if len(results) > 1:  # Если пришло больше одного ответа
+                        self.logger.warning(f'process_request: Лишние ответы на запрос {request["cmd"]}: {results[1:]}')
+                    # self.logger.debug(f'process_request: Запрос: {request} Ответ: {results[0]}')  # Для отладки
+                    return results[0]
+
+    def send_request(self, request) -> Future:
+        """Отправка запроса в виде словаря без ожидания ответа
+
+        :param dict request: Запрос в виде словаря
+        :returns: Future, в который будет записан ответ JSON. Без мультиплексирования запрос выполняется сразу, Future возвращается уже с ответом
+        """
+        future = Future()  # Ответ на запрос
+        if not self.multiplex:  # Если запросы не мультиплексируются
+            try:  # Запрос может завершиться ошибкой
+                future.set_result(self.process_request(request))  # то выполняем запрос с ожиданием ответа
+            except Exception as e:  # Если запрос завершился ошибкой
+                future.set_exception(e)  # то передаем ее в ответ
+            return future
+        request_id = next(self.request_ids)  # Уникальный код запроса. Код транзакции пользователя в запросе может повторяться
+        future.request_id = request_id  # По коду запроса wait_response снимает его с ожидания, если ответ не пришел
+        with self.pending_lock:  # Регистрируем запрос до отправки, т.к. ответ может прийти раньше, чем закончится отправка
+            self.pending_requests[request_id] = (future, request['id'])  # Запрос ожидает ответа
+        raw_data = JsonLineCodec.encode(dict(request, id=request_id))  # Переводим запрос с уникальным кодом в сообщение QUIK#
+        try:  # Соединение может быть закрыто
+            with self.lock:  # Запросы из разных потоков не должны перемешиваться при отправке
+                self.socket_requests.sendall(raw_data)  # Отправляем запрос в QUIK
+        except OSError as e:  # Если отправить запрос не удалось
+            with self.pending_lock:  # то запрос больше не ожидает ответа
+                self.pending_requests.pop(request_id, None)
+            future.set_exception(e)  # Передаем ошибку в ответ
+        return future
+
+    def wait_response(self, future):
+        """Ожидание ответа на запрос, отправленный send_request, не дольше request_timeout секунд
+
+        :param Future future: Ответ на запрос
+        :return: Ответ JSON. Если ответ не пришел, то запрос снимается с ожидания, и возникает TimeoutError
+        """
+        try:
+            return future.result(self.request_timeout)
+        except FutureTimeoutError:  # Если ответ не пришел
+            with self.pending_lock:  # то запрос больше не ожидает ответа. Опоздавший ответ будет пропущен как ответ на неизвестный запрос
+                self.pending_requests.pop(getattr(future, 'request_id', None), None)
+            raise
+
+    def requests_handler(self):
+        """Поток приема ответов на запросы в режиме мультиплексирования"""
+        while True:  # Пока соединение для запросов открыто
+            try:  # Соединение может быть закрыто
+                results = self.requests_codec.recv(self.socket_requests)  # Читаем фрагмент из буфера, разбираем полностью принятые ответы
+            except OSError:  # Если соединение закрыто
+                self.fail_pending_requests(ConnectionError('Соединение для запросов QUIK закрыто'))  # то ответов на ожидающие запросы не будет
+                return  # Выходим, дальше не продолжаем
+            for result in results:  # Пробегаемся по всем полностью пришедшим ответам
+                with self.pending_lock:  # Ищем запрос, ожидающий этот ответ
+                    pending = self.pending_requests.pop(result.get('id'), None)
+                if pending is None:  # Если запрос не найден
+                    self.logger.warning(f'requests_handler: Пришел ответ на неизвестный запрос {result.get("id")}')
+                    continue  # то переходим к следующему ответу
+                future, trans_id = pending  # Ответ на запрос, код транзакции пользователя
+                result['id'] = trans_id  # Возвращаем в ответ код транзакции пользователя
+                future.set_result(result)  # Передаем ответ ожидающему его запросу
+
+    def fail_pending_requests(self, exception):
+        """Завершение всех запросов, ожидающих ответа, с ошибкой
+
+        :param Exception exception: Ошибка
+        """
+        with self.pending_lock:  # Забираем все запросы, ожидающие ответа
+            pending, self.pending_requests = self.pending_requests, {}
+        for future, _ in pending.values():  # Пробегаемся по всем запросам
+            future.set_exception(exception)  # Завершаем запрос с ошибкой
 
     # Подписки (функции обратного вызова)
 
@@ -855,96 +1287,238 @@ class QuikPy:
         pass
 
     def callback_handler(self):
-        """Поток обработки результатов функций обратного вызова"""
-        callbacks = socket(AF_INET, SOCK_STREAM)  # Соединение для функций обратного вызова
-        callbacks.connect((self.host, self.callbacks_port))  # Открываем соединение для функций обратного вызова
-        fragments = []  # Будем получать ответ в виде списка фрагментов. Они могут быть разной длины. Ответ может состоять из нескольких фрагментов
+        """Поток приема и разбора функций обратного вызова"""
+        callbacks = self.socket_callbacks  # Соединение для функций обратного вызова
+        codec = self.callbacks_codec  # Разбор функций обратного вызова
         while True:  # Пока поток нужен
-            while True:  # Пока есть что-то в буфере ответов
-                if self.callback_exit_event.is_set():  # Если установлено событие выхода из потока
-                    callbacks.close()  # то закрываем соединение для функций обратного вызова
-                    return  # Выходим, дальше не продолжаем
-                fragment = callbacks.recv(self.buffer_size)  # Читаем фрагмент из буфера
-                fragments.append(fragment.decode('cp1251'))  # Переводим фрагмент в Windows кодировку 1251, добавляем в список
-                if len(fragment) < self.buffer_size:  # Если в принятом фрагменте данных меньше чем размер буфера
-                    break  # то, возможно, это был последний фрагмент, выходим из чтения буфера
-            data = ''.join(fragments)  # Собираем список фрагментов в строку
-            data_list = data.split('\n')  # Одновременно могут прийти несколько функций обратного вызова, разбираем их по одной
-            fragments = []  # Сбрасываем фрагменты. Если последнюю строку не сможем разобрать, то занесем ее сюда
-            for data in data_list:  # Пробегаемся по всем функциям обратного вызова
-                if data == '':  # Если функция обратного вызова пустая
-                    continue  # то ее не разбираем, переходим на следующую функцию, дальше не продолжаем
-                try:  # Пробуем разобрать функцию обратного вызова
-                    data = loads(data)  # Возвращаем полученный ответ в формате JSON
-                except JSONDecodeError:  # Если разобрать не смогли (пришла не вся строка)
-                    fragments.append(data)  # то, что не разобрали ставим в список фрагментов
-                    break  # т.к. неполной может быть только последняя строка, то выходим из разбора функций обратного вызова
-                # self.logger.debug(f'callback_handler: Пришли данные подписки {data["cmd"]} {data}')  # Для отладки
-                # Разбираем функцию обратного вызова QUIK LUA
-                if data['cmd'] == 'OnFirm':  # 1. Новая фирма
-                    self.on_firm(data)
-                elif data['cmd'] == 'OnAllTrade':  # 2. Получение обезличенной сделки
-                    self.on_all_trade(data)
-                elif data['cmd'] == 'OnTrade':  # 3. Получение новой / изменение существующей сделки
-                    self.on_trade(data)
-                elif data['cmd'] == 'OnOrder':  # 4. Получение новой / изменение существующей заявки
-                    self.on_order(data)
-                elif data['cmd'] == 'OnAccountBalance':  # 5. Изменение позиций по счету
-                    self.on_account_balance(data)
-                elif data['cmd'] == 'OnFuturesLimitChange':  # 6. Изменение ограничений по срочному рынку
-                    self.on_futures_limit_change(data)
-                elif data['cmd'] == 'OnFuturesLimitDelete':  # 7. Удаление ограничений по срочному рынку
-                    self.on_futures_limit_delete(data)
-                elif data['cmd'] == 'OnFuturesClientHolding':  # 8. Изменение позиции по срочному рынку
-                    self.on_futures_client_holding(data)
-                elif data['cmd'] == 'OnMoneyLimit':  # 9. Изменение денежной позиции
-                    self.on_money_limit(data)
-                elif data['cmd'] == 'OnMoneyLimitDelete':  # 10. Удаление денежной позиции
-                    self.on_money_limit_delete(data)
-                elif data['cmd'] == 'OnDepoLimit':  # 11. Изменение позиций по инструментам
-                    self.on_depo_limit(data)
-                elif data['cmd'] == 'OnDepoLimitDelete':  # 12. Удаление позиции по инструментам
-                    self.on_depo_limit_delete(data)
-                elif data['cmd'] == 'OnAccountPosition':  # 13. Изменение денежных средств
-                    self.on_account_position(data)
-                # on_neg_deal - 14. Получение новой / изменение существующей внебиржевой заявки
-                # on_neg_trade - 15. Получение новой / изменение существующей сделки для исполнения
-                elif data['cmd'] == 'OnStopOrder':  # 16. Получение новой / изменение существующей стоп заявки
-                    self.on_stop_order(data)
-                elif data['cmd'] == 'OnTransReply':  # 17. Ответ на транзакцию пользователя
-                    self.on_trans_reply(data)
-                elif data['cmd'] == 'OnParam':  # 18. Изменение текущих параметров
-                    self.on_param(data)
-                elif data['cmd'] == 'OnQuote':  # 19. Изменение стакана котировок
-                    self.on_quote(data)
-                elif data['cmd'] == 'OnDisconnected':  # 20. Отключение терминала от сервера QUIK
-                    self.on_disconnected(data)
-                elif data['cmd'] == 'OnConnected':  # 21. Соединение терминала с сервером QUIK
-                    for subscription in self.subscriptions:  # Пробегаемся по всем подпискам
-                        class_code = subscription['class_code']  # Код режима торгов
-                        sec_code = subscription['sec_code']  # Тикер
-                        if subscription['subscription'] == 'quotes' and not self.is_subscribed_level2_quotes(class_code, sec_code)['data']:  # Если подписка на стакан и ее нет в QUIK
-                            self.subscribe_level2_quotes(class_code, sec_code)  # то переподписываемся на стакан
-                            self.logger.debug(f'Повторная подписка на стакан: {class_code}.{sec_code}')
-                        elif subscription['subscription'] == 'candles':  # Если подписка на свечки
-                            interval = subscription['interval']  # Кол-во в минутах
-                            param = subscription['param']  # Необязательный параметр
-                            if not self.is_subscribed(class_code, sec_code, interval, param)['data']:  # и ее нет в QUIK'
-                                self.subscribe_to_candles(class_code, sec_code, interval, param)  # то подписываемся на свечки
-                                self.logger.debug(f'Повторная подписка на бары: {class_code}.{sec_code} {interval} {param}')
-                    self.on_connected(data)
-                # on_clean_up - 22. Смена сервера QUIK / Пользователя / Сессии
-                elif data['cmd'] == 'OnClose':  # 23. Закрытие терминала QUIK
-                    self.on_close(data)
-                elif data['cmd'] == 'OnStop':  # 24. Остановка LUA скрипта в терминале QUIK / закрытие терминала QUIK
-                    self.on_stop(data)
-                elif data['cmd'] == 'OnInit':  # 25. Запуск LUA скрипта в терминале QUIK
-                    self.on_init(data)
-                # Разбираем функции обратного вызова QUIK#
-                elif data['cmd'] == 'NewCandle':  # Получение новой свечки
-                    self.on_new_candle(data)
-                elif data['cmd'] == 'lua_error':  # Получено сообщение об ошибке
-                    self.on_error(data)
+            if self.callback_exit_event.is_set():  # Если установлено событие выхода из потока
+                return  # то выходим, дальше не продолжаем. Соединение закрывает close_connection_and_thread
+            try:  # Соединение может быть закрыто
+                data_list = codec.recv(callbacks)  # Читаем фрагмент из буфера. Одновременно могут прийти несколько функций обратного вызова, разбираем полностью пришедшие
+            except OSError:  # Если соединение закрыто
+                return  # Выходим, дальше не продолжаем
+            self.process_callbacks(data_list)  # Обрабатываем принятые функции обратного вызова
+
+    def process_callbacks(self, data_list):
+        """Обработка разобранных функций обратного вызова: объединение, вызов обработчиков или передача в очередь
+
+        :param list[dict] data_list: Функции обратного вызова в формате JSON
+        """
+        for data in data_list:  # Пробегаемся по всем функциям обратного вызова
+            # self.logger.debug(f'callback_handler: Пришли данные подписки {data["cmd"]} {data}')  # Для отладки
+            if self.coalesce_callback(data):  # Если функция обратного вызова отложена для объединения
+                continue  # то ее обработчик будет вызван позже, переходим к следующей функции обратного вызова
+            if self.callback_queue is None:  # Если обработчики вызываются в потоке приема
+                self.dispatch_callback(data)  # то сразу вызываем обработчик
+                continue  # Переходим к следующей функции обратного вызова
+            try:  # Очередь может быть заполнена
+                self.callback_queue.put_nowait(data)  # Передаем функцию обратного вызова в поток обработки
+            except Full:  # Если очередь заполнена
+                self.callback_queue_full += 1  # то запоминаем, что обработчики не успевают
+                self.callback_queue.put(data)  # и ждем места в очереди
+            self.callback_queue_max = max(self.callback_queue_max, self.callback_queue.qsize())  # Наибольшая длина очереди
+        if self.coalesced and self.callback_queue is None and self.coalesce_interval is None:  # Если обработчики вызываются в потоке приема без периода
+            self.flush_callbacks()  # то объединенные функции обрабатываем после разбора всех принятых функций
+
+    def start_capture(self, path):
+        """Запись принимаемых функций обратного вызова в файл для воспроизведения replay_callbacks
+
+        :param str path: Файл записи. Если существует, то перезаписывается
+        """
+        self.stop_capture()  # Завершаем предыдущую запись, если она была
+        self.callback_capture = CallbackCapture(path)  # Новая запись
+        self.callbacks_codec.tap = self.callback_capture.write  # Поток приема передает в нее каждый принятый фрагмент
+
+    def stop_capture(self):
+        """Завершение записи функций обратного вызова
+
+        :return: Кол-во записанных фрагментов и байт
+        """
+        capture, self.callback_capture = getattr(self, 'callback_capture', None), None  # Экземпляр может быть создан не полностью
+        if capture is None:  # Если запись не велась
+            return dict(frames=0, bytes=0)
+        self.callbacks_codec.tap = None  # Поток приема больше не передает фрагменты
+        capture.close()  # Закрываем файл записи
+        return dict(frames=capture.frames, bytes=capture.bytes)
+
+    def replay_callbacks(self, path, speed=None) -> dict:
+        """Воспроизведение записи функций обратного вызова через тот же разбор, объединение, очередь и вызов обработчиков, что и при приеме
+
+        :param str path: Файл записи CallbackCapture
+        :param float speed: Скорость воспроизведения. 1 - как при записи, N - в N раз быстрее, None - без пауз
+        :return: Кол-во фрагментов, функций, байт, время воспроизведения, функций в секунду.
+            Задержка обработки фрагмента (от времени по расписанию записи до окончания обработки) в секундах: медиана, 99-й перцентиль, наибольшая
+        """
+        codec = JsonLineCodec(self.buffer_size)  # Отдельный разбор. Прием из соединения не затрагивается
+        frames = messages = size = 0  # Кол-во фрагментов, функций обратного вызова, байт
+        latencies = []  # Задержки обработки фрагментов
+        first_ts = None  # Время приема первого фрагмента записи
+        start = perf_counter()  # Начало воспроизведения
+        for ts, chunk in CallbackCapture.read(path):  # Пробегаемся по всем фрагментам записи
+            if first_ts is None:  # Если это первый фрагмент
+                first_ts = ts  # то от него отсчитываем время остальных
+            due = start + (ts - first_ts) / 1e9 / speed if speed else perf_counter()  # Время обработки фрагмента по расписанию
+            delay = due - perf_counter()
+            if delay > 0:  # Если фрагмент еще рано обрабатывать
+                sleep(delay)  # то ждем
+            data_list = codec.feed(chunk)  # Разбор так же, как при приеме
+            self.process_callbacks(data_list)  # Обработка так же, как при приеме
+            latencies.append(perf_counter() - due)
+            frames += 1
+            messages += len(data_list)
+            size += len(chunk)
+        if self.callback_queue is not None:  # Если обработчики вызываются через очередь
+            while self.callback_queue.qsize():  # то ждем, пока поток обработки разберет очередь
+                sleep(0.001)
+        if self.coalesced and self.coalesce_interval is None:  # Если остались объединенные функции без периода
+            self.flush_callbacks()  # то обрабатываем их
+        elapsed = perf_counter() - start  # Время воспроизведения
+        latencies.sort()
+        result = dict(frames=frames, messages=messages, bytes=size, elapsed=elapsed, rate=messages / elapsed if elapsed else 0.0)
+        if latencies:  # Если фрагменты были
+            result.update(latency_p50=latencies[len(latencies) // 2], latency_p99=latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)], latency_max=latencies[-1])
+        return result
+
+    def callback_worker(self):
+        """Поток вызова обработчиков функций обратного вызова из очереди"""
+        while True:  # Пока поток нужен
+            data = self.callback_queue.get()  # Ждем функцию обратного вызова
+            if data is None:  # Если пришел признак выхода
+                return  # то выходим, дальше не продолжаем
+            if data is self.coalesce_flush:  # Если пришел признак вызова обработчиков объединенных функций
+                self.flush_callbacks()  # то вызываем их
+                continue  # Переходим к следующей функции обратного вызова
+            self.dispatch_callback(data)  # Вызываем обработчик
+
+    def dispatch_callback(self, data):
+        """Вызов обработчика функции обратного вызова по таблице callback_handlers
+
+        :param dict data: Функция обратного вызова в формате JSON
+        """
+        cmd = data.get('cmd')  # Функция обратного вызова
+        handler_name = self.callback_handlers.get(cmd)  # Название обработчика
+        if handler_name is None:  # Если функция обратного вызова неизвестна
+            return  # то ее не обрабатываем
+        with self.dispatch_lock:  # Обработчики объединенных функций может вызывать поток периодического вызова или flush_callbacks из другого потока
+            started = perf_counter()  # Начало работы обработчика
+            try:  # Ошибка в пользовательском обработчике не должна останавливать поток
+                getattr(self, handler_name)(data)  # Обработчик берем при каждом вызове, т.к. его могут заменить в любой момент
+            except Exception:  # Если в обработчике возникла ошибка
+                self.logger.exception(f'dispatch_callback: Ошибка в обработчике {handler_name}')
+            elapsed = perf_counter() - started  # Время работы обработчика
+            stats = self.callback_stats.get(cmd)  # Статистика по функции обратного вызова
+            if stats is None:  # Если функция обратного вызова пришла впервые
+                self.callback_stats[cmd] = [1, elapsed, elapsed]  # то заводим статистику
+            else:  # Если статистика уже есть
+                stats[0] += 1  # Кол-во
+                stats[1] += elapsed  # Суммарное время обработчика
+                if elapsed > stats[2]:  # Если обработчик работал дольше, чем раньше
+                    stats[2] = elapsed  # то запоминаем максимальное время
+
+    def coalesce_callbacks(self, cmds=('OnParam', 'OnQuote'), interval=None):
+        """Объединение функций обратного вызова по инструменту. Пока обработчик не вызван, для каждого инструмента хранится только последняя функция
+
+        Обработчики объединенных функций вызываются после остальных функций. Без очереди (callback_queue_size=0) - после разбора принятого фрагмента,
+        с очередью - когда поток обработки до них дойдет. Если задан период, то не чаще одного раза за период. В любой момент можно вызвать flush_callbacks
+
+        Обработчики никогда не вызываются одновременно. С очередью их вызывает только поток обработки. Без очереди - поток приема, а с периодом
+        и поток периодического вызова. Тогда они вызываются по очереди под блокировкой dispatch_lock, но не всегда из одного и того же потока
+
+        :param tuple[str] cmds: Функции обратного вызова. Их данные должны содержать class_code и sec_code. Пусто - отключить объединение
+        :param float interval: Период вызова обработчиков объединенных функций в секундах. None - как только обработчики освободятся
+        """
+        self.coalesce_interval = interval or None  # Период вызова обработчиков
+        self.coalesce_cmds = frozenset(cmds)  # Функции обратного вызова, которые объединяются
+        if self.coalesce_interval is not None and self.coalesce_thread is None:  # Если задан период, а поток еще не запущен
+            self.coalesce_thread = Thread(target=self.coalesce_handler, name='CallbackCoalesceThread', daemon=True)  # то создаем поток периодического вызова обработчиков
+            self.coalesce_thread.start()  # Запускаем поток
+        if not self.coalesce_cmds:  # Если объединение отключено
+            self.flush_callbacks()  # то обрабатываем все отложенные функции
+
+    def coalesce_callback(self, data) -> bool:
+        """Откладывание функции обратного вызова для объединения по инструменту
+
+        :param dict data: Функция обратного вызова в формате JSON
+        :return: True - функция отложена, ее обработчик вызовет flush_callbacks / False - функцию нужно обработать сразу
+        """
+        cmd = data.get('cmd')  # Функция обратного вызова
+        if cmd not in self.coalesce_cmds:  # Если функция не объединяется
+            return False  # то ее нужно обработать сразу
+        params = data.get('data')  # Данные функции обратного вызова
+        if not isinstance(params, dict):  # Если в данных нет инструмента
+            return False  # то функцию нужно обработать сразу
+        key = (cmd, params.get('class_code'), params.get('sec_code'))  # Функция по инструменту
+        with self.coalesce_lock:  # Функции откладывает поток приема, а обрабатывает другой поток
+            stats = self.coalesce_stats.setdefault(cmd, [0, 0])  # Статистика объединения
+            stats[0] += 1  # Кол-во принятых функций
+            if key in self.coalesced:  # Если по инструменту уже есть необработанная функция
+                stats[1] += 1  # то она будет заменена последней
+            self.coalesced[key] = data  # Запоминаем последнюю функцию по инструменту
+            queue_flush = self.callback_queue is not None and self.coalesce_interval is None and not self.coalesce_flush_queued  # Без периода признак вызова обработчиков ставим в очередь один раз
+            if queue_flush:  # Если нужно поставить признак в очередь
+                self.coalesce_flush_queued = True  # то запоминаем, что он уже стоит
+        if queue_flush:  # Если нужно поставить признак в очередь
+            self.callback_queue.put(self.coalesce_flush)  # то обработчики будут вызваны, когда поток обработки до него дойдет
+        return True
+
+    def flush_callbacks(self) -> int:
+        """Вызов обработчиков всех отложенных для объединения функций обратного вызова
+
+        :return: Кол-во вызванных обработчиков
+        """
+        with self.coalesce_lock:  # Забираем все отложенные функции
+            pending, self.coalesced = self.coalesced, {}
+            self.coalesce_flush_queued = False  # Следующая отложенная функция поставит признак в очередь снова
+        for data in pending.values():  # Пробегаемся по всем отложенным функциям
+            self.dispatch_callback(data)  # Вызываем обработчик
+        return len(pending)
+
+    def coalesce_handler(self):
+        """Поток периодического вызова обработчиков объединенных функций обратного вызова"""
+        while not self.callback_exit_event.wait(self.coalesce_interval or 1):  # Пока не установлено событие выхода из потока, ждем период
+            if not self.coalesced or self.coalesce_interval is None:  # Если отложенных функций нет, или период отключен
+                continue  # то ждем следующий период
+            if self.callback_queue is None:  # Если обработчики вызываются без очереди
+                self.flush_callbacks()  # то вызываем их в этом потоке
+                continue  # Ждем следующий период
+            with self.coalesce_lock:  # Признак вызова обработчиков ставим в очередь один раз
+                queue_flush = not self.coalesce_flush_queued
+                self.coalesce_flush_queued = True
+            if queue_flush:  # Если признака в очереди еще нет
+                self.callback_queue.put(self.coalesce_flush)  # то обработчики вызовет поток обработки
+
+    def connected_handler(self, data):
+        """Соединение терминала с сервером QUIK. Возобновление подписок, затем вызов on_connected
+
+        :param dict data: Функция обратного вызова OnConnected в формате JSON
+        """
+        for subscription in self.subscriptions:  # Пробегаемся по всем подпискам
+            class_code = subscription['class_code']  # Код режима торгов
+            sec_code = subscription['sec_code']  # Тикер
+            if subscription['subscription'] == 'quotes' and not self.is_subscribed_level2_quotes(class_code, sec_code)['data']:  # Если подписка на стакан и ее нет в QUIK
+                self.subscribe_level2_quotes(class_code, sec_code)  # то переподписываемся на стакан
+                self.logger.debug(f'Повторная подписка на стакан: {class_code}.{sec_code}')
+            elif subscription['subscription'] == 'candles':  # Если подписка на свечки
+                interval = subscription['interval']  # Кол-во в минутах
+                param = subscription['param']  # Необязательный параметр
+                if not self.is_subscribed(class_code, sec_code, interval, param)['data']:  # и ее нет в QUIK'
+                    self.subscribe_to_candles(class_code, sec_code, interval, param)  # то подписываемся на свечки
+                    self.logger.debug(f'Повторная подписка на бары: {class_code}.{sec_code} {interval} {param}')
+        self.on_connected(data)
+
+    def get_callback_stats(self) -> dict:
+        """Статистика функций обратного вызова
+
+        :return: Функция обратного вызова -> кол-во, суммарное/среднее/максимальное время обработчика в секундах. В ключе 'queue' - длина очереди (текущая/наибольшая) и сколько раз поток приема ждал места в ней. В ключе 'coalesced' - сколько функций принято и объединено
+        """
+        result = {cmd: dict(count=count, time=total, avg_time=total / count, max_time=max_time)
+                  for cmd, (count, total, max_time) in list(self.callback_stats.items())}  # Копируем статистику, т.к. она может меняться в другом потоке
+        if self.callback_queue is not None:  # Если обработчики вызываются через очередь
+            result['queue'] = dict(size=self.callback_queue.qsize(), max_size=self.callback_queue_max, full_waits=self.callback_queue_full)
+        if self.coalesce_stats:  # Если функции объединялись
+            result['coalesced'] = {cmd: dict(received=received, merged=merged)
+                                   for cmd, (received, merged) in list(self.coalesce_stats.items())}  # Сколько функций принято и сколько из них заменено более новыми
+        return result
 
     # Выход и закрытие
 
@@ -953,12 +1527,44 @@ class QuikPy:
         self.close_connection_and_thread()  # Закрываем соединение для запросов и поток обработки функций обратного вызова
 
     def __del__(self):
-        self.close_connection_and_thread()  # Закрываем соединение для запросов и поток обработки функций обратного вызова
+        if hasattr(self, 'socket_requests'):  # Если соединение для запросов было создано
+            self.close_connection_and_thread()  # Закрываем соединение для запросов и поток обработки функций обратного вызова
+
+    def is_alive(self) -> bool:
+        """Соединения с QUIK открыты и потоки приема работают
+
+        :return: True - соединения открыты / False - соединения закрыты или разорваны
+        """
+        if self.callback_exit_event.is_set():  # Если соединения закрыты
+            return False
+        if self.callback_thread is not None and not self.callback_thread.is_alive():  # Если поток обработки функций обратного вызова завершился (соединение разорвано)
+            return False
+        if self.multiplex and not self.requests_thread.is_alive():  # Если поток приема ответов на запросы завершился (соединение разорвано)
+            return False
+        return True
 
     def close_connection_and_thread(self):
-        """Закрытие соединения для запросов и потока обработки функций обратного вызова"""
-        self.socket_requests.close()  # Закрываем соединение для запросов
+        """Закрытие соединений для запросов и функций обратного вызова, остановка потоков приема. Можно вызывать повторно"""
+        if self.callback_exit_event.is_set():  # Если соединения уже закрыты
+            return  # то выходим, дальше не продолжаем
         self.callback_exit_event.set()  # Останавливаем поток обработки функций обратного вызова
+        self.stop_capture()  # Завершаем запись функций обратного вызова, если она велась
+        for sock in (self.socket_requests, self.socket_callbacks):  # Пробегаемся по всем соединениям
+            if sock is None:  # Если соединение не создавалось
+                continue  # то переходим к следующему соединению
+            try:  # Соединение может быть уже разорвано
+                sock.shutdown(SHUT_RDWR)  # Прерываем прием. Потоки приема выйдут из ожидания
+            except OSError:  # Если соединение уже разорвано
+                pass  # то его не прерываем
+            sock.close()  # Закрываем соединение
+        if self.callback_worker_thread is not None:  # Если обработчики вызываются через очередь
+            try:  # Очередь может быть заполнена
+                self.callback_queue.put(None, timeout=1)  # Останавливаем поток вызова обработчиков после уже принятых функций обратного вызова
+            except Full:  # Если обработчики так и не освободили очередь
+                pass  # то поток останется ждать. Он фоновый и завершится вместе с программой
+        for thread in (self.callback_thread, self.requests_thread, self.callback_worker_thread, self.coalesce_thread):  # Пробегаемся по всем потокам
+            if thread is not None and thread is not current_thread():  # Если поток запущен, и закрытие вызвано не из него
+                thread.join(1)  # то ждем его завершения
 
     # Функции конвертации
 
@@ -988,6 +1594,11 @@ class QuikPy:
         """
         return f'{class_code}.{sec_code}'
 
+    @property
+    def symbols(self) -> dict:
+        """Справочник спецификаций тикеров. (Код режима торгов, тикер) -> спецификация"""
+        return self.symbols_store.specs
+
     def get_symbol_info(self, class_code, sec_code, reload=False):
         """Спецификация тикера
 
@@ -996,13 +1607,91 @@ class QuikPy:
         :param bool reload: Получить информацию из QUIK
         :return: Значение из кэша/QUIK или None, если тикер не найден
         """
-        if reload or (class_code, sec_code) not in self.symbols:  # Если нужно получить информацию из QUIK или нет информации о тикере в справочнике
+        si = None if reload else self.symbols_store.get_spec(class_code, sec_code)  # Спецификация из справочника
+        if si is None:  # Если нужно получить информацию из QUIK или нет информации о тикере в справочнике
             symbol_info = self.get_security_info(class_code, sec_code)  # Получаем информацию о тикере из QUIK
-            if 'data' not in symbol_info:  # Если ответ не пришел (возникла ошибка). Например, для опциона
+            if not symbol_info.get('data'):  # Если ответ не пришел (возникла ошибка). Например, для опциона
                 self.logger.error(f'Информация о {self.class_sec_codes_to_dataname(class_code, sec_code)} не найдена')
                 return None  # то возвращаем пустое значение
-            self.symbols[(class_code, sec_code)] = symbol_info['data']  # Заносим информацию о тикере в справочник
-        return self.symbols[(class_code, sec_code)]  # Возвращаем значение из справочника
+            si = symbol_info['data']  # Спецификация тикера
+            self.symbols_store.put_spec(class_code, sec_code, si)  # Заносим информацию о тикере в справочник
+        return si
+
+    def prefetch_symbols(self, class_sec_codes, reload=False) -> int:
+        """Заполнение справочника спецификациями и стоимостями шага цены фьючерсов за два запроса (getSecurityInfoBulk, getParamEx2Bulk)
+
+        :param list[tuple[str, str]] class_sec_codes: Коды режимов торгов и тикеры. Например: [('TQBR', 'SBER'), ('SPBFUT', 'SiZ5')]
+        :param bool reload: Получить из QUIK все спецификации, а не только отсутствующие в справочнике
+        :return: Кол-во полученных спецификаций
+        """
+        missing = [(class_code, sec_code) for class_code, sec_code in dict.fromkeys(class_sec_codes)
+                   if reload or self.symbols_store.get_spec(class_code, sec_code) is None]  # Тикеры без спецификации. Без повторов, в порядке запроса
+        received = 0  # Кол-во полученных спецификаций
+        if missing:  # Если есть тикеры без спецификации
+            infos = self.get_security_info_bulk([f'{class_code}|{sec_code}' for class_code, sec_code in missing]).get('data') or []  # Получаем их из QUIK одним запросом
+            for si in infos:  # Пробегаемся по всем полученным спецификациям
+                if isinstance(si, dict) and si.get('class_code') and si.get('code'):  # Для ненайденных тикеров спецификации нет
+                    self.symbols_store.put_spec(si['class_code'], si['code'], si)  # Заносим спецификацию в справочник
+                    received += 1
+        futures = [(class_code, sec_code) for class_code, sec_code in dict.fromkeys(class_sec_codes) if class_code == 'SPBFUT']  # Фьючерсы
+        if futures:  # Если есть фьючерсы
+            results = self.get_param_ex2_bulk([f'{class_code}|{sec_code}|STEPPRICE' for class_code, sec_code in futures]).get('data') or []  # Стоимости шага цены одним запросом
+            for (class_code, sec_code), result in zip(futures, results):  # Значения приходят в порядке запроса
+                step_price = self.step_price_value(result)  # Стоимость шага цены из ответа
+                if step_price:  # Если стоимость шага цены получена
+                    self.symbols_store.put_step_price(class_code, sec_code, step_price)  # то заносим ее в справочник
+        self.symbols_store.save()  # Сохраняем справочник в файл, если он задан
+        return received
+
+    @staticmethod
+    def step_price_value(result):
+        """Стоимость шага цены из значения параметра STEPPRICE или None, если ее нет"""
+        try:
+            return float(result['param_value']) or None
+        except (TypeError, KeyError, ValueError):  # Параметр не найден или пустой
+            return None
+
+    def get_step_price(self, class_code, sec_code):
+        """Стоимость шага цены
+
+        Берется из справочника. Если стоимость устарела, она возвращается, а в режиме мультиплексирования обновляется в фоне, не задерживая вызов.
+        Из QUIK с ожиданием ответа стоимость получается только если ее нет в справочнике или запросы не мультиплексируются
+
+        :param str class_code: Код режима торгов
+        :param str sec_code: Тикер
+        :return: Стоимость шага цены или None, если она не найдена
+        """
+        step_price, fresh = self.symbols_store.get_step_price(class_code, sec_code)  # Стоимость шага цены из справочника
+        if fresh:  # Если стоимость актуальна
+            return step_price  # то возвращаем ее
+        request = {'data': f'{class_code}|{sec_code}|STEPPRICE', 'id': 0, 'cmd': 'getParamEx2', 't': ''}  # Запрос стоимости шага цены
+        if step_price is not None and self.multiplex:  # Если есть устаревшая стоимость, и ответ можно не ждать
+            key = (class_code, sec_code)
+            with self.step_price_lock:  # Проверяем и отмечаем в одной блокировке, иначе два потока запросят стоимость дважды
+                requested = key in self.step_price_requests  # Стоимость уже обновляется
+                self.step_price_requests.add(key)
+            if not requested:  # Если стоимость еще не обновлялась. Запрос отправляем вне блокировки: при ошибке отправки обработчик ответа вызывается сразу
+                self.send_request(request).add_done_callback(lambda future: self.step_price_received(key, future))  # то обновляем ее в фоне
+            return step_price  # Возвращаем устаревшую стоимость
+        try:  # Запрос может завершиться ошибкой
+            new_step_price = self.step_price_value(self.process_request(request).get('data'))  # Получаем стоимость из QUIK
+        except Exception as e:  # Если стоимость получить не удалось
+            self.logger.warning(f'Стоимость шага цены {self.class_sec_codes_to_dataname(class_code, sec_code)} не получена: {e}')
+            return step_price  # то возвращаем устаревшую стоимость, если она есть
+        if new_step_price:  # Если стоимость получена
+            self.symbols_store.put_step_price(class_code, sec_code, new_step_price)  # то заносим ее в справочник
+            return new_step_price
+        return step_price
+
+    def step_price_received(self, key, future):
+        """Получение стоимости шага цены, обновляемой в фоне"""
+        with self.step_price_lock:
+            self.step_price_requests.discard(key)  # Стоимость больше не обновляется
+        if future.exception() is not None:  # Если ответ не получен
+            return  # то остается устаревшая стоимость
+        step_price = self.step_price_value(future.result().get('data'))  # Стоимость шага цены из ответа
+        if step_price:  # Если стоимость получена
+            self.symbols_store.put_step_price(*key, step_price)  # то заносим ее в справочник
 
     @staticmethod
     def timeframe_to_quik_timeframe(tf) -> tuple[int, bool]:
@@ -1049,6 +1738,8 @@ class QuikPy:
         :return: Цена, которую примет QUIK в зявке
         """
         si = self.get_symbol_info(class_code, sec_code)  # Спецификация тикера
+        if not si:  # Если тикер не найден
+            return quik_price  # то цена не изменяется, как и в prices_to_valid_prices
         min_price_step = si['min_price_step']  # Шаг цены
         valid_price = quik_price // min_price_step * min_price_step  # Цена должна быть кратна шагу цены
         scale = si['scale']  # Кол-во десятичных знаков
@@ -1073,7 +1764,7 @@ class QuikPy:
             quik_price = price * 100 / si['face_value']  # Пункты цены для котировок облигаций представляют собой проценты номинала облигации
         elif class_code == 'SPBFUT':  # Для рынка фьючерсов
             lot_size = si['lot_size']  # Лот
-            step_price = float(self.get_param_ex(class_code, sec_code, 'STEPPRICE')['data']['param_value'])  # Стоимость шага цены
+            step_price = self.get_step_price(class_code, sec_code)  # Стоимость шага цены из справочника
             if lot_size > 1 and step_price:  # Если есть лот и стоимость шага цены
                 lot_price = price * lot_size  # Цена в рублях за лот
                 quik_price = lot_price * min_price_step / step_price  # Цена в рублях за штуку
@@ -1094,7 +1785,7 @@ class QuikPy:
             return quik_price / 100 * si['face_value']  # Пункты цены для котировок облигаций представляют собой проценты номинала облигации
         elif class_code == 'SPBFUT':  # Для рынка фьючерсов
             lot_size = si['lot_size']  # Лот
-            step_price = float(self.get_param_ex(class_code, sec_code, 'STEPPRICE')['data']['param_value'])  # Стоимость шага цены
+            step_price = self.get_step_price(class_code, sec_code)  # Стоимость шага цены из справочника
             if lot_size > 1 and step_price:  # Если есть лот и стоимость шага цены
                 min_price_step = si['min_price_step']  # Шаг цены
                 lot_price = quik_price // min_price_step * step_price  # Цена за лот
@@ -1130,3 +1821,119 @@ class QuikPy:
             if lot_size:  # Если задано кол-во штук
                 return size // lot_size  # то возвращаем кол-во в лотах
         return size  # В остальных случаях возвращаем кол-во в штуках
+
+    # Пакетный перевод цен и количеств. Спецификации получаются один раз на тикер, перевод выполняется над массивами NumPy
+    # Результаты совпадают с функциями для одного значения. Код режима торгов и тикер задаются строками (один тикер)
+    # или последовательностями той же длины, что и значения (у каждого значения свой тикер)
+
+    def symbols_arrays(self, class_code, sec_code, n) -> dict:
+        """Параметры спецификаций тикеров для пакетного перевода
+
+        :param str | list[str] class_code: Код режима торгов или коды для каждого значения
+        :param str | list[str] sec_code: Тикер или тикеры для каждого значения
+        :param int n: Кол-во значений
+        :return: Параметр -> значение параметра (один тикер) или массив значений для каждого значения. found - тикер найден, bond - облигация, future - фьючерс
+        """
+        if np is None:  # Если NumPy не установлен
+            raise ImportError('Для пакетного перевода цен и количеств установите numpy')
+        if isinstance(class_code, str) and isinstance(sec_code, str):  # Если задан один тикер
+            keys = [(class_code, sec_code)]  # то спецификация одна
+            index = 0  # и относится ко всем значениям. Параметры будут скалярами, значения могут быть массивом любой формы
+        else:  # Если у каждого значения свой тикер
+            class_codes, sec_codes = np.asarray(class_code, dtype=str), np.asarray(sec_code, dtype=str)
+            if class_codes.shape != (n,) or sec_codes.shape != (n,):  # Если кол-во тикеров не совпадает с кол-вом значений
+                raise ValueError(f'Ожидается {n} кодов режимов торгов и тикеров')
+            names, index = np.unique(np.char.add(np.char.add(class_codes, '|'), sec_codes), return_inverse=True)  # Разные тикеры и номер тикера для каждого значения
+            keys = [tuple(name.split('|', 1)) for name in names.tolist()]
+        params = {name: [] for name in ('found', 'bond', 'future', 'min_price_step', 'scale', 'lot_size', 'face_value', 'step_price')}
+        for key_class_code, key_sec_code in keys:  # Пробегаемся по всем разным тикерам
+            si = self.get_symbol_info(key_class_code, key_sec_code) or {}  # Спецификация тикера
+            future = bool(si) and key_class_code == 'SPBFUT'  # Фьючерс
+            params['found'].append(bool(si))
+            params['bond'].append(bool(si) and key_class_code in ('TQOB', 'TQCB', 'TQRD', 'TQIR'))
+            params['future'].append(future)
+            params['min_price_step'].append(si.get('min_price_step') or 1)
+            params['scale'].append(si.get('scale') or 0)
+            params['lot_size'].append(si.get('lot_size') or 0)
+            params['face_value'].append(si.get('face_value') or 1)
+            params['step_price'].append((self.get_step_price(key_class_code, key_sec_code) or 0) if future else 0)
+        return {name: np.asarray(values)[index] for name, values in params.items()}
+
+    def prices_to_valid_prices(self, class_code, sec_code, quik_prices, si=None):
+        """Пакетный перевод цен в цены, которые примет QUIK в заявке
+
+        :param str | list[str] class_code: Код режима торгов или коды для каждой цены
+        :param str | list[str] sec_code: Тикер или тикеры для каждой цены
+        :param quik_prices: Цены в QUIK. Массив NumPy или последовательность
+        :param dict si: Параметры спецификаций из symbols_arrays. Если не заданы, то будут получены
+        :return: Массив цен. Целых, если у всех тикеров кол-во десятичных знаков = 0. Цены тикеров, которые не найдены, не изменяются
+        """
+        quik_prices = np.asarray(quik_prices, dtype=np.float64)
+        si = si if si is not None else self.symbols_arrays(class_code, sec_code, quik_prices.size)
+        min_price_step, scale = si['min_price_step'], si['scale']
+        valid_prices = np.floor_divide(quik_prices, min_price_step) * min_price_step  # Цена должна быть кратна шагу цены
+        pow10 = 10.0 ** scale
+        valid_prices = np.where(scale > 0, np.rint(valid_prices * pow10) / pow10, np.trunc(valid_prices))  # Округляем до кол-ва десятичных знаков, как round
+        valid_prices = np.where(si['found'], valid_prices, quik_prices)  # Цены тикеров, которые не найдены, не изменяются
+        if not (scale > 0).any() and si['found'].all():  # Если у всех тикеров кол-во десятичных знаков = 0
+            return valid_prices.astype(np.int64)  # то переводим цены в целые числа
+        return valid_prices
+
+    def prices_to_quik_prices(self, class_code, sec_code, prices):
+        """Пакетный перевод цен в рублях за штуку в цены QUIK
+
+        :param str | list[str] class_code: Код режима торгов или коды для каждой цены
+        :param str | list[str] sec_code: Тикер или тикеры для каждой цены
+        :param prices: Цены в рублях за штуку. Массив NumPy или последовательность
+        :return: Массив цен в QUIK
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        si = self.symbols_arrays(class_code, sec_code, prices.size)
+        lot_size, step_price = si['lot_size'], si['step_price']
+        future = si['future'] & (lot_size > 1) & (step_price != 0)  # Фьючерсы, у которых есть лот и стоимость шага цены
+        with np.errstate(divide='ignore', invalid='ignore'):  # Деление на 0 возможно только в значениях, которые не выбираются
+            quik_prices = np.where(si['bond'], prices * 100 / si['face_value'], prices)  # Пункты цены для котировок облигаций представляют собой проценты номинала облигации
+            quik_prices = np.where(future, prices * lot_size * si['min_price_step'] / step_price, quik_prices)  # Цена фьючерса в пунктах
+        valid_prices = self.prices_to_valid_prices(class_code, sec_code, quik_prices, si)  # Цены, которые примет QUIK в заявке
+        return valid_prices if si['found'].all() else np.where(si['found'], valid_prices, prices)  # Цены тикеров, которые не найдены, не изменяются
+
+    def quik_prices_to_prices(self, class_code, sec_code, quik_prices):
+        """Пакетный перевод цен QUIK в цены в рублях за штуку
+
+        :param str | list[str] class_code: Код режима торгов или коды для каждой цены
+        :param str | list[str] sec_code: Тикер или тикеры для каждой цены
+        :param quik_prices: Цены в QUIK. Массив NumPy или последовательность
+        :return: Массив цен в рублях за штуку
+        """
+        quik_prices = np.asarray(quik_prices, dtype=np.float64)
+        si = self.symbols_arrays(class_code, sec_code, quik_prices.size)
+        lot_size, step_price = si['lot_size'], si['step_price']
+        future = si['future'] & (lot_size > 1) & (step_price != 0)  # Фьючерсы, у которых есть лот и стоимость шага цены
+        with np.errstate(divide='ignore', invalid='ignore'):  # Деление на 0 возможно только в значениях, которые не выбираются
+            prices = np.where(si['bond'], quik_prices / 100 * si['face_value'], quik_prices)  # Пункты цены для котировок облигаций представляют собой проценты номинала облигации
+            return np.where(future, np.floor_divide(quik_prices, si['min_price_step']) * step_price / lot_size, prices)  # Цена фьючерса за штуку
+
+    def lots_to_sizes(self, class_code, sec_code, lots):
+        """Пакетный перевод лотов в штуки
+
+        :param str | list[str] class_code: Код режима торгов или коды для каждого значения
+        :param str | list[str] sec_code: Тикер или тикеры для каждого значения
+        :param lots: Кол-во лотов. Массив NumPy или последовательность
+        :return: Массив кол-в в штуках. Для тикеров без лота - в лотах
+        """
+        lots = np.asarray(lots)
+        lot_size = self.symbols_arrays(class_code, sec_code, lots.size)['lot_size']
+        sizes = np.where(lot_size != 0, np.trunc(lots * lot_size), lots)  # Кол-во в штуках
+        return sizes.astype(np.int64) if (lot_size != 0).all() or lots.dtype.kind in 'iu' else sizes
+
+    def sizes_to_lots(self, class_code, sec_code, sizes):
+        """Пакетный перевод штук в лоты
+
+        :param str | list[str] class_code: Код режима торгов или коды для каждого значения
+        :param str | list[str] sec_code: Тикер или тикеры для каждого значения
+        :param sizes: Кол-во штук. Массив NumPy или последовательность
+        :return: Массив кол-в в лотах. Для тикеров без лота - в штуках
+        """
+        sizes = np.asarray(sizes)
+        lot_size = self.symbols_arrays(class_code, sec_code, sizes.size)['lot_size'].astype(np.int64)  # Кол-во штук в лоте. Целое, как в size_to_lots
+        return np.where(lot_size != 0, np.floor_divide(sizes, np.where(lot_size != 0, lot_size, 1)), sizes)
@@ -0,0 +1,2 @@
+# Benchmarks for the screener API.  Run from the ``api`` directory, e.g.
+#   python -m bench.bench_codec
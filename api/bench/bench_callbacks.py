@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Replay a QUIK callback capture through the real parsing and dispatch path.
+
+Captures come from a live terminal (``record``) or are synthesized
+(``synth``): bursts of ``OnParam``, ``OnQuote`` and ``OnAllTrade`` shaped
+like QUIK# messages and cut into TCP‑sized fragments.  ``replay`` feeds a
+capture into ``QuikPy.replay_callbacks`` with the screener's handlers
+installed (dirty marking for OnParam, ``BookStore`` for OnQuote,
+``TradeRecorder`` for OnAllTrade) and prints throughput, per‑fragment
+latency and per‑callback handler time.
+
+    python -m bench.bench_callbacks record cap.bin --seconds 60 [--host H]
+    python -m bench.bench_callbacks synth cap.bin [--messages 200000]
+    python -m bench.bench_callbacks replay cap.bin [--speed 10] [--queue 10000] [--coalesce 0]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from QuikPy import QuikPy, JsonLineCodec, CallbackCapture
+from order_book import BookStore
+from trade_tape import TradeRecorder
+from bench.quik_standin import QuikStandIn
+
+SECS = [("SPBFUT", s) for s in ("SiZ5", "RIZ5", "BRF6", "SRZ5", "GZZ5")] + [("TQBR", s) for s in ("SBER", "GAZP", "LKOH", "VTBR", "ROSN")]
+
+
+def record(args: argparse.Namespace) -> None:
+    qp = QuikPy(host=args.host, requests_port=args.requests_port, callbacks_port=args.callbacks_port)
+    try:
+        qp.start_capture(args.path)
+        time.sleep(args.seconds)
+        print(qp.stop_capture())
+    finally:
+        qp.close_connection_and_thread()
+
+
+def _quote(rnd: random.Random, class_code: str, sec_code: str) -> dict:
+    mid = rnd.uniform(100, 110)
+    return {"class_code": class_code, "sec_code": sec_code, "bid_count": "20", "offer_count": "20",
+            "bid": [{"price": f"{mid - 0.01 * (20 - i):.2f}", "quantity": str(rnd.randint(1, 500))} for i in range(20)],
+            "offer": [{"price": f"{mid + 0.01 * (i + 1):.2f}", "quantity": str(rnd.randint(1, 500))} for i in range(20)]}
+
+
+def synth(args: argparse.Namespace) -> None:
+    """Write ``--messages`` callbacks as bursts of ``--burst`` messages every
+    ``--gap`` seconds, split into ``--chunk`` byte fragments."""
+    rnd = random.Random(1)
+    cap = CallbackCapture(args.path)
+    ts = time.time_ns()
+    pending = bytearray()
+    for i in range(args.messages):
+        class_code, sec_code = rnd.choice(SECS)
+        kind = rnd.random()
+        if kind < 0.5:
+            msg = {"cmd": "OnParam", "data": {"class_code": class_code, "sec_code": sec_code}}
+        elif kind < 0.8:
+            msg = {"cmd": "OnQuote", "data": _quote(rnd, class_code, sec_code)}
+        else:
+            msg = {"cmd": "OnAllTrade", "data": {
+                "trade_num": i, "flags": 1025, "price": rnd.uniform(100, 110), "qty": rnd.randint(1, 10), "value": 0,
+                "sec_code": sec_code, "class_code": class_code, "open_interest": 0,
+                "datetime": {"year": 2025, "month": 12, "day": 1, "hour": 12, "min": i // 60000 % 60, "sec": i // 1000 % 60, "ms": i % 1000, "mcs": i % 1000 * 1000}}}
+        msg["t"] = 0
+        pending += JsonLineCodec.encode(msg)
+        if (i + 1) % args.burst == 0 or i + 1 == args.messages:
+            for j in range(0, len(pending), args.chunk):
+                cap.write(bytes(pending[j:j + args.chunk]), ts)
+            pending.clear()
+            ts += int(args.gap * 1e9)
+    cap.close()
+    print(f"{args.messages:,} callbacks, {cap.frames:,} fragments, {cap.bytes / 1e6:.1f} MB -> {args.path}")
+
+
+def replay(args: argparse.Namespace) -> None:
+    server = QuikStandIn(requests_port=0, callbacks_port=0)
+    requests_port, callbacks_port = server.start()
+    root = tempfile.mkdtemp(prefix="replay_")
+    qp = QuikPy(requests_port=requests_port, callbacks_port=callbacks_port, callback_queue_size=args.queue)
+    try:
+        if args.coalesce is not None:
+            qp.coalesce_callbacks(("OnParam", "OnQuote"), interval=args.coalesce)
+        dirty = set()
+        books = BookStore(20)
+        for key in SECS:
+            books.track(*key)
+        trades = TradeRecorder(root)
+        qp.on_param = lambda data: dirty.add((data["data"]["class_code"], data["data"]["sec_code"]))
+        qp.on_quote = books.on_quote
+        qp.on_all_trade = trades.on_all_trade
+        result = qp.replay_callbacks(args.path, speed=args.speed)
+        trades.close()
+        print(f"{result['messages']:,} callbacks in {result['elapsed']:.2f}s = {result['rate']:,.0f}/s"
+              f"   fragment latency p50 {result.get('latency_p50', 0) * 1e3:.2f} ms"
+              f"  p99 {result.get('latency_p99', 0) * 1e3:.2f} ms  max {result.get('latency_max', 0) * 1e3:.2f} ms")
+        print(json.dumps(qp.get_callback_stats(), indent=1, default=str))
+    finally:
+        qp.close_connection_and_thread()
+        server.stop()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    sub = ap.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("record", help="capture callbacks of a live terminal")
+    p.add_argument("path")
+    p.add_argument("--seconds", type=float, default=60)
+    p.add_argument("--host", default=os.getenv("QUIK_HOST", "127.0.0.1"))
+    p.add_argument("--requests-port", type=int, default=34130)
+    p.add_argument("--callbacks-port", type=int, default=34131)
+    p.set_defaults(func=record)
+    p = sub.add_parser("synth", help="write a synthetic capture")
+    p.add_argument("path")
+    p.add_argument("--messages", type=int, default=200_000)
+    p.add_argument("--burst", type=int, default=2_000, help="callbacks per burst")
+    p.add_argument("--gap", type=float, default=0.05, help="seconds between bursts")
+    p.add_argument("--chunk", type=int, default=65536, help="fragment size in bytes")
+    p.set_defaults(func=synth)
+    p = sub.add_parser("replay", help="replay a capture through QuikPy")
+    p.add_argument("path")
+    p.add_argument("--speed", type=float, default=None, help="1 = real time, N = N times faster, omit = no pauses")
+    p.add_argument("--queue", type=int, default=0, help="callback_queue_size")
+    p.add_argument("--coalesce", type=float, default=None, help="coalesce OnParam/OnQuote with this interval (0 = when idle)")
+    p.set_defaults(func=replay)
+    args = ap.parse_args()
+    args.func(args)
+    os._exit(0)  # QuikPy threads are daemons; do not wait for sockets to drain
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Decode throughput of multi‑MB QUIK# replies.
+
+Compares the legacy framing of ``process_request``/``callback_handler``
+(join all fragments and retry ``loads()`` after every short ``recv``) with
+``JsonLineCodec``.  Replies are shaped like ``get_all_trade`` and are fed in
+TCP‑sized chunks, so the numbers reflect decoding cost only.
+
+    python -m bench.bench_codec [--sizes 1 4 16] [--chunk 65536]
+"""
+import argparse
+import json
+import time
+from json import loads
+from json.decoder import JSONDecodeError
+from typing import List
+
+from QuikPy import JsonLineCodec
+
+LEGACY_BUFFER_SIZE = 1048576
+
+
+def make_reply(megabytes: float) -> bytes:
+    """Build a ``get_all_trades`` style reply of roughly ``megabytes`` MB."""
+    trade = {
+        "trade_num": 0, "flags": 1025, "price": 312.45, "qty": 10, "value": 3124.5,
+        "accruedint": 0, "yield": 0, "settlecode": "Y2", "sec_code": "SBER",
+        "class_code": "TQBR", "exchange_code": "", "period": 1, "open_interest": 0,
+        "datetime": {"year": 2025, "month": 10, "day": 17, "hour": 10, "min": 0, "sec": 1, "ms": 5, "mcs": 5000},
+        "sec_name": "Сбербанк России ПАО ао",
+    }
+    one = len(json.dumps(trade, ensure_ascii=False).encode("cp1251")) + 1
+    count = max(1, int(megabytes * 1024 * 1024 / one))
+    trades = [dict(trade, trade_num=i) for i in range(count)]
+    msg = {"data": trades, "id": 1, "cmd": "get_all_trades", "t": ""}
+    return json.dumps(msg, ensure_ascii=False).encode("cp1251") + b"\n"
+
+
+def chunked(payload: bytes, chunk: int) -> List[bytes]:
+    return [payload[i:i + chunk] for i in range(0, len(payload), chunk)]
+
+
+def legacy_decode(chunks: List[bytes]) -> dict:
+    """The pre‑codec loop: re‑join and re‑parse after every short fragment."""
+    fragments = []
+    for fragment in chunks:
+        fragments.append(fragment.decode("cp1251"))
+        if len(fragment) < LEGACY_BUFFER_SIZE:
+            try:
+                return loads("".join(fragments))
+            except JSONDecodeError:
+                pass
+    raise RuntimeError("reply was not decoded")
+
+
+def codec_decode(chunks: List[bytes]) -> dict:
+    codec = JsonLineCodec()
+    for fragment in chunks:
+        messages = codec.feed(fragment)
+        if messages:
+            return messages[0]
+    raise RuntimeError("reply was not decoded")
+
+
+def timed(fn, chunks: List[bytes]) -> float:
+    t0 = time.perf_counter()
+    fn(chunks)
+    return time.perf_counter() - t0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--sizes", type=float, nargs="+", default=[1, 4, 16], help="reply sizes in MB")
+    ap.add_argument("--chunk", type=int, default=65536, help="bytes per recv")
+    args = ap.parse_args()
+    print(f"{'MB':>6} {'chunks':>7} {'legacy s':>10} {'codec s':>10} {'codec MB/s':>11} {'speedup':>8}")
+    for mb in args.sizes:
+        payload = make_reply(mb)
+        chunks = chunked(payload, args.chunk)
+        assert legacy_decode(chunks) == codec_decode(chunks)
+        legacy = timed(legacy_decode, chunks)
+        codec = timed(codec_decode, chunks)
+        size_mb = len(payload) / 1024 / 1024
+        print(f"{size_mb:6.1f} {len(chunks):7d} {legacy:10.3f} {codec:10.3f} {size_mb / codec:11.1f} {legacy / codec:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Screener QUIK refresh: per‑parameter reads vs getParamEx2Bulk.
+
+Each symbol costs the same reads as ``_refresh_spot_quik`` plus
+``_refresh_futures_quik`` (3 spot + 8 futures parameters).  Three strategies
+are timed against the QUIK# stand-in with a per‑message cost:
+
+* ``serial``    – one locked getParamEx2 round trip per parameter (before)
+* ``pipelined`` – all getParamEx2 requests in flight at once (multiplex)
+* ``bulk``      – ``QUIK_BULK_CHUNK`` parameters per getParamEx2Bulk
+
+    python -m bench.bench_quik_bulk [--symbols 3 30 300] [--msg-latency-ms 0.5]
+"""
+import argparse
+import time
+from typing import List, Tuple
+
+from QuikPy import QuikPy
+from bench.quik_standin import QuikStandIn
+
+SPOT_PARAMS = ("LAST", "BID", "OFFER")
+FUT_PARAMS = ("LAST", "BID", "OFFER", "INITIAL_MARGIN", "MINSTEP", "STEPPRICE", "LOTSIZE", "MAT_DATE")
+
+
+def universe(n: int) -> List[Tuple[str, str, str]]:
+    reqs = []
+    for i in range(n):
+        reqs += [("TQBR", f"S{i:04d}", p) for p in SPOT_PARAMS]
+        reqs += [("SPBFUT", f"F{i:04d}Z5", p) for p in FUT_PARAMS]
+    return reqs
+
+
+def serial(qp: QuikPy, reqs) -> list:
+    return [qp.get_param_ex2(c, s, p) for c, s, p in reqs]
+
+
+def pipelined(qp: QuikPy, reqs) -> list:
+    return qp.get_param_ex2_pipelined(reqs)
+
+
+def bulk(qp: QuikPy, reqs, chunk: int) -> list:
+    out = []
+    for i in range(0, len(reqs), chunk):
+        out += qp.get_param_ex2_bulk([f"{c}|{s}|{p}" for c, s, p in reqs[i:i + chunk]])["data"]
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--symbols", type=int, nargs="+", default=[3, 30, 300])
+    ap.add_argument("--msg-latency-ms", type=float, default=0.5, help="server cost per message")
+    ap.add_argument("--param-latency-ms", type=float, default=0.02, help="server cost per parameter")
+    ap.add_argument("--chunk", type=int, default=1000, help="parameters per bulk request")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    server = QuikStandIn(requests_port=0, callbacks_port=0, latency=args.msg_latency_ms / 1000,
+                         param_latency=args.param_latency_ms / 1000)
+    req_port, cb_port = server.start()
+    serial_qp = QuikPy(requests_port=req_port, callbacks=False)
+    mux_qp = QuikPy(requests_port=req_port, callbacks=False, multiplex=True)
+    strategies = {
+        "serial": lambda r: serial(serial_qp, r),
+        "pipelined": lambda r: pipelined(mux_qp, r),
+        "bulk": lambda r: bulk(serial_qp, r, args.chunk),
+    }
+    print(f"{'symbols':>7} {'params':>7} " + " ".join(f"{k + ' ms':>13}" for k in strategies) + f" {'bulk speedup':>13}")
+    for n in args.symbols:
+        reqs = universe(n)
+        best = {}
+        for name, fn in strategies.items():
+            times = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                res = fn(reqs)
+                times.append(time.perf_counter() - t0)
+                assert len(res) == len(reqs)
+            best[name] = min(times) * 1000
+        print(f"{n:7d} {len(reqs):7d} " + " ".join(f"{best[k]:13.1f}" for k in strategies)
+              + f" {best['serial'] / best['bulk']:12.1f}x")
+    serial_qp.close_connection_and_thread()
+    mux_qp.close_connection_and_thread()
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""QuikPy benchmark suite against the local QUIK# stand‑in.
+
+* ``latency``   — p50/p99 ``getParamEx2`` round trip versus the number of
+  threads sharing one QuikPy, with the request lock and multiplexed;
+* ``large``     — bytes per second of ``get_all_trade`` and ``get_candles``
+  replies of growing size;
+* ``callbacks`` — callback messages per second through ``callback_handler``
+  (pre‑encoded OnParam/OnQuote/OnAllTrade pushed as fast as the socket
+  takes them), inline and through the worker queue.
+
+``--json`` writes the results with machine metadata; ``--compare`` prints
+each metric against an earlier run.
+
+    python -m bench.bench_quikpy [--quick] [--json out.json] [--compare base.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List
+
+from QuikPy import QuikPy, JsonLineCodec
+from bench.quik_standin import QuikStandIn
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def bench_latency(ports, callers_list: List[int], requests: int, latency: float) -> List[Dict[str, Any]]:
+    out = []
+    for multiplex in (False, True):
+        for callers in callers_list:
+            qp = QuikPy(requests_port=ports[0], callbacks_port=ports[1], multiplex=multiplex, callbacks=False)
+            per_caller = max(1, requests // callers)
+            samples: List[List[float]] = [[] for _ in range(callers)]
+            barrier = threading.Barrier(callers + 1)
+
+            def caller(i: int) -> None:
+                barrier.wait()
+                for _ in range(per_caller):
+                    t0 = time.perf_counter()
+                    qp.get_param_ex2("TQBR", "SBER", "LAST")
+                    samples[i].append(time.perf_counter() - t0)
+
+            threads = [threading.Thread(target=caller, args=(i,)) for i in range(callers)]
+            for t in threads:
+                t.start()
+            barrier.wait()
+            t0 = time.perf_counter()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - t0
+            qp.close_connection_and_thread()
+            lat = sorted(x for s in samples for x in s)
+            out.append({"mode": "multiplex" if multiplex else "lock", "callers": callers, "requests": len(lat),
+                        "server_latency_ms": latency * 1e3,
+                        "p50_ms": percentile(lat, 0.5) * 1e3, "p99_ms": percentile(lat, 0.99) * 1e3,
+                        "max_ms": lat[-1] * 1e3, "req_per_s": len(lat) / elapsed})
+    return out
+
+
+def bench_large(ports, server: QuikStandIn, sizes: List[int]) -> List[Dict[str, Any]]:
+    out = []
+    qp = QuikPy(requests_port=ports[0], callbacks_port=ports[1], callbacks=False)
+    for n in sizes:
+        server.all_trades = n
+        server._tapes.clear()
+        calls = (("get_all_trade", qp.get_all_trade), ("get_candles", lambda: qp.get_candles("SBER", 0, 0, n)))
+        for name, call in calls:
+            call()  # the stand‑in builds and caches the payload on first use
+            t0 = time.perf_counter()
+            reply = call()
+            elapsed = time.perf_counter() - t0
+            size = len(JsonLineCodec.encode(reply))
+            out.append({"reply": name, "rows": len(reply["data"]), "bytes": size, "seconds": elapsed,
+                        "mb_per_s": size / elapsed / 1e6})
+    qp.close_connection_and_thread()
+    return out
+
+
+def _flood(messages: int) -> bytes:
+    rnd = random.Random(1)
+    secs = [("TQBR", "SBER"), ("TQBR", "GAZP"), ("SPBFUT", "SiZ5"), ("SPBFUT", "RIZ5")]
+    out = bytearray()
+    for i in range(messages):
+        class_code, sec_code = rnd.choice(secs)
+        kind = i % 10
+        if kind < 5:
+            msg = {"cmd": "OnParam", "data": {"class_code": class_code, "sec_code": sec_code}}
+        elif kind < 8:
+            msg = {"cmd": "OnQuote", "data": {"class_code": class_code, "sec_code": sec_code, "bid_count": "10", "offer_count": "10",
+                                              "bid": [{"price": str(100 + j), "quantity": "5"} for j in range(10)],
+                                              "offer": [{"price": str(111 + j), "quantity": "5"} for j in range(10)]}}
+        else:
+            msg = {"cmd": "OnAllTrade", "data": {"trade_num": i, "flags": 1025, "price": 100.5, "qty": 1, "value": 100.5,
+                                                 "class_code": class_code, "sec_code": sec_code, "open_interest": 0,
+                                                 "datetime": {"year": 2025, "month": 12, "day": 1, "hour": 12, "min": 0,
+                                                              "sec": 0, "ms": 0, "mcs": 0}}}
+        msg["t"] = 0
+        out += JsonLineCodec.encode(msg)
+    return bytes(out)
+
+
+def bench_callbacks(ports, server: QuikStandIn, messages: int, queues: List[int]) -> List[Dict[str, Any]]:
+    out = []
+    payload = _flood(messages)
+    for queue in queues:
+        qp = QuikPy(requests_port=ports[0], callbacks_port=ports[1], callback_queue_size=queue)
+        received = [0]
+        done = threading.Event()
+
+        def handler(data: dict) -> None:
+            received[0] += 1
+            if received[0] >= messages:
+                done.set()
+
+        qp.on_param = qp.on_quote = qp.on_all_trade = handler
+        time.sleep(0.2)  # let the stand‑in register the callback connection
+        t0 = time.perf_counter()
+        server.push_raw(payload)
+        finished = done.wait(120)
+        elapsed = time.perf_counter() - t0
+        qp.close_connection_and_thread()
+        out.append({"queue": queue, "messages": received[0], "complete": finished, "seconds": elapsed,
+                    "msg_per_s": received[0] / elapsed, "mb_per_s": len(payload) / elapsed / 1e6})
+    return out
+
+
+def metadata() -> Dict[str, Any]:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        rev = ""
+    return {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "git": rev, "python": sys.version.split()[0],
+            "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """Print every numeric metric next to the matching row of ``baseline``."""
+    keys = {"latency": ("mode", "callers"), "large": ("reply", "rows"), "callbacks": ("queue",)}
+    for section, key in keys.items():
+        base = {tuple(r[k] for k in key): r for r in baseline.get(section, [])}
+        for row in results.get(section, []):
+            old = base.get(tuple(row[k] for k in key))
+            if old is None:
+                continue
+            for metric in ("p50_ms", "p99_ms", "req_per_s", "mb_per_s", "msg_per_s"):
+                if metric in row and old.get(metric):
+                    print(f"{section:9} {'/'.join(str(row[k]) for k in key):16} {metric:10} "
+                          f"{old[metric]:12.2f} -> {row[metric]:12.2f}  ({row[metric] / old[metric]:.2f}x)")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    ap.add_argument("--quick", action="store_true", help="smaller sizes, for a smoke run")
+    ap.add_argument("--latency", type=float, default=0.0002, help="stand‑in seconds per request")
+    ap.add_argument("--json", help="write results here")
+    ap.add_argument("--compare", help="earlier --json output to compare with")
+    args = ap.parse_args()
+
+    callers = [1, 2, 4, 8] if args.quick else [1, 2, 4, 8, 16, 32]
+    requests = 400 if args.quick else 4000
+    sizes = [1_000, 10_000] if args.quick else [1_000, 10_000, 100_000]
+    flood = 20_000 if args.quick else 200_000
+
+    server = QuikStandIn(requests_port=0, callbacks_port=0, latency=args.latency)
+    ports = server.start()
+    results: Dict[str, Any] = {"meta": metadata()}
+    try:
+        results["latency"] = bench_latency(ports, callers, requests, args.latency)
+        for r in results["latency"]:
+            print(f"latency   {r['mode']:9} callers {r['callers']:>3}  p50 {r['p50_ms']:7.2f} ms  "
+                  f"p99 {r['p99_ms']:7.2f} ms  {r['req_per_s']:9,.0f} req/s")
+        server.latency = 0.0
+        results["large"] = bench_large(ports, server, sizes)
+        for r in results["large"]:
+            print(f"large     {r['reply']:13} {r['rows']:>8,} rows  {r['bytes'] / 1e6:7.1f} MB  "
+                  f"{r['seconds'] * 1e3:8.1f} ms  {r['mb_per_s']:6.1f} MB/s")
+        results["callbacks"] = bench_callbacks(ports, server, flood, [0, 10_000])
+        for r in results["callbacks"]:
+            print(f"callbacks queue {r['queue']:>6}  {r['messages']:>8,} msgs  {r['msg_per_s']:9,.0f} msg/s  "
+                  f"{r['mb_per_s']:6.1f} MB/s{'' if r['complete'] else '  (timed out)'}")
+    finally:
+        server.stop()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
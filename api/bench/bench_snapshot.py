@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""Screener rows: per‑row ``build_row`` against the columnar snapshot.
+
+For each universe size a synthetic cache is filled (some quotes, dividends
+and dates missing, as in real data) and both paths produce the JSON rows
+the API sends: ``build_row`` (the per‑row implementation the snapshot
+replaced, kept here as the reference) + ``model_dump`` per symbol, and
+``build_snapshot(...).rows()``.  Both outputs are compared value by value.
+
+    python -m bench.bench_snapshot [--sizes 10,300,3000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+os.environ.setdefault("DIVIDENDS_DB", "")
+os.environ.setdefault("FUT_INDEX_FILE", "")
+os.environ.setdefault("QUIK_TRADES_DIR", "")
+
+import main  # noqa: E402
+
+
+def build_row(share: str) -> main.ScreenerRow:
+    """Reference implementation: one ``ScreenerRow`` from the cache, the way
+    the screener computed rows before the columnar snapshot."""
+    # spot quote
+    s = main.CACHE["spot"].get(share, {})
+    s_last, s_bid, s_offer = s.get("last"), s.get("bid"), s.get("offer")
+    # futures mapping & quote
+    m = main.CACHE["map"].get(share, {})
+    fut_secid = m.get("secid")
+    ui_code   = m.get("ui") or main.ui_fut_code(share)
+    f = main.CACHE["fut"].get(fut_secid or "", {})
+    f_last, f_bid, f_offer = f.get("last"), f.get("bid"), f.get("offer")
+    im, minstep, stepprice = f.get("im"), f.get("minstep"), f.get("stepprice")
+    exp = f.get("exp")
+    # dividends
+    d = main.CACHE["divs"].get(share, {})
+    ex_date, div_val = d.get("ex_date"), d.get("value")
+    # ГО calculation: initial margin to contract value
+    go_pct: Optional[float] = None
+    multiplier: Optional[float] = None
+    if minstep and stepprice and minstep != 0:
+        multiplier = stepprice / minstep
+    if im and f_last and multiplier:
+        try:
+            go_pct = round(im / (f_last * multiplier) * 100, 4)
+        except ZeroDivisionError:
+            go_pct = None
+    # Spreads (enter and exit)
+    spread_in_pct: Optional[float] = None
+    if f_offer and s_bid:
+        spread_in_pct = round((f_offer - s_bid) / s_bid * 100, 4)
+    spread_out_pct: Optional[float] = None
+    if s_offer and f_bid:
+        spread_out_pct = round((s_offer - f_bid) / s_offer * 100, 4)
+    # Executable spreads: same legs, priced as VWAP over the books for BOOK_SIZE_RUB
+    spread_in_exec_pct: Optional[float] = None
+    spread_out_exec_pct: Optional[float] = None
+    s_lot = s.get("lotsize")
+    if main.QUIK_BOOK_DEPTH and fut_secid and multiplier and s_lot:
+        f_ask = main.BOOKS.vwap(main.QUIK_FUT_CLASS, fut_secid, "ask", main.BOOK_SIZE_RUB, multiplier)
+        f_bid_x = main.BOOKS.vwap(main.QUIK_FUT_CLASS, fut_secid, "bid", main.BOOK_SIZE_RUB, multiplier)
+        s_bid_x = main.BOOKS.vwap(main.QUIK_SPOT_CLASS, share, "bid", main.BOOK_SIZE_RUB, s_lot)
+        s_ask = main.BOOKS.vwap(main.QUIK_SPOT_CLASS, share, "ask", main.BOOK_SIZE_RUB, s_lot)
+        if f_ask and s_bid_x:
+            spread_in_exec_pct = round((f_ask - s_bid_x) / s_bid_x * 100, 4)
+        if s_ask and f_bid_x:
+            spread_out_exec_pct = round((s_ask - f_bid_x) / s_ask * 100, 4)
+    # Delta (futures minus spot)
+    delta_pct: Optional[float] = None
+    if (f_last is not None) and (s_last is not None) and s_last != 0:
+        delta_pct = round((f_last - s_last) / s_last * 100, 4)
+    # Dividend yield
+    div_pct: Optional[float] = None
+    if (div_val is not None) and (s_last is not None) and s_last != 0:
+        div_pct = round((div_val / s_last) * 100, 4)
+    # Total return: sum of delta and dividend
+    total_pct: Optional[float] = None
+    if div_pct is not None or delta_pct is not None:
+        total_pct = round((div_pct or 0.0) + (delta_pct or 0.0), 4)
+    # Fair value (Справ. Стоимость) – simple theoretical value: spot + dividend
+    fair_value: Optional[float] = None
+    if (s_last is not None) and (div_val is not None):
+        fair_value = round(s_last + div_val, 4)
+    # Days differences
+    def days_to(iso: Optional[str]) -> Optional[int]:
+        if not iso:
+            return None
+        try:
+            return (datetime.fromisoformat(str(iso)).date() - datetime.now(timezone.utc).date()).days
+        except Exception:
+            return None
+    return main.ScreenerRow(
+        Акция=share,
+        Фьючерс=ui_code,
+        Дата_див_отсечки=ex_date,
+        Размер_див_руб=div_val,
+        Див_pct=div_pct,
+        Цена_акции=round(s_last, 4) if s_last is not None else None,
+        Цена_фьючерса=round(f_last, 4) if f_last is not None else None,
+        ГО_pct=go_pct,
+        Спред_Входа_pct=spread_in_pct,
+        Спред_Выхода_pct=spread_out_pct,
+        Спред_Входа_исп_pct=spread_in_exec_pct,
+        Спред_Выхода_исп_pct=spread_out_exec_pct,
+        Справ_Стоимость=fair_value,
+        Дельта_pct=delta_pct,
+        Всего_pct=total_pct,
+        Дней_до_отсечки=days_to(ex_date),
+        Дней_до_эксп=days_to(exp),
+        Доход_к_отсечке_pct=div_pct,
+        Доход_к_эксп_pct=total_pct,
+    )
+
+
+def fill_cache(n: int) -> list:
+    rnd = random.Random(n)
+    today = date.today()
+    shares = [f"S{i:04d}" for i in range(n)]
+    for k in ("spot", "fut", "divs", "map"):
+        main.CACHE[k].clear()
+    for share in shares:
+        fut = f"{share}-12.{str(main.YEAR_DEC)[-2:]}"
+        # QUIK prices carry up to the instrument's step; 5 decimals hit the
+        # ties where rounding to 4 decimals must match round()
+        last = round(rnd.uniform(10, 5000), rnd.choice((2, 4, 5, 6)))
+        maybe = lambda v: None if rnd.random() < 0.05 else v  # noqa: E731
+        main.CACHE["spot"][share] = {"last": maybe(last), "bid": maybe(last - 0.1), "offer": maybe(last + 0.1),
+                                     "lotsize": 10.0, "ts": 0}
+        main.CACHE["map"][share] = {"secid": fut, "ui": main.ui_fut_code(share)}
+        f_last = round(last * rnd.uniform(1.0, 1.1), rnd.choice((0, 2, 5)))
+        main.CACHE["fut"][fut] = {"last": maybe(f_last), "bid": maybe(f_last - 1), "offer": maybe(f_last + 1),
+                                  "exp": maybe((today + timedelta(days=rnd.randint(1, 300))).isoformat()),
+                                  "im": maybe(f_last * 15), "minstep": maybe(1.0), "stepprice": maybe(rnd.choice((1.0, 0.1))),
+                                  "lotvolume": 100.0, "ts": 0}
+        if rnd.random() < 0.6:
+            main.CACHE["divs"][share] = {"ex_date": (today + timedelta(days=rnd.randint(1, 200))).isoformat(),
+                                         "value": round(rnd.uniform(1, 100), rnd.choice((2, 5))), "ts": 0}
+        else:
+            main.CACHE["divs"][share] = {"ex_date": None, "value": None, "ts": 0}
+    return shares
+
+
+def same(a, b) -> bool:
+    """Equal as the JSON would show them (both paths round to 4 decimals)."""
+    return type(a) is type(b) and a == b
+
+
+def best(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main_() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    ap.add_argument("--sizes", default="10,300,3000")
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+    today = date.today()
+    print(f"{'rows':>6} {'build_row':>12} {'snapshot':>12} {'speedup':>8}  mismatches")
+    for n in (int(x) for x in args.sizes.split(",")):
+        shares = fill_cache(n)
+        per_row = lambda: [build_row(s).model_dump() for s in shares]  # noqa: E731
+        columnar = lambda: main.build_snapshot(shares).rows(today)  # noqa: E731
+        a, b = per_row(), columnar()
+        bad = sum(1 for ra, rb in zip(a, b) for k in ra if not same(ra[k], rb[k]))
+        t_row, t_col = best(per_row, args.repeat), best(columnar, args.repeat)
+        print(f"{n:>6} {t_row * 1e3:>9.3f} ms {t_col * 1e3:>9.3f} ms {t_row / t_col:>7.1f}x  {bad}")
+
+
+if __name__ == "__main__":
+    main_()
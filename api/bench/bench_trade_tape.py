@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Throughput of the OnAllTrade recorder and tape reader.
+
+Three figures, all in trades per second:
+
+* ``record``   — ``TradeRecorder.on_all_trade`` on already parsed callbacks;
+* ``pipeline`` — QUIK# callback bytes through ``JsonLineCodec`` and into the
+  recorder, i.e. everything the callback thread does per trade;
+* ``read``     — mapping a segment and slicing it by time and instrument,
+  compared with parsing the same day as a ``get_all_trade`` JSON reply.
+
+The recorder keeps up when ``pipeline`` stays well above ``--peak``, the
+trade rate to design for.
+
+    python -m bench.bench_trade_tape [--trades 500000] [--peak 50000]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from typing import List
+
+from QuikPy import JsonLineCodec, QuikPy
+from trade_tape import TradeRecorder, TradeTape
+
+SECS = ["SiZ5", "RIZ5", "BRF6", "SRZ5", "GZZ5", "NGF6", "MXZ5", "CRZ5", "EuZ5", "GDZ5"]
+
+
+def make_trades(n: int) -> List[dict]:
+    rnd = random.Random(1)
+    out = []
+    for i in range(n):
+        s = 36000 + i * 50000 // n  # ~14 hours spread over the day
+        out.append({
+            "trade_num": 1_000_000 + i, "flags": rnd.choice((1025, 1026)), "price": round(rnd.uniform(90000, 95000), 0),
+            "qty": rnd.randint(1, 50), "value": 0, "accruedint": 0, "yield": 0, "settlecode": "", "reporate": 0,
+            "repovalue": 0, "repo2value": 0, "repoterm": 0, "sec_code": rnd.choice(SECS), "class_code": "SPBFUT",
+            "period": 1, "open_interest": 1_500_000, "exchange_code": "", "exec_market": "",
+            "datetime": {"year": 2025, "month": 12, "day": 1, "hour": s // 3600, "min": s // 60 % 60, "sec": s % 60,
+                         "ms": i % 1000, "mcs": i % 1000 * 1000, "week_day": 1},
+        })
+    return out
+
+
+def rate(n: int, seconds: float) -> str:
+    return f"{n / seconds:>12,.0f}/s"
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    ap.add_argument("--trades", type=int, default=500_000)
+    ap.add_argument("--peak", type=int, default=50_000, help="trade rate the recorder must sustain")
+    args = ap.parse_args()
+
+    trades = make_trades(args.trades)
+    callbacks = [{"cmd": "OnAllTrade", "data": t, "t": 0} for t in trades]
+    wire = b"".join(JsonLineCodec.encode(c) for c in callbacks)
+    root = tempfile.mkdtemp(prefix="tape_")
+    try:
+        rec = TradeRecorder(os.path.join(root, "a"))
+        t0 = time.perf_counter()
+        for c in callbacks:
+            rec.on_all_trade(c)
+        rec.close()
+        t_record = time.perf_counter() - t0
+
+        rec = TradeRecorder(os.path.join(root, "b"))
+        codec = JsonLineCodec()
+        t0 = time.perf_counter()
+        for i in range(0, len(wire), 65536):
+            for c in codec.feed(wire[i:i + 65536]):
+                rec.on_all_trade(c)
+        rec.close()
+        t_pipeline = time.perf_counter() - t0
+
+        tape = TradeTape(os.path.join(root, "b"))
+        day = tape.days()[0]
+        start = int(QuikPy.tz_msk.localize(datetime(2025, 12, 1, 12)).timestamp()) * 1_000_000  # 12:00 MSK, whatever the host zone
+        t0 = time.perf_counter()
+        seg = tape.read(day, "SPBFUT", start=start, end=start + 3600 * 1_000_000, sec_code="SiZ5")
+        t_read = time.perf_counter() - t0
+
+        reply = json.dumps({"data": trades, "id": 1, "cmd": "get_all_trade", "t": ""}).encode("cp1251")
+        t0 = time.perf_counter()
+        json.loads(reply.decode("cp1251"))
+        t_json = time.perf_counter() - t0
+
+        size = os.path.getsize(os.path.join(root, "b", str(day), "SPBFUT.bin"))
+        print(f"trades   {args.trades:,}   segment {size / 1e6:.1f} MB   JSON {len(reply) / 1e6:.1f} MB")
+        print(f"record   {rate(args.trades, t_record)}")
+        print(f"pipeline {rate(args.trades, t_pipeline)}   ({args.trades / t_pipeline / args.peak:.1f}x the {args.peak:,}/s peak)")
+        print(f"read     {t_read * 1e3:10.2f} ms  ({len(seg):,} SiZ5 trades in one hour)")
+        print(f"json     {t_json * 1e3:10.2f} ms  (parsing the whole day as one reply)")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
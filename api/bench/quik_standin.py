@@ -0,0 +1,492 @@
+# -*- coding: utf-8 -*-
+"""asyncio stand‑in for a QUIK terminal running the QUIK# Lua scripts.
+
+Speaks the QUIK# protocol — newline‑delimited JSON in cp1251, requests and
+replies on one port, callbacks pushed on the other — so QuikPy and the
+screener (``USE_QUIK=1``) run on Linux without a terminal.
+
+Every instrument that is asked for exists: its price, lot, step and margin
+are derived from the code, so the screener's futures codes resolve without
+configuration.  ``--universe`` names the instruments that trade on their own
+(OnAllTrade) and may override their parameters.  Prices random‑walk as
+callbacks are pushed:
+
+* ``OnParam`` for instruments ordered with ``paramRequest[Bulk]``;
+* ``OnQuote`` for instruments subscribed with ``Subscribe_Level_II_Quotes``;
+* ``OnAllTrade`` for the universe.
+
+``get_all_trades`` returns a tape of ``--all-trades`` rows and
+``get_candles`` treats the chart tag as a TQBR code.
+
+Requests on one connection are answered in order, like the Lua scripts, each
+after ``--latency`` seconds plus ``--param-latency`` per parameter read plus
+up to ``--jitter`` seconds.
+
+    python -m bench.quik_standin [--requests-port 34130] [--callbacks-port 34131]
+        [--universe universe.json] [--callback-rate 1000] [--latency 0.001]
+
+A universe file maps class codes to instruments, either a list of codes or
+codes mapped to parameter overrides::
+
+    {"TQBR": ["SBER", "GAZP"], "SPBFUT": {"SRZ5": {"LAST": 31000}}}
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger("QuikStandIn")
+
+ENCODING = "cp1251"
+LINE_LIMIT = 64 * 1024 * 1024
+SYMBOLS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "symbols.json")
+
+
+class Instrument:
+    """Synthetic parameters of one ``class_code|sec_code``."""
+
+    def __init__(self, class_code: str, sec_code: str, overrides: Optional[Dict[str, Any]] = None) -> None:
+        self.class_code = class_code
+        self.sec_code = sec_code
+        seed = zlib.crc32(f"{class_code}|{sec_code}".encode())
+        future = class_code == "SPBFUT"
+        if future:
+            self.step, self.scale, self.lot, self.step_price = 1.0, 0, 1, 1.0
+            base = 10_000 + seed % 90_000
+        else:
+            self.step, self.scale, self.lot, self.step_price = 0.01, 2, 10, 0.01
+            base = 10 + seed % 990 + (seed >> 10) % 100 / 100
+        self.last = round(base / self.step) * self.step
+        self.volume = 0
+        self.mat_date = (date.today() + timedelta(days=30 + seed % 150)).strftime("%d%m%Y")
+        self.future = future
+        self.overrides = {k.upper(): v for k, v in (overrides or {}).items()}
+        if "LAST" in self.overrides:
+            self.last = float(self.overrides["LAST"])
+
+    def tick(self, rnd: random.Random) -> None:
+        self.last = max(self.step, self.last + rnd.choice((-1, 0, 0, 1)) * self.step)
+        self.volume += 1
+
+    def fmt(self, value: float) -> str:
+        return f"{value:.{self.scale}f}"
+
+    def param(self, name: str) -> Dict[str, str]:
+        """getParamEx2 reply."""
+        name = name.upper()
+        values = {
+            "LAST": self.fmt(self.last),
+            "BID": self.fmt(self.last - self.step),
+            "OFFER": self.fmt(self.last + self.step),
+            "LOTSIZE": str(self.lot),
+            "SEC_PRICE_STEP": self.fmt(self.step),
+            "MINSTEP": self.fmt(self.step),
+            "SEC_SCALE": str(self.scale),
+            "STEPPRICE": f"{self.step_price:g}",
+            "VOLTODAY": str(self.volume),
+        }
+        if self.future:
+            values["INITIAL_MARGIN"] = f"{self.last * 0.15:.2f}"
+            values["MAT_DATE"] = self.mat_date
+        if name in self.overrides:
+            values[name] = str(self.overrides[name])
+        if name not in values:
+            return {"param_type": "0", "param_value": "", "param_image": "", "result": "0"}
+        value = values[name]
+        return {"param_type": "1" if name != "MAT_DATE" else "3", "param_value": value,
+                "param_image": value.replace(".", ","), "result": "1"}
+
+    def security_info(self) -> Dict[str, Any]:
+        """getSecurityInfo reply."""
+        return {"class_code": self.class_code, "code": self.sec_code, "name": self.sec_code, "short_name": self.sec_code,
+                "lot_size": self.lot, "min_price_step": self.step, "scale": self.scale, "face_value": 1.0,
+                "face_unit": "SUR", "mat_date": int(self.mat_date[4:] + self.mat_date[2:4] + self.mat_date[:2]) if self.future else 0}
+
+    def level2(self, depth: int, rnd: random.Random) -> Dict[str, Any]:
+        """GetQuoteLevel2 reply / OnQuote data.  Both sides ascending by price,
+        as QUIK lists them."""
+        bids = [{"price": self.fmt(self.last - self.step * (depth - i)), "quantity": str(rnd.randint(1, 500))} for i in range(depth)]
+        offers = [{"price": self.fmt(self.last + self.step * (i + 1)), "quantity": str(rnd.randint(1, 500))} for i in range(depth)]
+        return {"class_code": self.class_code, "sec_code": self.sec_code, "server_time": time.strftime("%H:%M:%S"),
+                "bid_count": str(depth), "offer_count": str(depth), "bid": bids, "offer": offers}
+
+    def candles(self, interval: int, count: int) -> List[Dict[str, Any]]:
+        """Flat history ending now, one bar per ``interval`` minutes."""
+        count = count or 500
+        step = max(interval, 1) * 60
+        end = int(time.time()) // step * step
+        out = []
+        for i in range(count):
+            t = time.localtime(end - (count - 1 - i) * step)
+            out.append({"open": self.last, "high": self.last + self.step, "low": self.last - self.step, "close": self.last,
+                        "volume": 1, "sec": self.sec_code, "class": self.class_code, "interval": interval,
+                        "datetime": {"year": t.tm_year, "month": t.tm_mon, "day": t.tm_mday, "week_day": t.tm_wday,
+                                     "hour": t.tm_hour, "min": t.tm_min, "sec": t.tm_sec, "ms": 0, "count": 0}})
+        return out
+
+
+class QuikStandIn:
+    """QUIK# protocol server over a synthetic market.
+
+    Run it with :meth:`serve` inside an event loop, or with :meth:`start`
+    on a background thread (returns the bound ports) and :meth:`stop`.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        requests_port: int = 34130,
+        callbacks_port: int = 34131,
+        universe: Optional[Dict[str, Any]] = None,
+        latency: float = 0.0,
+        param_latency: float = 0.0,
+        jitter: float = 0.0,
+        callback_rate: float = 0.0,
+        depth: int = 20,
+        seed: int = 1,
+        all_trades: int = 10_000,
+    ) -> None:
+        self.host = host
+        self.requests_port = requests_port
+        self.callbacks_port = callbacks_port
+        self.latency = latency
+        self.param_latency = param_latency
+        self.jitter = jitter
+        self.callback_rate = callback_rate
+        self.depth = depth
+        self.all_trades = all_trades
+        self._tapes: Dict[str, List[Dict[str, Any]]] = {}
+        self.rnd = random.Random(seed)
+        self.instruments: Dict[Tuple[str, str], Instrument] = {}
+        self.universe: List[Instrument] = []
+        for class_code, codes in (universe or {}).items():
+            items = codes.items() if isinstance(codes, dict) else ((c, None) for c in codes)
+            for sec_code, overrides in items:
+                inst = self.instruments[(class_code, sec_code)] = Instrument(class_code, sec_code, overrides)
+                self.universe.append(inst)
+        self.param_requests: Set[Tuple[str, str]] = set()
+        self.level2: Set[Tuple[str, str]] = set()
+        self.candle_subs: Set[Tuple[str, str, int]] = set()
+        self.callback_writers: Set[asyncio.StreamWriter] = set()
+        self.requests = Counter()
+        self.callbacks = Counter()
+        self.trade_num = 0
+        self.commands: Dict[str, Callable[[Any], Tuple[Any, int]]] = {
+            "ping": lambda data: ("Pong", 0),
+            "echo": lambda data: (data, 0),
+            "isConnected": lambda data: (1, 0),
+            "is_quik": lambda data: (1, 0),
+            "getInfoParam": lambda data: (self._info_param(data), 0),
+            "getClassesList": lambda data: (",".join(sorted({c for c, _ in self.instruments} | {"TQBR", "SPBFUT"})) + ",", 0),
+            "getClassSecurities": lambda data: (",".join(s for c, s in self.instruments if c == data) + ",", 0),
+            "getSecurityClass": lambda data: (self._security_class(data), 0),
+            "getSecurityInfo": lambda data: (self.instrument(*data.split("|")[:2]).security_info(), 0),
+            "getSecurityInfoBulk": lambda data: ([self.instrument(*s.split("|")[:2]).security_info() for s in data], 0),
+            "getParamEx": lambda data: (self._param(data), 1),
+            "getParamEx2": lambda data: (self._param(data), 1),
+            "getParamEx2Bulk": lambda data: ([self._param(s) for s in data], len(data)),
+            "paramRequest": lambda data: (self._order(self.param_requests, (data,), True), 0),
+            "paramRequestBulk": lambda data: (self._order(self.param_requests, data, True), 0),
+            "cancelParamRequest": lambda data: (self._order(self.param_requests, (data,), False), 0),
+            "cancelParamRequestBulk": lambda data: (self._order(self.param_requests, data, False), 0),
+            "GetQuoteLevel2": lambda data: (self.instrument(*data.split("|")[:2]).level2(self.depth, self.rnd), 0),
+            "Subscribe_Level_II_Quotes": lambda data: (self._order(self.level2, (data,), True)[0], 0),
+            "Unsubscribe_Level_II_Quotes": lambda data: (self._order(self.level2, (data,), False)[0], 0),
+            "IsSubscribed_Level_II_Quotes": lambda data: (tuple(data.split("|")[:2]) in self.level2, 0),
+            "get_candles_from_data_source": lambda data: (self._candles(data), 0),
+            "get_candles": lambda data: (self._chart_candles(data), 0),
+            "get_all_trades": lambda data: (self._all_trades(data), 0),
+            "subscribe_to_candles": lambda data: (self._candle_sub(data, True), 0),
+            "unsubscribe_from_candles": lambda data: (self._candle_sub(data, False), 0),
+            "is_subscribed": lambda data: (self._candle_key(data) in self.candle_subs, 0),
+            "getTradeAccounts": lambda data: ([], 0),
+            "getClientCodes": lambda data: ([], 0),
+            "getMoneyLimits": lambda data: ([], 0),
+            "getFuturesClientLimits": lambda data: ([], 0),
+            "get_depo_limits": lambda data: ([], 0),
+        }
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._servers: List[asyncio.AbstractServer] = []
+        self._ready = threading.Event()
+        self._stopped: Optional[asyncio.Event] = None
+
+    # -- market ------------------------------------------------------------
+    def instrument(self, class_code: str, sec_code: str) -> Instrument:
+        inst = self.instruments.get((class_code, sec_code))
+        if inst is None:
+            inst = self.instruments[(class_code, sec_code)] = Instrument(class_code, sec_code)
+        return inst
+
+    def _param(self, spec: str) -> Dict[str, str]:
+        class_code, sec_code, name = spec.split("|")[:3]
+        return self.instrument(class_code, sec_code).param(name)
+
+    def _order(self, subs: Set[Tuple[str, str]], specs: Iterable[str], add: bool) -> List[bool]:
+        out = []
+        for spec in specs:
+            key = tuple(spec.split("|")[:2])
+            self.instrument(*key)
+            (subs.add if add else subs.discard)(key)
+            out.append(True)
+        return out
+
+    @staticmethod
+    def _candle_key(data: str) -> Tuple[str, str, int]:
+        class_code, sec_code, interval = data.split("|")[:3]
+        return class_code, sec_code, int(interval)
+
+    def _candles(self, data: str) -> List[Dict[str, Any]]:
+        parts = data.split("|")
+        class_code, sec_code, interval = self._candle_key(data)
+        count = int(parts[4]) if len(parts) > 4 and parts[4] else 0
+        return self.instrument(class_code, sec_code).candles(interval, count)
+
+    def _candle_sub(self, data: str, add: bool) -> str:
+        key = self._candle_key(data)
+        (self.candle_subs.add if add else self.candle_subs.discard)(key)
+        return ""
+
+    def _security_class(self, data: str) -> str:
+        classes, sec_code = data.split("|")[:2]
+        for class_code in classes.split(","):
+            if (class_code, sec_code) in self.instruments:
+                return class_code
+        return ""
+
+    @staticmethod
+    def _info_param(name: str) -> str:
+        return {"SERVERTIME": time.strftime("%H:%M:%S"), "TRADEDATE": time.strftime("%d.%m.%Y"),
+                "VERSION": "standin", "CONNECTION": "установлено", "ISCONNECTED": "1"}.get(str(name).upper(), "")
+
+    def _callback(self) -> Optional[Dict[str, Any]]:
+        """Pick and build one callback; ``None`` when nothing is subscribed."""
+        kinds = []
+        if self.param_requests:
+            kinds.append("OnParam")
+        if self.level2:
+            kinds.append("OnQuote")
+        if self.universe:
+            kinds.append("OnAllTrade")
+        if not kinds:
+            return None
+        kind = self.rnd.choice(kinds)
+        if kind == "OnParam":
+            inst = self.instrument(*self.rnd.choice(tuple(self.param_requests)))
+            inst.tick(self.rnd)
+            return {"cmd": kind, "data": {"class_code": inst.class_code, "sec_code": inst.sec_code}}
+        if kind == "OnQuote":
+            inst = self.instrument(*self.rnd.choice(tuple(self.level2)))
+            inst.tick(self.rnd)
+            return {"cmd": kind, "data": inst.level2(self.depth, self.rnd)}
+        inst = self.rnd.choice(self.universe)
+        inst.tick(self.rnd)
+        return {"cmd": kind, "data": self._trade(inst, time.time())}
+
+    def _trade(self, inst: Instrument, now: float) -> Dict[str, Any]:
+        """One all_trades row of ``inst`` at ``now``."""
+        self.trade_num += 1
+        t = time.localtime(now)
+        mcs = int(now % 1 * 1_000_000)
+        qty = self.rnd.randint(1, 100)
+        return {
+            "trade_num": self.trade_num, "flags": self.rnd.choice((1025, 1026)), "price": inst.last, "qty": qty,
+            "value": inst.last * qty * inst.lot, "sec_code": inst.sec_code, "class_code": inst.class_code,
+            "open_interest": 0, "period": 1, "exchange_code": "",
+            "datetime": {"year": t.tm_year, "month": t.tm_mon, "day": t.tm_mday, "week_day": t.tm_wday, "hour": t.tm_hour,
+                         "min": t.tm_min, "sec": t.tm_sec, "ms": mcs // 1000, "mcs": mcs}}
+
+    def _all_trades(self, data: str) -> List[Dict[str, Any]]:
+        """The day's tape: ``all_trades`` rows spread over the universe (or
+        one instrument for ``class|sec``), built once and reused."""
+        key = data or ""
+        tape = self._tapes.get(key)
+        if tape is None:
+            insts = [self.instrument(*key.split("|")[:2])] if key else (self.universe or [self.instrument("TQBR", "SBER")])
+            start = time.time() - 36_000
+            tape = self._tapes[key] = [self._trade(insts[i % len(insts)], start + i * 36_000 / self.all_trades)
+                                       for i in range(self.all_trades)]
+        return tape
+
+    def _chart_candles(self, data: str) -> List[Dict[str, Any]]:
+        """get_candles by chart tag: the tag names a TQBR instrument."""
+        tag, _line, _first, count = data.split("|")[:4]
+        return self.instrument("TQBR", tag).candles(1, int(count or 0))
+
+    def push_raw(self, data: bytes) -> None:
+        """Write pre‑encoded callback lines to every callback connection
+        (thread‑safe); for flood benchmarks."""
+        def push() -> None:
+            for writer in list(self.callback_writers):
+                writer.write(data)
+        self._loop.call_soon_threadsafe(push)
+
+    # -- protocol ----------------------------------------------------------
+    @staticmethod
+    def _encode(msg: Dict[str, Any]) -> bytes:
+        return json.dumps(msg, ensure_ascii=False, separators=(",", ":")).encode(ENCODING) + b"\n"
+
+    async def _serve_requests(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:  # a line over LINE_LIMIT; the reader has skipped it
+                    logger.warning("request line over %d bytes dropped", LINE_LIMIT)
+                    continue
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    msg = json.loads(line.decode(ENCODING))
+                    if not isinstance(msg, dict):
+                        raise ValueError(f"not an object: {type(msg).__name__}")
+                except ValueError as e:  # load tests send bad frames on purpose: skip the line, keep the connection
+                    logger.warning("malformed request dropped: %s", e)
+                    continue
+                cmd = msg.get("cmd")
+                self.requests[cmd] += 1
+                handler = self.commands.get(cmd)
+                params = 0
+                if handler is None:
+                    msg["cmd"], msg["data"] = "lua_error", f"Command not implemented by the stand-in: {cmd}"
+                else:
+                    try:
+                        msg["data"], params = handler(msg.get("data"))
+                    except Exception as e:  # a bad request must not kill the connection
+                        msg["cmd"], msg["data"] = "lua_error", f"{cmd}: {e!r}"
+                delay = self.latency + params * self.param_latency + (self.rnd.uniform(0, self.jitter) if self.jitter else 0)
+                if delay:
+                    await asyncio.sleep(delay)
+                writer.write(self._encode(msg))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _serve_callbacks(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.callback_writers.add(writer)
+        try:
+            while await reader.read(65536):  # QUIK# ignores anything sent here
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.callback_writers.discard(writer)
+            writer.close()
+
+    async def _pump(self) -> None:
+        """Push ``callback_rate`` callbacks per second to every callback
+        connection, in 10 ms batches."""
+        period = 0.01
+        owed = 0.0
+        while True:
+            await asyncio.sleep(period)
+            if not self.callback_rate or not self.callback_writers:
+                owed = 0.0
+                continue
+            owed += self.callback_rate * period
+            n, owed = int(owed), owed - int(owed)
+            batch = bytearray()
+            for _ in range(n):
+                msg = self._callback()
+                if msg is None:
+                    break
+                msg["t"] = int(time.time() * 1000)
+                self.callbacks[msg["cmd"]] += 1
+                batch += self._encode(msg)
+            if not batch:
+                continue
+            for writer in list(self.callback_writers):
+                writer.write(batch)
+            await asyncio.gather(*(w.drain() for w in list(self.callback_writers)), return_exceptions=True)
+
+    async def serve(self) -> None:
+        """Listen and serve until :meth:`stop`."""
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._servers = [
+            # bulk requests are single lines of megabytes
+            await asyncio.start_server(self._serve_requests, self.host, self.requests_port, limit=LINE_LIMIT),
+            await asyncio.start_server(self._serve_callbacks, self.host, self.callbacks_port),
+        ]
+        self.requests_port = self._servers[0].sockets[0].getsockname()[1]
+        self.callbacks_port = self._servers[1].sockets[0].getsockname()[1]
+        pump = asyncio.ensure_future(self._pump())
+        self._ready.set()
+        logger.info("QUIK# stand-in on %s:%d/%d", self.host, self.requests_port, self.callbacks_port)
+        try:
+            await self._stopped.wait()
+        finally:
+            pump.cancel()
+            for server in self._servers:
+                server.close()
+            for writer in list(self.callback_writers):
+                writer.close()
+
+    def start(self) -> Tuple[int, int]:
+        """Serve on a background thread; returns ``(requests_port, callbacks_port)``.
+        Pass port 0 to bind free ports."""
+        self._thread = threading.Thread(target=lambda: asyncio.run(self.serve()), name="QuikStandIn", daemon=True)
+        self._thread.start()
+        self._ready.wait(5)
+        return self.requests_port, self.callbacks_port
+
+    def stop(self) -> None:
+        if self._loop is not None and self._stopped is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"requests": dict(self.requests), "callbacks": dict(self.callbacks), "instruments": len(self.instruments)}
+
+
+def load_universe(path: Optional[str]) -> Dict[str, Any]:
+    """Universe file, or the screener's shares on TQBR."""
+    if path:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    try:
+        with open(SYMBOLS_FILE, encoding="utf-8") as f:
+            return {"TQBR": json.load(f)}
+    except (OSError, ValueError):
+        return {}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--requests-port", type=int, default=34130)
+    ap.add_argument("--callbacks-port", type=int, default=34131)
+    ap.add_argument("--universe", help="JSON file: {class_code: [sec_code, ...] | {sec_code: {PARAM: value}}}")
+    ap.add_argument("--callback-rate", type=float, default=100.0, help="callbacks per second")
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    ap.add_argument("--param-latency", type=float, default=0.0, help="extra seconds per parameter read")
+    ap.add_argument("--jitter", type=float, default=0.0, help="random extra seconds per request, up to")
+    ap.add_argument("--depth", type=int, default=20, help="order book levels per side")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--all-trades", type=int, default=10_000, help="rows returned by get_all_trades")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    server = QuikStandIn(args.host, args.requests_port, args.callbacks_port, load_universe(args.universe),
+                         args.latency, args.param_latency, args.jitter, args.callback_rate, args.depth, args.seed, args.all_trades)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+# Local QUIK candle history: one memory‑mapped file per column
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from QuikPy import QuikPy
+
+logger = logging.getLogger("CandleStore")
+
+# column -> dtype; ``time`` is UTC epoch seconds of the bar open
+COLUMNS: Dict[str, np.dtype] = {
+    "time": np.dtype("<i8"),
+    "open": np.dtype("<f8"),
+    "high": np.dtype("<f8"),
+    "low": np.dtype("<f8"),
+    "close": np.dtype("<f8"),
+    "volume": np.dtype("<f8"),
+}
+
+# Candle intervals QUIK serves, in minutes (tick data, 0, is not stored)
+INTERVALS = frozenset((1, 2, 3, 4, 5, 6, 10, 15, 20, 30, 60, 120, 240, 1440, 10080, 23200))
+
+
+def candle_time(dt: dict) -> int:
+    """UTC epoch seconds of a QUIK# candle ``datetime`` (Moscow time)."""
+    naive = datetime(dt["year"], dt["month"], dt["day"], dt.get("hour", 0), dt.get("min", 0), dt.get("sec", 0))
+    return int(QuikPy.tz_msk.localize(naive).timestamp())
+
+
+class CandleSeries:
+    """Candles of one ``(class_code, sec_code, interval)`` in ``path``.
+
+    Each column is a raw little‑endian file that only grows, mapped with
+    ``np.memmap``.  Reads return views of the mapping, so slicing a year of
+    bars copies nothing.  Views handed out earlier stay valid after appends;
+    they just do not see the new bars.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._maps: Dict[str, np.memmap] = {}
+        self._len = 0
+        os.makedirs(path, exist_ok=True)
+        sizes = []
+        for name, dtype in COLUMNS.items():
+            file = self._file(name)
+            if not os.path.exists(file):
+                open(file, "wb").close()
+            sizes.append(os.path.getsize(file) // dtype.itemsize)
+        n = min(sizes)
+        if max(sizes) != n:
+            # an append was interrupted: drop the bar that is not in every column
+            logger.warning("%s: truncating columns to %d bars", path, n)
+            for name, dtype in COLUMNS.items():
+                os.truncate(self._file(name), n * dtype.itemsize)
+        self._remap(n)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _remap(self, n: int) -> None:
+        self._len = n
+        self._maps = {
+            name: np.memmap(self._file(name), dtype=dtype, mode="r+", shape=(n,)) if n else np.empty(0, dtype)
+            for name, dtype in COLUMNS.items()
+        }
+
+    def __len__(self) -> int:
+        return self._len
+
+    @property
+    def last_time(self) -> Optional[int]:
+        maps = self._maps
+        return int(maps["time"][-1]) if len(maps["time"]) else None
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """All bars, column name -> read‑only view."""
+        out = {}
+        for name, arr in self._maps.items():
+            view = arr.view()
+            view.flags.writeable = False
+            out[name] = view
+        return out
+
+    def slice(self, start: Optional[int] = None, end: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Bars with ``start <= time < end`` (epoch seconds) as views."""
+        cols = self.columns()
+        times = cols["time"]
+        lo = 0 if start is None else int(np.searchsorted(times, start, "left"))
+        hi = len(times) if end is None else int(np.searchsorted(times, end, "left"))
+        return {name: arr[lo:hi] for name, arr in cols.items()}
+
+    def merge(self, bars: Dict[str, np.ndarray]) -> int:
+        """Add bars sorted by time.  Bars older than the last stored one are
+        ignored, one with the same time replaces it (a bar that was still
+        forming).  Returns the number of appended bars."""
+        times = np.asarray(bars["time"], COLUMNS["time"])
+        if not len(times):
+            return 0
+        with self._lock:
+            last = self.last_time
+            if last is not None:
+                same = times == last
+                if same.any():
+                    i = int(np.flatnonzero(same)[-1])
+                    for name in COLUMNS:
+                        self._maps[name][-1] = bars[name][i]
+                keep = times > last
+            else:
+                keep = np.ones(len(times), bool)
+            if not keep.any():
+                return 0
+            for name, dtype in COLUMNS.items():
+                with open(self._file(name), "ab") as f:
+                    f.write(np.ascontiguousarray(np.asarray(bars[name])[keep], dtype).tobytes())
+            added = int(keep.sum())
+            self._remap(self._len + added)
+            return added
+
+    def flush(self) -> None:
+        for arr in self._maps.values():
+            if isinstance(arr, np.memmap):
+                arr.flush()
+
+
+def _bars(candles: Iterable[dict]) -> Dict[str, np.ndarray]:
+    """QUIK# candles -> columns sorted by time."""
+    rows: List[Tuple[int, float, float, float, float, float]] = [
+        (candle_time(c["datetime"]), c["open"], c["high"], c["low"], c["close"], c["volume"]) for c in candles
+    ]
+    rows.sort(key=lambda r: r[0])
+    if not rows:
+        return {name: np.empty(0, dtype) for name, dtype in COLUMNS.items()}
+    cols = list(zip(*rows))
+    return {name: np.asarray(col, dtype) for (name, dtype), col in zip(COLUMNS.items(), cols)}
+
+
+class CandleStore:
+    """Candle series under ``root``, one directory per
+    ``(class_code, sec_code, interval)``.
+
+    :meth:`backfill` asks QUIK only for bars newer than the last stored one
+    and :meth:`on_new_candle` (a QuikPy ``on_new_candle`` handler) merges
+    live bars.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self._series: Dict[Tuple[str, str, int], CandleSeries] = {}
+        self._lock = threading.Lock()
+
+    def series(self, class_code: str, sec_code: str, interval: int) -> CandleSeries:
+        """Series of the key, opened on first use.  ``ValueError`` for an
+        interval not in :data:`INTERVALS` or codes that would leave ``root``."""
+        key = (class_code, sec_code, int(interval))
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = CandleSeries(self._path(*key))
+            return s
+
+    def _path(self, class_code: str, sec_code: str, interval: int) -> str:
+        if interval not in INTERVALS:
+            raise ValueError(f"unsupported candle interval {interval}")
+        root = os.path.realpath(self.root)
+        path = os.path.realpath(os.path.join(root, class_code, sec_code, str(interval)))
+        if os.path.dirname(os.path.dirname(os.path.dirname(path))) != root:
+            raise ValueError(f"bad candle series {class_code}.{sec_code}")
+        return path
+
+    def backfill(self, qp: QuikPy, class_code: str, sec_code: str, interval: int) -> int:
+        """Load missing bars from QUIK.  An empty series gets the whole
+        history; otherwise the request asks for as many trailing bars as fit
+        since the last stored bar and widens until it overlaps.  Returns the
+        number of appended bars."""
+        s = self.series(class_code, sec_code, interval)
+        last = s.last_time
+        count = 0
+        if last is not None and interval > 0:
+            count = max(2, math.ceil((time.time() - last) / (interval * 60)) + 2)
+        while True:
+            candles = qp.get_candles_from_data_source(class_code, sec_code, interval, count=count).get("data") or []
+            bars = _bars(candles)
+            if count == 0 or not len(bars["time"]) or bars["time"][0] <= last or len(bars["time"]) < count:
+                break
+            count *= 2  # the reply does not reach the stored bars yet
+        return s.merge(bars)
+
+    def on_new_candle(self, data: dict) -> None:
+        """QUIK# NewCandle handler."""
+        c = data.get("data") or {}
+        try:
+            s = self.series(c["class"], c["sec"], c["interval"])
+        except (KeyError, TypeError, ValueError):
+            return
+        s.merge(_bars((c,)))
+
+    def flush(self) -> None:
+        with self._lock:
+            series = list(self._series.values())
+        for s in series:
+            s.flush()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# Daily index of futures contracts on the board: root -> expiries -> SECID
+import json
+import logging
+import os
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("ContractIndex")
+
+# One contract: (expiration ISO date, SECID, SHORTNAME)
+Contract = Tuple[str, str, str]
+
+
+def _exp_date(value: str) -> date:
+    try:
+        return datetime.fromisoformat(value).date()
+    except (TypeError, ValueError):
+        return date.max
+
+
+class ContractIndex:
+    """Futures contracts of one trading day, grouped by root.
+
+    :meth:`build` takes the whole board listing once a day; contracts are
+    grouped by ``ASSETCODE`` and sorted by expiration.  :meth:`resolve`
+    picks the contract for a root and caches the answer for the day, so
+    the refresh loop never scans the listing.  The index is saved to
+    ``path`` (JSON, atomic replace) and loaded on start, so a restart
+    during the day does not download the listing again.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self.day = 0  # trading day of the listing, YYYYMMDD
+        self.roots: Dict[str, List[Contract]] = {}
+        self._matched: Dict[str, List[Contract]] = {}
+        self._resolved: Dict[Tuple[str, int, int], Optional[str]] = {}
+        if path:
+            self.load()
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self.roots.values())
+
+    def build(self, rows: Iterable[Tuple[str, Optional[str], Optional[str], Optional[str]]], day: int) -> None:
+        """Replace the index with ``(secid, shortname, assetcode, expiration)`` rows."""
+        roots: Dict[str, List[Contract]] = {}
+        for secid, shortname, asset, exp in rows:
+            if not isinstance(secid, str):
+                continue
+            roots.setdefault(asset or "", []).append((str(exp or ""), secid, shortname or ""))
+        for contracts in roots.values():
+            contracts.sort(key=lambda c: (_exp_date(c[0]), c[1]))
+        self.roots, self.day = roots, day
+        self._matched.clear()
+        self._resolved.clear()
+
+    def contracts(self, root: str) -> List[Contract]:
+        """Contracts of ``root`` sorted by expiration.  A root that is not an
+        asset code matches SECID or SHORTNAME prefixes, like the board query."""
+        found = self.roots.get(root)
+        if found is None:
+            found = self._matched.get(root)
+            if found is None:
+                found = self._matched[root] = sorted(
+                    (c for v in self.roots.values() for c in v if c[1].startswith(root) or c[2].startswith(root)),
+                    key=lambda c: (_exp_date(c[0]), c[1]))
+        return found
+
+    def resolve(self, root: str, year_dec: int, today: date) -> Optional[str]:
+        """SECID of the December ``year_dec`` contract of ``root``, else of the
+        nearest contract not yet expired, else of the first listed."""
+        key = (root, year_dec, today.toordinal())
+        if key in self._resolved:
+            return self._resolved[key]
+        contracts = self.contracts(root)
+        suffix = f"-12.{str(year_dec)[-2:]}"
+        best = next((c[1] for c in contracts if c[1].endswith(suffix) or c[2].endswith(suffix)), None)
+        if best is None and contracts:
+            best = next((c[1] for c in contracts if _exp_date(c[0]) >= today), contracts[0][1])
+        self._resolved[key] = best
+        return best
+
+    def load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            roots = {root: [tuple(c) for c in contracts] for root, contracts in data["roots"].items()}
+            day = int(data["day"])
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, TypeError, KeyError, AttributeError) as e:
+            logger.warning("contract index %s not loaded: %s", self.path, e)
+            return
+        self.roots, self.day = roots, day
+        self._matched.clear()
+        self._resolved.clear()
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"day": self.day, "roots": self.roots}, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning("contract index %s not saved: %s", self.path, e)
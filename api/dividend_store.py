@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# On‑disk dividend calendar shared by the ISS and QUIK providers
+import logging
+import sqlite3
+import threading
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("DividendStore")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dividends (
+    secid TEXT NOT NULL,
+    ex_date TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (secid, ex_date)
+);
+CREATE TABLE IF NOT EXISTS fetched (
+    secid TEXT PRIMARY KEY,
+    ts REAL NOT NULL
+);
+"""
+
+
+class DividendStore:
+    """Dividend history of every security in one SQLite file.
+
+    :meth:`put` merges a freshly downloaded history into the stored one
+    (new dates are added, changed values updated, nothing is dropped) and
+    records when the security was fetched; :meth:`stale` tells which
+    securities are due for another download.  ``path=None`` keeps the
+    store in memory.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+            self._db.executescript(_SCHEMA)
+        except sqlite3.DatabaseError as e:
+            logger.warning("dividend store %s not opened, keeping it in memory: %s", path, e)
+            self._db = sqlite3.connect(":memory:", check_same_thread=False)
+            self._db.executescript(_SCHEMA)
+
+    def put(self, secid: str, history: Iterable[Tuple[str, Optional[float]]], ts: float) -> None:
+        """Merge ``(ex_date ISO, value)`` rows of ``secid`` fetched at ``ts``."""
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT INTO dividends (secid, ex_date, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (secid, ex_date) DO UPDATE SET value = excluded.value",
+                [(secid, d, v) for d, v in history])
+            self._db.execute("INSERT OR REPLACE INTO fetched (secid, ts) VALUES (?, ?)", (secid, ts))
+
+    def history(self, secid: str) -> List[Tuple[str, Optional[float]]]:
+        with self._lock:
+            return self._db.execute("SELECT ex_date, value FROM dividends WHERE secid = ? ORDER BY ex_date",
+                                    (secid,)).fetchall()
+
+    def fetched(self) -> Dict[str, float]:
+        """When each security was last downloaded."""
+        with self._lock:
+            return dict(self._db.execute("SELECT secid, ts FROM fetched").fetchall())
+
+    def stale(self, secids: Iterable[str], now: float, ttl: float) -> List[str]:
+        fetched = self.fetched()
+        return [s for s in secids if now - fetched.get(s, 0.0) > ttl]
+
+    def next_dividends(self, secids: Iterable[str], today: date) -> Dict[str, dict]:
+        """The nearest dividend on or after ``today`` of each security:
+        ``{"ex_date", "value", "ts"}``, with ``None`` values when nothing is
+        scheduled.  ``ts`` is when the history was fetched; securities
+        never fetched are absent."""
+        secids = list(secids)
+        fetched = self.fetched()
+        out = {s: {"ex_date": None, "value": None, "ts": fetched[s]} for s in secids if s in fetched}
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT secid, MIN(ex_date), value FROM dividends WHERE ex_date >= ? GROUP BY secid",
+                (today.isoformat(),)).fetchall()
+        for secid, ex_date, value in rows:
+            if secid in out:
+                out[secid].update(ex_date=ex_date, value=value)
+        return out
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+# Long‑lived pooled HTTP client for MOEX ISS
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from single_flight import AsyncSingleFlight
+
+logger = logging.getLogger("IssClient")
+
+try:
+    import h2  # noqa: F401  (HTTP/2 support of httpx)
+    HAVE_HTTP2 = True
+except ImportError:
+    HAVE_HTTP2 = False
+
+
+# Statuses worth another attempt: rate limiting and server side failures
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+
+class IssUnavailableError(Exception):
+    """ISS is considered down: the circuit breaker is open."""
+
+
+def endpoint_name(url: str) -> str:
+    """Group ISS URLs by endpoint, without the tickers in them:
+    ``futures/securities``, ``stock/securities``, ``futures/orderbook``,
+    ``dividends`` and so on."""
+    parts = urlsplit(url).path.strip("/").split("/")
+    last = parts[-1].rsplit(".", 1)[0] if parts else ""
+    engine = parts[parts.index("engines") + 1] if "engines" in parts[:-1] else ""
+    return f"{engine}/{last}" if engine else last
+
+
+class CircuitBreaker:
+    """Opens after ``failures`` consecutive failures and rejects calls for
+    ``reset_sec`` seconds; then lets one probe through (half‑open) and
+    closes on its success."""
+
+    def __init__(self, failures: int = 5, reset_sec: float = 30.0) -> None:
+        self.failures = failures
+        self.reset_sec = reset_sec
+        self.consecutive = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.opens = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_sec else "open"
+
+    def allow(self) -> Optional[bool]:
+        """Admit a call: ``None`` when rejected, otherwise whether the call is
+        the half‑open probe.  Every admitted call must be settled with
+        :meth:`settle`."""
+        state = self.state
+        if state == "closed":
+            return False
+        if state == "half-open" and not self.probing:
+            self.probing = True
+            return True
+        return None
+
+    def settle(self, probe: bool, ok: Optional[bool]) -> None:
+        """Outcome of an admitted call: ``ok=None`` when it ended without
+        telling anything about ISS (cancelled, a local error); a probe that
+        ended so lets the next call probe instead."""
+        if ok is None:
+            if probe:
+                self.probing = False
+        elif ok:
+            self.success()
+        else:
+            self.failure(probe)
+
+    def success(self) -> None:
+        self.consecutive = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failure(self, probe: bool = False) -> None:
+        self.consecutive += 1
+        if probe or self.consecutive >= self.failures:
+            if self.opened_at is None or probe:
+                self.opens += 1
+            self.opened_at = time.monotonic()
+        if probe:
+            self.probing = False
+
+
+class EndpointStats:
+    __slots__ = ("requests", "errors", "retries", "timeouts", "rejected", "latency_total", "latency_max")
+
+    def __init__(self) -> None:
+        self.requests = self.errors = self.retries = self.timeouts = self.rejected = 0
+        self.latency_total = self.latency_max = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests, "errors": self.errors, "retries": self.retries,
+            "timeouts": self.timeouts, "rejected": self.rejected,
+            "latency_avg_ms": round(self.latency_total / self.requests * 1e3, 3) if self.requests else None,
+            "latency_max_ms": round(self.latency_max * 1e3, 3),
+        }
+
+
+class IssClient(httpx.AsyncClient):
+    """An ``httpx.AsyncClient`` meant to live as long as the application.
+
+    Connections to iss.moex.com stay in a keep‑alive pool (``max_connections``,
+    ``max_keepalive``, ``keepalive_expiry``) and, when ``h2`` is installed,
+    requests are multiplexed over HTTP/2.  At most ``per_host`` requests per
+    host are in flight; the rest wait on a semaphore, and that wait is
+    reported by :meth:`stats` together with request, connection and reuse
+    counts.  Being an ``AsyncClient`` it drops into any code that takes one.
+
+    :meth:`get_json` is the resilient fetch on top: at most ``per_endpoint``
+    requests per endpoint, ``retries`` jittered exponential retries of
+    transport errors, timeouts and :data:`RETRY_STATUSES`, an overall
+    ``deadline`` per call, and a :class:`CircuitBreaker` that fails calls
+    fast with :class:`IssUnavailableError` while ISS keeps failing.
+    Concurrent calls for the same URL share one fetch, and its JSON is
+    served again for ``dedup_ttl`` seconds (callers must not modify it).
+    """
+
+    def __init__(self, timeout: float = 10.0, http2: bool = True, max_connections: int = 20,
+                 max_keepalive: int = 10, keepalive_expiry: float = 30.0, per_host: int = 8,
+                 per_endpoint: int = 4, retries: int = 2, backoff: float = 0.25, deadline: Optional[float] = None,
+                 breaker: Optional[CircuitBreaker] = None, dedup_ttl: float = 0.0, **kwargs: Any) -> None:
+        if http2 and not HAVE_HTTP2:
+            logger.warning("h2 is not installed, ISS requests use HTTP/1.1")
+            http2 = False
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                              keepalive_expiry=keepalive_expiry)
+        super().__init__(timeout=timeout, http2=http2, limits=limits, **kwargs)
+        self.http2 = http2
+        self.per_host = per_host
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        self.requests = 0
+        self.errors = 0
+        self.connects = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.time_total = 0.0
+        self.per_endpoint = per_endpoint
+        self.retries = retries
+        self.backoff = backoff
+        self.deadline = deadline if deadline is not None else timeout * (retries + 1)
+        self.breaker = breaker or CircuitBreaker()
+        self._endpoints: Dict[str, asyncio.Semaphore] = {}
+        self.endpoints: Dict[str, EndpointStats] = {}
+        self.flights = AsyncSingleFlight(dedup_ttl)
+
+    async def get_json(self, url: str, deadline: Optional[float] = None) -> Any:
+        """GET ``url`` and decode JSON, with retries, within ``deadline`` seconds.
+
+        Raises :class:`IssUnavailableError` while the breaker is open,
+        ``asyncio.TimeoutError`` past the deadline and ``httpx.HTTPError``
+        once retries are exhausted.
+        """
+        return await self.flights.do(url, lambda: self._fetch_json(url, deadline))
+
+    async def _fetch_json(self, url: str, deadline: Optional[float]) -> Any:
+        name = endpoint_name(url)
+        st = self.endpoints.get(name)
+        if st is None:
+            st = self.endpoints[name] = EndpointStats()
+        probe = self.breaker.allow()
+        if probe is None:
+            st.rejected += 1
+            raise IssUnavailableError(f"ISS circuit open, {name} not requested")
+        ok: Optional[bool] = None
+        try:
+            js = await asyncio.wait_for(self._get_json(url, name, st), self.deadline if deadline is None else deadline)
+            ok = True
+            return js
+        except asyncio.TimeoutError:
+            st.timeouts += 1
+            ok = False
+            raise
+        except httpx.HTTPStatusError as e:
+            ok = e.response.status_code not in RETRY_STATUSES  # a 4xx: ISS answered, the request itself was bad
+            raise
+        except (httpx.HTTPError, ValueError):
+            ok = False
+            raise
+        finally:
+            self.breaker.settle(probe, ok)
+
+    async def _get_json(self, url: str, name: str, st: EndpointStats) -> Any:
+        sem = self._endpoints.get(name)
+        if sem is None:
+            sem = self._endpoints[name] = asyncio.Semaphore(self.per_endpoint)
+        attempt = 0
+        while True:
+            async with sem:
+                t0 = time.perf_counter()
+                try:
+                    r = await self.get(url)
+                except httpx.TransportError:
+                    st.errors += 1
+                    if attempt >= self.retries:
+                        raise
+                    r = None
+                finally:
+                    latency = time.perf_counter() - t0
+                    st.requests += 1
+                    st.latency_total += latency
+                    st.latency_max = max(st.latency_max, latency)
+                if r is not None:
+                    if r.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                        if r.is_error:
+                            st.errors += 1
+                        r.raise_for_status()
+                        return r.json()
+                    st.errors += 1
+            attempt += 1
+            st.retries += 1
+            await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    async def _trace(self, event: str, info: dict) -> None:
+        if event == "connection.connect_tcp.complete":
+            self.connects += 1
+
+    async def send(self, request: httpx.Request, **kwargs: Any) -> httpx.Response:
+        sem = self._hosts.get(request.url.host)
+        if sem is None:
+            sem = self._hosts[request.url.host] = asyncio.Semaphore(self.per_host)
+        request.extensions = {**request.extensions, "trace": self._trace}
+        t0 = time.perf_counter()
+        self.waiting += 1
+        try:
+            await sem.acquire()
+        finally:
+            self.waiting -= 1
+        t1 = time.perf_counter()
+        self.wait_total += t1 - t0
+        self.wait_max = max(self.wait_max, t1 - t0)
+        self.in_flight += 1
+        try:
+            response = await super().send(request, **kwargs)
+            if response.is_error:
+                self.errors += 1
+            return response
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            sem.release()
+            self.in_flight -= 1
+            self.requests += 1
+            self.time_total += time.perf_counter() - t1
+
+    def open_connections(self) -> Optional[int]:
+        """Connections currently in the pool, if the transport exposes them."""
+        pool = getattr(getattr(self, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        return None if connections is None else len(connections)
+
+    def stats(self) -> dict:
+        n = self.requests
+        return {
+            "http2": self.http2,
+            "requests": n,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "open_connections": self.open_connections(),
+            "connects": self.connects,
+            "reuse_ratio": round(1 - self.connects / n, 4) if n else None,
+            "queue_wait_avg_ms": round(self.wait_total / n * 1e3, 3) if n else None,
+            "queue_wait_max_ms": round(self.wait_max * 1e3, 3),
+            "request_avg_ms": round(self.time_total / n * 1e3, 3) if n else None,
+            "breaker": {"state": self.breaker.state, "consecutive_failures": self.breaker.consecutive,
+                        "opens": self.breaker.opens},
+            "endpoints": {name: st.as_dict() for name, st in self.endpoints.items()},
+            "single_flight": self.flights.stats(),
+        }
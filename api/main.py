@@ -4,13 +4,27 @@ import os
 import json
 import time
 import asyncio
-from datetime import datetime, timezone, date
-from typing import Optional, Dict, List, Any
-from QuikPy import QuikPy
-from concurrent.futures import ThreadPoolExecutor
+import threading
+from functools import lru_cache
+from datetime import datetime, timezone, date, timedelta
+from typing import Optional, Dict, List, Any, Iterable, Set, Tuple
+from QuikPy import QuikPy, SymbolSpecStore
+from quik_session import QuikSession, QuikUnavailableError
+from order_book import BookStore
+from candle_store import CandleStore, INTERVALS as CANDLE_INTERVALS
+from trade_tape import TradeRecorder
+from contract_index import ContractIndex
+from iss_client import IssClient, IssUnavailableError, CircuitBreaker
+from single_flight import SingleFlight
+from dividend_store import DividendStore
+from snapshot import Snapshot
+import numpy as np
+from scheduler import MSK, SESSIONS, RefreshScheduler, TradingCalendar
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import httpx
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
 # -----------------------------------------------------------------------------
@@ -23,12 +37,52 @@ SYMBOLS_FILE = os.path.join(os.path.dirname(__file__), "symbols.json")
 # Network timeout for MOEX ISS requests (seconds)
 HTTP_TIMEOUT: float = float(os.getenv("HTTP_TIMEOUT", "10"))
 
+# How many SECIDs to request in one batched ISS ``securities.json`` call
+ISS_BATCH: int = max(1, int(os.getenv("ISS_BATCH", "100")))
+
+# The ISS client lives as long as the app: a keep‑alive connection pool
+# (HTTP/2 when the h2 package is installed and ISS_HTTP2 is on) with at most
+# ISS_PER_HOST requests in flight per host
+ISS_HTTP2: bool = os.getenv("ISS_HTTP2", "1").strip().lower() in ("1","true","yes","y")
+ISS_MAX_CONNECTIONS: int = int(os.getenv("ISS_MAX_CONNECTIONS", "20"))
+ISS_MAX_KEEPALIVE: int = int(os.getenv("ISS_MAX_KEEPALIVE", "10"))
+ISS_KEEPALIVE_SEC: float = float(os.getenv("ISS_KEEPALIVE_SEC", "30"))
+ISS_PER_HOST: int = max(1, int(os.getenv("ISS_PER_HOST", "8")))
+
+# ISS fetches: at most ISS_PER_ENDPOINT concurrent requests per endpoint,
+# ISS_RETRIES jittered exponential retries, ISS_DEADLINE_SEC for a fetch with
+# its retries.  After ISS_BREAKER_FAILURES failures in a row ISS is treated
+# as down for ISS_BREAKER_RESET_SEC seconds: nothing is requested and the
+# cache keeps serving the last good data
+ISS_PER_ENDPOINT: int = max(1, int(os.getenv("ISS_PER_ENDPOINT", "4")))
+ISS_RETRIES: int = max(0, int(os.getenv("ISS_RETRIES", "2")))
+ISS_DEADLINE_SEC: float = float(os.getenv("ISS_DEADLINE_SEC", str(HTTP_TIMEOUT * 1.5)))
+ISS_BREAKER_FAILURES: int = max(1, int(os.getenv("ISS_BREAKER_FAILURES", "5")))
+ISS_BREAKER_RESET_SEC: float = float(os.getenv("ISS_BREAKER_RESET_SEC", "30"))
+
+# Identical ISS URLs requested at the same time share one fetch; its reply
+# is reused for ISS_DEDUP_SEC seconds more
+ISS_DEDUP_SEC: float = float(os.getenv("ISS_DEDUP_SEC", "0.5"))
+
 # How often the cache is refreshed (seconds) for spot and futures quotes
 REFRESH_SEC: float = float(os.getenv("REFRESH_SEC", "5"))
 
+# Each symbol is refreshed every REFRESH_SEC while its quote keeps changing,
+# backs off to REFRESH_MAX_SEC while it does not, and is polled every
+# REFRESH_CLOSED_SEC (or at the session open) outside its trading session
+REFRESH_MAX_SEC: float = float(os.getenv("REFRESH_MAX_SEC", "60"))
+REFRESH_CLOSED_SEC: float = float(os.getenv("REFRESH_CLOSED_SEC", "900"))
+
+# Exchange holidays, comma separated YYYY-MM-DD: no session on either market
+MOEX_HOLIDAYS: List[date] = [date.fromisoformat(d.strip()) for d in os.getenv("MOEX_HOLIDAYS", "").split(",") if d.strip()]
+
 # How often dividend information is refreshed (seconds)
 DIV_REFRESH_SEC: float = float(os.getenv("DIV_REFRESH_SEC", "3600"))
 
+# Dividend histories are kept in this SQLite file across restarts and are
+# downloaded from ISS for both data sources.  Empty value — memory only.
+DIVIDENDS_DB: str = os.getenv("DIVIDENDS_DB", os.path.join(os.path.dirname(__file__), "dividends.sqlite3"))
+
 # The December contract year for futures.  Defaults to the current year or
 # the value specified in the ``YEAR_DEC`` environment variable.
 _current_year = datetime.now(timezone.utc).year
@@ -41,6 +95,20 @@ MONTH_LETTER: str = "Z"
 # Last digit of the futures year, used when constructing letter codes
 YEAR_LAST_DIGIT: str = str(YEAR_DEC)[-1]
 
+# Contract parameters (expiration, margin, step, step price, lot) change at
+# most once a day: they are cached for FUT_PARAMS_TTL seconds and refetched
+# after every clearing session ending at the FUT_CLEARING_MSK times (HH:MM,
+# Moscow time).
+FUT_PARAMS_TTL: float = float(os.getenv("FUT_PARAMS_TTL", "86400"))
+FUT_CLEARING_MSK: List[Tuple[int, int]] = [
+    (int(t.split(":")[0]), int(t.split(":")[1]))
+    for t in os.getenv("FUT_CLEARING_MSK", "14:05,19:05").split(",") if t.strip()
+]
+
+# Futures contracts are resolved from an index built once per trading day
+# from the board listing and kept in this file.  Empty value — memory only.
+FUT_INDEX_FILE: str = os.getenv("FUT_INDEX_FILE", os.path.join(os.path.dirname(__file__), "fut_index.json"))
+
 # Boards used for spot and futures quotes.  These values rarely change, but
 # if MOEX introduces new boards they can be overridden via environment.
 FUT_BOARD: str = os.getenv("FUT_BOARD", "RFUD")
@@ -67,9 +135,86 @@ USE_QUIK = os.getenv("USE_QUIK", "1").strip().lower() in ("1","true","yes","y")
 QUIK_SPOT_CLASS: str = os.getenv("QUIK_SPOT_CLASS", "TQBR")
 QUIK_FUT_CLASS: str = os.getenv("QUIK_FUT_CLASS", "SPBFUT")
 
+# Адрес терминала QUIK со скриптами QUIK#
+QUIK_HOST: str = os.getenv("QUIK_HOST", "127.0.0.1")
+QUIK_REQUESTS_PORT: int = int(os.getenv("QUIK_REQUESTS_PORT", "34130"))
+QUIK_CALLBACKS_PORT: int = int(os.getenv("QUIK_CALLBACKS_PORT", "34131"))
+
+# Проверка соединения (ping) и переподключение с нарастающей паузой, секунды
+QUIK_PING_SEC: float = float(os.getenv("QUIK_PING_SEC", "5"))
+QUIK_RECONNECT_MAX_SEC: float = float(os.getenv("QUIK_RECONNECT_MAX_SEC", "60"))
+
+# Очередь функций обратного вызова QUIK: 0 — обработчики вызываются в потоке
+# приёма; N — в отдельном потоке через очередь на N сообщений
+QUIK_CALLBACK_QUEUE: int = int(os.getenv("QUIK_CALLBACK_QUEUE", "0"))
+
+# Объединение OnParam/OnQuote по инструменту: не задано — выключено; 0 — обработчики
+# получают последнее обновление, как только освободятся; N — не чаще раза в N секунд
+QUIK_COALESCE_SEC: Optional[float] = float(os.environ["QUIK_COALESCE_SEC"]) if os.getenv("QUIK_COALESCE_SEC") else None
+
+# Сколько ждать ответа на запрос к QUIK, секунды (при мультиплексировании)
+QUIK_REQUEST_TIMEOUT: float = float(os.getenv("QUIK_REQUEST_TIMEOUT", "10"))
+
+# Мультиплексирование запросов к QUIK: все чтения параметров за цикл
+# отправляются сразу, ответы сопоставляются по id
+QUIK_MULTIPLEX: bool = os.getenv("QUIK_MULTIPLEX", "1").strip().lower() in ("1","true","yes","y")
+
+# Потоковый режим: вместо опроса по таймеру параметры заказываются через
+# paramRequestBulk, и кэш обновляется только по инструментам из OnParam
+QUIK_STREAM: bool = os.getenv("QUIK_STREAM", "0").strip().lower() in ("1","true","yes","y")
+
+# Полная сверка кэша в потоковом режиме, секунды (на случай пропущенных OnParam)
+QUIK_STREAM_RESYNC_SEC: float = float(os.getenv("QUIK_STREAM_RESYNC_SEC", "300"))
+
+# Одинаковые чтения параметров (класс, тикер, параметр) из разных потоков
+# в одно время выполняются одним запросом к QUIK. Результат ещё
+# QUIK_DEDUP_SEC секунд отдаётся из памяти (0 — только одновременные чтения:
+# в потоковом режиме OnParam требует свежего значения)
+QUIK_DEDUP_SEC: float = float(os.getenv("QUIK_DEDUP_SEC", "0"))
+
+# Сколько параметров читать одним запросом getParamEx2Bulk
+QUIK_BULK_CHUNK: int = max(1, int(os.getenv("QUIK_BULK_CHUNK", "1000")))
+
+# Справочник тикеров QUIK (спецификации и STEPPRICE) сохраняется в файл и
+# после перезапуска загружается сразу. Спецификации прошлых дней при
+# подключении получаются заново. Пустое значение — только в памяти
+QUIK_SYMBOLS_FILE: str = os.getenv("QUIK_SYMBOLS_FILE", os.path.join(os.path.dirname(__file__), "quik_symbols.json"))
+# Сколько секунд STEPPRICE считается актуальной
+QUIK_STEPPRICE_TTL: float = float(os.getenv("QUIK_STEPPRICE_TTL", "3600"))
+
+# Локальная история свечей QUIK (memory‑mapped столбцы), каталог хранилища
+CANDLES_DIR: str = os.getenv("CANDLES_DIR", os.path.join(os.path.dirname(__file__), "candles"))
+
+# Запись ленты обезличенных сделок QUIK (OnAllTrade) в бинарный журнал: каталог, пусто — не писать
+QUIK_TRADES_DIR: str = os.getenv("QUIK_TRADES_DIR", "")
+
+# Стаканы QUIK (OnQuote): глубина хранимого стакана, 0 — не подписываться
+QUIK_BOOK_DEPTH: int = int(os.getenv("QUIK_BOOK_DEPTH", "0"))
+
+# Объём позиции в рублях для исполнимых спредов (VWAP по стакану)
+BOOK_SIZE_RUB: float = float(os.getenv("BOOK_SIZE_RUB", "1000000"))
+
+# Screener rows are computed column‑wise from a snapshot of the cache and
+# shared by every request and WebSocket client for this many seconds
+SNAPSHOT_TTL_SEC: float = float(os.getenv("SNAPSHOT_TTL_SEC", "0.25"))
+
 # Пул потоков, чтобы не блокировать event‑loop FastAPI
 EXECUTOR = ThreadPoolExecutor(max_workers=4)
 
+# Одно долгоживущее соединение с QUIK на процесс; создаётся при старте приложения
+QUIK_SESSION: Optional[QuikSession] = None
+SYMBOL_SPECS: Optional[SymbolSpecStore] = None
+
+
+def _new_quik() -> QuikPy:
+    qp = QuikPy(host=QUIK_HOST, requests_port=QUIK_REQUESTS_PORT,
+                callbacks_port=QUIK_CALLBACKS_PORT, multiplex=QUIK_MULTIPLEX,
+                callback_queue_size=QUIK_CALLBACK_QUEUE, symbols_store=SYMBOL_SPECS)
+    qp.request_timeout = QUIK_REQUEST_TIMEOUT
+    if QUIK_COALESCE_SEC is not None:
+        qp.coalesce_callbacks(("OnParam", "OnQuote"), interval=QUIK_COALESCE_SEC)
+    return qp
+
 # -----------------------------------------------------------------------------
 # Data model
 # -----------------------------------------------------------------------------
@@ -86,6 +231,8 @@ class ScreenerRow(BaseModel):
     ГО_pct: Optional[float] = None
     Спред_Входа_pct: Optional[float] = None
     Спред_Выхода_pct: Optional[float] = None
+    Спред_Входа_исп_pct: Optional[float] = None
+    Спред_Выхода_исп_pct: Optional[float] = None
     Справ_Стоимость: Optional[float] = None
     Дельта_pct: Optional[float] = None
     Всего_pct: Optional[float] = None
@@ -164,29 +311,72 @@ def _num(x: Any) -> Optional[float]:
     except Exception:
         return None
 
-# NEW: безопасное получение параметра из QUIK
-def quik_param(qp: QuikPy, class_code: str, sec_code: str, param: str) -> Optional[float]:
+# Значение параметра из ответа getParamEx2 (строкой) или None
+def _quik_param_value(r: Any) -> Optional[str]:
+    if not isinstance(r, dict):
+        return None
+    data = r.get("data") or {}
+    if data.get("result") != "1":
+        return None
+    v = data.get("param_value")
+    return str(v) if v not in (None, "") else None
+
+# Чтения параметров QUIK, которые идут сейчас: одинаковые ключи не дублируются
+QUIK_FLIGHTS = SingleFlight(QUIK_DEDUP_SEC)
+
+
+def _quik_param_read(qp: QuikPy, class_code: str, sec_code: str, param: str) -> Optional[str]:
     try:
-        r = qp.getParamEx2(class_code, sec_code, param)  # {"data":{"param_value": "...", "result": "1", ...}}
-        data = (r or {}).get("data") or {}
-        if data.get("result") != "1":
-            return None
-        v = data.get("param_value")
-        return float(v) if (v is not None and v != "") else None
+        return _quik_param_value(qp.get_param_ex2(class_code, sec_code, param))  # {"data":{"param_value": "...", "result": "1", ...}}
     except Exception:
         return None
 
+# NEW: безопасное получение параметра из QUIK
+def quik_param(qp: QuikPy, class_code: str, sec_code: str, param: str) -> Optional[float]:
+    return _num(quik_param_str(qp, class_code, sec_code, param))
+
 # Строковый параметр (например, даты)
 def quik_param_str(qp: QuikPy, class_code: str, sec_code: str, param: str) -> Optional[str]:
+    return QUIK_FLIGHTS.do((class_code, sec_code, param), lambda: _quik_param_read(qp, class_code, sec_code, param))
+
+# Пачка параметров по одному запросу на параметр: при мультиплексировании все
+# запросы уходят в QUIK сразу, а не по одному с ожиданием ответа.
+def quik_params_pipelined(qp: QuikPy, requests: List[tuple]) -> List[Optional[str]]:
+    """Read ``(class_code, sec_code, param)`` triples with one getParamEx2
+    each, returning string values in request order (``None`` where QUIK had
+    no value or the read failed)."""
     try:
-        r = qp.getParam_ex2(class_code, sec_code, param)
-        data = (r or {}).get("data") or {}
-        if data.get("result") != "1":
-            return None
-        v = data.get("param_value")
-        return str(v) if v not in (None, "") else None
+        replies = qp.get_param_ex2_pipelined(requests)
     except Exception:
-        return None
+        return [None] * len(requests)
+    return [_quik_param_value(r) for r in replies]
+
+
+def quik_params(qp: QuikPy, requests: List[tuple]) -> List[Optional[str]]:
+    """Read ``(class_code, sec_code, param)`` triples with getParamEx2Bulk,
+    ``QUIK_BULK_CHUNK`` parameters per request.  Values come back in request
+    order.  Falls back to per‑parameter reads if the terminal's QUIK# has no
+    bulk command.  Triples another thread is already reading are not read
+    again: their values come from that read."""
+    return QUIK_FLIGHTS.do_many(requests, lambda keys: _quik_params_bulk(qp, keys))
+
+
+def _quik_params_bulk(qp: QuikPy, requests: List[tuple]) -> List[Optional[str]]:
+    out: List[Optional[str]] = []
+    for i in range(0, len(requests), QUIK_BULK_CHUNK):
+        chunk = requests[i:i + QUIK_BULK_CHUNK]
+        try:
+            r = qp.get_param_ex2_bulk([f"{c}|{s}|{p}" for c, s, p in chunk])
+        except Exception:
+            out.extend([None] * len(chunk))
+            continue
+        data = r.get("data") if isinstance(r, dict) else None
+        if not isinstance(data, list) or len(data) != len(chunk):
+            # lua_error или старая версия QUIK# без getParamEx2Bulk
+            out.extend(quik_params_pipelined(qp, chunk))
+            continue
+        out.extend(_quik_param_value({"data": d}) for d in data)
+    return out
 
 # Вычисление SECID фьючерса в QUIK (формат 'SBRF-12.25')
 def quik_fut_code_for_share(share: str, year_dec: int = YEAR_DEC) -> Optional[str]:
@@ -201,52 +391,133 @@ def quik_fut_code_for_share(share: str, year_dec: int = YEAR_DEC) -> Optional[st
 #  * 'fut':  mapping SECID -> {last, bid, offer, exp, im, minstep, stepprice,
 #                               lotvolume, ts}
 #  * 'divs': mapping SECID -> {ex_date, value, ts}
+#  * 'fut_params': mapping futures SECID -> {exp, im, minstep, stepprice,
+#                  lotvolume, ts}, the slow tier behind 'fut' (ISS only)
 #  * 'map':  mapping share -> {secid (fut), ui (display string)}
 #
-# The 'map' section ensures that ``build_row`` always has something to use
-# for the futures UI code even if we cannot fetch live data.
+# The 'map' section ensures that ``build_snapshot`` always has something to
+# use for the futures UI code even if we cannot fetch live data.
 
 CACHE: Dict[str, Dict[str, Any]] = {
     "spot": {},
     "fut": {},
     "divs": {},
     "map": {},
+    "fut_params": {},
 }
 
 
+ISS_CLIENT: Optional[IssClient] = None
+
+
+def iss_client() -> IssClient:
+    """The app‑wide ISS client, created on first use."""
+    global ISS_CLIENT
+    if ISS_CLIENT is None or ISS_CLIENT.is_closed:
+        # Disable environment proxy settings to avoid requiring the optional
+        # socksio package (see https://www.python-httpx.org/advanced/#environment-proxies).
+        ISS_CLIENT = IssClient(timeout=HTTP_TIMEOUT, http2=ISS_HTTP2, max_connections=ISS_MAX_CONNECTIONS,
+                               max_keepalive=ISS_MAX_KEEPALIVE, keepalive_expiry=ISS_KEEPALIVE_SEC,
+                               per_host=ISS_PER_HOST, per_endpoint=ISS_PER_ENDPOINT, retries=ISS_RETRIES,
+                               deadline=ISS_DEADLINE_SEC,
+                               breaker=CircuitBreaker(ISS_BREAKER_FAILURES, ISS_BREAKER_RESET_SEC), dedup_ttl=ISS_DEDUP_SEC,
+                               headers={"User-Agent": "screener/0.4"}, trust_env=False)
+    return ISS_CLIENT
+
+
 # -----------------------------------------------------------------------------
 # MOEX ISS requests
 # -----------------------------------------------------------------------------
+# What a failed ISS fetch may raise: transport and status errors, an open
+# breaker, a missed deadline, or a reply that is not the expected JSON
+ISS_ERRORS = (httpx.HTTPError, IssUnavailableError, asyncio.TimeoutError, ValueError, KeyError, IndexError, TypeError)
+
+
 async def iss_get(client: httpx.AsyncClient, url: str) -> dict:
-    """Fetch JSON from a MOEX ISS endpoint.  Raises on non‐200 responses."""
+    """Fetch JSON from a MOEX ISS endpoint.  Raises on non‐200 responses.
+
+    Through an :class:`IssClient` the request is retried, bounded and
+    guarded by its circuit breaker."""
+    if isinstance(client, IssClient):
+        return await client.get_json(url)
     r = await client.get(url, timeout=HTTP_TIMEOUT)
     r.raise_for_status()
     return r.json()
 
 
+@lru_cache(maxsize=64)
+def _iss_index(columns: Tuple[str, ...]) -> Dict[str, int]:
+    """Column name -> position for an ISS block; ISS repeats the same column
+    list on every call, so the mapping is built once per layout."""
+    return {n: i for i, n in enumerate(columns)}
+
+
+def iss_rows(js: dict, block: str) -> Tuple[Dict[str, int], List[list]]:
+    """Return the cached column index and the rows of an ISS ``block``."""
+    b = js.get(block) or {}
+    return _iss_index(tuple(b.get("columns") or ())), b.get("data") or []
+
+
+async def fetch_spot_quotes(client: httpx.AsyncClient, secids: List[str]) -> Dict[str, dict]:
+    """Fetch spot quotes (last, bid, offer) for many shares at once.
+
+    The board's ``securities.json`` takes a comma separated ``securities``
+    list, so the universe is fetched in chunks of ``ISS_BATCH`` tickers —
+    one request per chunk instead of one per share.  Shares without data
+    are absent from the result; a failed chunk only drops its own shares.
+    """
+    async def chunk(part: List[str]) -> Dict[str, dict]:
+        url = (
+            f"https://iss.moex.com/iss/engines/stock/markets/shares/boards/{SPOT_BOARD}/"
+            f"securities.json?iss.meta=off&iss.only=marketdata&securities={','.join(part)}"
+            f"&marketdata.columns=SECID,LAST,BID,OFFER"
+        )
+        out: Dict[str, dict] = {}
+        try:
+            c, data = iss_rows(await iss_get(client, url), "marketdata")
+            i_secid, i_last, i_bid, i_offer = c["SECID"], c["LAST"], c["BID"], c["OFFER"]
+        except ISS_ERRORS:
+            return out
+        for row in data:
+            out[row[i_secid]] = {"last": _num(row[i_last]), "bid": _num(row[i_bid]), "offer": _num(row[i_offer])}
+        return out
+
+    parts = [secids[i:i + ISS_BATCH] for i in range(0, len(secids), ISS_BATCH)]
+    quotes: Dict[str, dict] = {}
+    for res in await asyncio.gather(*(chunk(p) for p in parts)):
+        quotes.update(res)
+    return quotes
+
+
 async def fetch_spot_quote(client: httpx.AsyncClient, secid: str) -> Optional[dict]:
     """Fetch the latest spot quote (last, bid, offer) for a given share SECID.
 
     Returns ``None`` if the data is unavailable.
     """
-    url = (
-        f"https://iss.moex.com/iss/engines/stock/markets/shares/boards/{SPOT_BOARD}/"
-        f"securities/{secid}.json?iss.meta=off&marketdata.columns=LAST,BID,OFFER"
-    )
+    return (await fetch_spot_quotes(client, [secid])).get(secid)
+
+
+async def fetch_dividend_history(client: httpx.AsyncClient, secid: str) -> Optional[List[Tuple[str, Optional[float]]]]:
+    """Fetch the full dividend history of a share as ``(date ISO, value)``
+    rows.  Returns ``None`` if the request failed."""
+    url = f"https://iss.moex.com/iss/securities/{secid}/dividends.json?iss.meta=off"
     try:
-        js = await iss_get(client, url)
-        cols = js.get("marketdata", {}).get("columns", [])
-        data = js.get("marketdata", {}).get("data", [])
-        if not (cols and data and data[0]):
-            return None
-        c = {n: i for i, n in enumerate(cols)}
-        return {
-            "last": _num(data[0][c.get("LAST")]),
-            "bid":  _num(data[0][c.get("BID")]),
-            "offer": _num(data[0][c.get("OFFER")]),
-        }
-    except Exception:
+        c, data = iss_rows(await iss_get(client, url), "dividends")
+    except ISS_ERRORS:
         return None
+    out = []
+    for row in data:
+        # ISS names the date registryclosedate; older names kept as fallbacks
+        exd = next((row[c[k]] for k in ("registryclosedate", "registry_close_date", "close_date", "date")
+                    if k in c and row[c[k]]), None)
+        if not exd:
+            continue
+        try:
+            d = datetime.fromisoformat(str(exd)).date()
+        except Exception:
+            continue
+        out.append((d.isoformat(), _num(row[c["value"]]) if "value" in c else None))
+    return out
 
 
 async def fetch_dividend_info(client: httpx.AsyncClient, secid: str) -> dict:
@@ -255,98 +526,61 @@ async def fetch_dividend_info(client: httpx.AsyncClient, secid: str) -> dict:
     Returns a dict with ``ex_date`` and ``value`` keys; either may be ``None``
     if no future dividend is scheduled.
     """
-    url = f"https://iss.moex.com/iss/securities/{secid}/dividends.json?iss.meta=off"
-    out = {"ex_date": None, "value": None}
-    try:
-        js = await iss_get(client, url)
-        cols = js.get("dividends", {}).get("columns", [])
-        data = js.get("dividends", {}).get("data", [])
-        if not (cols and data):
-            return out
-        c = {n: i for i, n in enumerate(cols)}
-        today = datetime.now(timezone.utc).date()
-        future = []
-        for row in data:
-            # the API uses different field names for dates; pick the first non‐None
-            exd = row[c.get("registry_close_date")] or row[c.get("close_date")] or row[c.get("date")]
-            val = row[c.get("value")]
-            if not exd:
-                continue
-            try:
-                d = datetime.fromisoformat(str(exd)).date()
-            except Exception:
-                continue
-            if d >= today:
-                future.append((d, _num(val)))
-        if future:
-            future.sort(key=lambda x: x[0])
-            d, v = future[0]
-            out = {"ex_date": d.isoformat(), "value": v}
-    except Exception:
-        pass
-    return out
+    today = datetime.now(timezone.utc).date().isoformat()
+    future = sorted(r for r in (await fetch_dividend_history(client, secid) or []) if r[0] >= today)
+    if not future:
+        return {"ex_date": None, "value": None}
+    return {"ex_date": future[0][0], "value": future[0][1]}
 
 
-async def fetch_fut_md_and_params(client: httpx.AsyncClient, secid: str) -> Optional[dict]:
-    """Fetch futures market data and security parameters for a given SECID.
+FUT_PARAM_COLUMNS = ("EXPIRATION", "INITIALMARGIN", "MINSTEP", "STEPPRICE", "LOTVOLUME")
 
-    This implementation combines multiple ISS endpoints: market data, security
-    parameters, orderbook fallback and recent trades.  It returns a dict
-    containing ``last``, ``bid``, ``offer``, ``exp``, ``im``, ``minstep``,
-    ``stepprice`` and ``lotvolume``.  If all quotes are missing it returns
-    ``None``.
-    """
-    result = {
-        "last": None,
-        "bid": None,
-        "offer": None,
-        "exp": None,
-        "im": None,
-        "minstep": None,
-        "stepprice": None,
-        "lotvolume": None,
-    }
-    # (A) batch marketdata – sometimes the only place with L1 quotes
-    md_url = (
-        f"https://iss.moex.com/iss/engines/futures/markets/forts/boards/{FUT_BOARD}/"
-        f"securities.json?iss.meta=off&securities={secid}&marketdata.columns=SECID,LAST,BID,OFFER"
-    )
-    try:
-        js = await iss_get(client, md_url)
-        cols = js.get("marketdata", {}).get("columns", [])
-        data = js.get("marketdata", {}).get("data", [])
-        if cols and data:
-            c = {n: i for i, n in enumerate(cols)}
-            for row in data:
-                if row[c.get("SECID")] != secid:
-                    continue
-                result["last"]  = _num(row[c.get("LAST")])
-                result["bid"]   = _num(row[c.get("BID")])
-                result["offer"] = _num(row[c.get("OFFER")])
-                break
-    except Exception:
-        pass
-    # (B) security parameters: INITIALMARGIN, MINSTEP, STEPPRICE, LOTVOLUME, EXPIRATION
-    sec_url = (
+
+def _fut_board_url(secids: List[str], block: str, columns: str) -> str:
+    return (
         f"https://iss.moex.com/iss/engines/futures/markets/forts/boards/{FUT_BOARD}/"
-        f"securities/{secid}.json?iss.meta=off&securities.columns=SECID,EXPIRATION,INITIALMARGIN,MINSTEP,STEPPRICE,LOTVOLUME"
+        f"securities.json?iss.meta=off&iss.only={block}&securities={','.join(secids)}&{block}.columns={columns}"
     )
-    try:
-        js = await iss_get(client, sec_url)
-        cols = js.get("securities", {}).get("columns", [])
-        data = js.get("securities", {}).get("data", [])
-        if cols and data and data[0]:
-            c = {n: i for i, n in enumerate(cols)}
-            row = data[0]
-            result["exp"]       = row[c.get("EXPIRATION")]
-            result["im"]        = _num(row[c.get("INITIALMARGIN")])
-            result["minstep"]   = _num(row[c.get("MINSTEP")])
-            result["stepprice"] = _num(row[c.get("STEPPRICE")])
-            result["lotvolume"] = _num(row[c.get("LOTVOLUME")])
-    except Exception:
-        pass
+
+
+async def _fut_board_batched(client: httpx.AsyncClient, secids: List[str], block: str, columns: Tuple[str, ...]) -> Dict[str, list]:
+    """SECID -> row of ``columns`` from the board's ``block`` for many
+    contracts, ``ISS_BATCH`` tickers per request."""
+    async def chunk(part: List[str]) -> Dict[str, list]:
+        try:
+            c, data = iss_rows(await iss_get(client, _fut_board_url(part, block, ",".join(("SECID",) + columns))), block)
+            idx = [c[n] for n in columns]
+            i_secid = c["SECID"]
+        except ISS_ERRORS:
+            return {}
+        return {row[i_secid]: [row[i] for i in idx] for row in data}
+
+    parts = [secids[i:i + ISS_BATCH] for i in range(0, len(secids), ISS_BATCH)]
+    rows: Dict[str, list] = {}
+    for res in await asyncio.gather(*(chunk(p) for p in parts)):
+        rows.update(res)
+    return rows
+
+
+async def fetch_fut_marketdata(client: httpx.AsyncClient, secids: List[str]) -> Dict[str, dict]:
+    """Fetch L1 quotes (last, bid, offer) of many futures contracts at once."""
+    rows = await _fut_board_batched(client, secids, "marketdata", ("LAST", "BID", "OFFER"))
+    return {s: {"last": _num(r[0]), "bid": _num(r[1]), "offer": _num(r[2])} for s, r in rows.items()}
+
+
+async def fetch_fut_params(client: httpx.AsyncClient, secids: List[str]) -> Dict[str, dict]:
+    """Fetch contract parameters (``exp``, ``im``, ``minstep``, ``stepprice``,
+    ``lotvolume``) of many futures contracts at once."""
+    rows = await _fut_board_batched(client, secids, "securities", FUT_PARAM_COLUMNS)
+    return {s: {"exp": r[0], "im": _num(r[1]), "minstep": _num(r[2]), "stepprice": _num(r[3]), "lotvolume": _num(r[4])}
+            for s, r in rows.items()}
+
+
+async def fetch_fut_fallback(client: httpx.AsyncClient, secid: str, result: dict) -> None:
+    """Fill missing quotes of ``result`` in place: bid/offer from the top of
+    the orderbook, last from the most recent trade."""
     # (C) fallback to orderbook if bid/offer missing
-    if result["bid"] is None or result["offer"] is None:
+    if result.get("bid") is None or result.get("offer") is None:
         ob_url = (
             f"https://iss.moex.com/iss/engines/futures/markets/forts/securities/{secid}/orderbook.json?iss.meta=off&depth=1"
         )
@@ -358,24 +592,38 @@ async def fetch_fut_md_and_params(client: httpx.AsyncClient, secid: str) -> Opti
                 result["bid"] = _num(bids[0][0])
             if offers and offers[0]:
                 result["offer"] = _num(offers[0][0])
-        except Exception:
+        except ISS_ERRORS:
             pass
     # (D) fallback to recent trades if last missing
-    if result["last"] is None:
+    if result.get("last") is None:
         tr_url = (
             f"https://iss.moex.com/iss/engines/futures/markets/forts/securities/{secid}/trades.json?iss.meta=off&limit=1&sort_time=desc"
         )
         try:
-            js = await iss_get(client, tr_url)
-            cols = js.get("trades", {}).get("columns", [])
-            data = js.get("trades", {}).get("data", [])
-            if cols and data and data[0]:
-                c = {n: i for i, n in enumerate(cols)}
+            c, data = iss_rows(await iss_get(client, tr_url), "trades")
+            if data and data[0]:
                 price = _num(data[0][c.get("PRICE")])
                 if price is not None:
                     result["last"] = price
-        except Exception:
+        except ISS_ERRORS:
             pass
+
+
+async def fetch_fut_md_and_params(client: httpx.AsyncClient, secid: str) -> Optional[dict]:
+    """Fetch futures market data and security parameters for a given SECID.
+
+    Combines the batched market data and parameter fetches for a single
+    contract with the orderbook/trades fallbacks.  It returns a dict
+    containing ``last``, ``bid``, ``offer``, ``exp``, ``im``, ``minstep``,
+    ``stepprice`` and ``lotvolume``.  If all quotes are missing it returns
+    ``None``.
+    """
+    md, params = await asyncio.gather(fetch_fut_marketdata(client, [secid]), fetch_fut_params(client, [secid]))
+    result = {"last": None, "bid": None, "offer": None, "exp": None, "im": None,
+              "minstep": None, "stepprice": None, "lotvolume": None}
+    result.update(params.get(secid, {}))
+    result.update(md.get(secid, {}))
+    await fetch_fut_fallback(client, secid, result)
     if result["last"] is None and result["bid"] is None and result["offer"] is None:
         # If there is absolutely no price information, signal failure
         return None
@@ -424,80 +672,175 @@ async def find_fut_secid_on_board(client: httpx.AsyncClient, share: str, year_de
             valid.sort(key=lambda r: exp_date(r))
             best = valid[0] if valid else rows[0]
         return best
-    except Exception:
+    except ISS_ERRORS:
+        return None
+
+
+async def fetch_fut_listing(client: httpx.AsyncClient) -> Optional[List[tuple]]:
+    """Fetch the whole futures board listing as ``(secid, shortname,
+    assetcode, expiration)`` rows, or ``None`` on failure."""
+    url = (
+        f"https://iss.moex.com/iss/engines/futures/markets/forts/boards/{FUT_BOARD}/securities.json"
+        f"?iss.meta=off&iss.only=securities&securities.columns=SECID,SHORTNAME,ASSETCODE,EXPIRATION,LASTTRADEDATE"
+    )
+    try:
+        c, data = iss_rows(await iss_get(client, url), "securities")
+        i_secid = c["SECID"]
+    except ISS_ERRORS:
         return None
+    i_short, i_asset = c.get("SHORTNAME"), c.get("ASSETCODE")
+    i_exp = c.get("EXPIRATION", c.get("LASTTRADEDATE"))
+    return [(row[i_secid],
+             row[i_short] if i_short is not None else None,
+             row[i_asset] if i_asset is not None else None,
+             row[i_exp] if i_exp is not None else None) for row in data]
 
 
 # -----------------------------------------------------------------------------
 # Cache refresh
 # -----------------------------------------------------------------------------
-async def _refresh_spot(client: httpx.AsyncClient, now: float) -> None:
-    """Fetch spot quotes concurrently and update the cache."""
-    tasks = [fetch_spot_quote(client, secid) for secid in SYMBOLS]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    for secid, q in zip(SYMBOLS, results):
-        if isinstance(q, Exception):
-            continue
+async def _refresh_spot(client: httpx.AsyncClient, now: float, shares: Optional[List[str]] = None) -> None:
+    """Fetch spot quotes in batched requests and update the cache."""
+    shares = SYMBOLS if shares is None else shares
+    quotes = await fetch_spot_quotes(client, shares)
+    for secid in shares:
+        q = quotes.get(secid)
         if q:
             CACHE["spot"][secid] = {**q, "ts": now}
 
 
+DIVIDENDS = DividendStore(DIVIDENDS_DB or None)
+_DIV_FAILED: Dict[str, float] = {}
+_DIV_LOADED_DAY: Optional[date] = None
+
+
+def _load_dividends() -> None:
+    """Fill the dividend columns from the store, without network."""
+    global _DIV_LOADED_DAY
+    _DIV_LOADED_DAY = datetime.now(timezone.utc).date()
+    CACHE["divs"].update(DIVIDENDS.next_dividends(SYMBOLS, _DIV_LOADED_DAY))
+
+
 async def _refresh_dividends(client: httpx.AsyncClient, now: float) -> None:
-    """Fetch dividend info concurrently and update the cache."""
-    tasks = []
-    for secid in SYMBOLS:
-        rec = CACHE["divs"].get(secid)
-        if not rec or (now - rec.get("ts", 0) > DIV_REFRESH_SEC):
-            tasks.append((secid, fetch_dividend_info(client, secid)))
-    # gather tasks
-    coros = [t[1] for t in tasks]
-    results = await asyncio.gather(*coros, return_exceptions=True)
-    for (secid, _), info in zip(tasks, results):
-        if isinstance(info, Exception):
+    """Download the dividend history of shares not fetched for
+    ``DIV_REFRESH_SEC``, merge it into the store and update the cache.
+    A failed download is retried after a few minutes.  On a new day the
+    columns are reloaded from the store, so a passed ex‑date gives way to
+    the next dividend without a download."""
+    due = [s for s in DIVIDENDS.stale(SYMBOLS, now, DIV_REFRESH_SEC)
+           if now - _DIV_FAILED.get(s, 0.0) > min(DIV_REFRESH_SEC, 300)]
+    if not due:
+        if _DIV_LOADED_DAY != datetime.now(timezone.utc).date():
+            _load_dividends()
+        return
+    results = await asyncio.gather(*(fetch_dividend_history(client, s) for s in due))
+    for secid, history in zip(due, results):
+        if history is None:
+            _DIV_FAILED[secid] = now
             continue
-        info = info or {"ex_date": None, "value": None}
-        info["ts"] = now
-        CACHE["divs"][secid] = info
+        _DIV_FAILED.pop(secid, None)
+        await asyncio.get_running_loop().run_in_executor(EXECUTOR, DIVIDENDS.put, secid, history, now)
+    _load_dividends()
+
+
+def _last_clearing(now: float) -> float:
+    """Epoch seconds of the most recent end of a clearing session before
+    ``now`` (``FUT_CLEARING_MSK`` times, Moscow time)."""
+    msk = datetime.fromtimestamp(now, MSK)
+    ends = []
+    for day in (msk.date(), msk.date() - timedelta(days=1)):
+        for hh, mm in FUT_CLEARING_MSK:
+            t = datetime(day.year, day.month, day.day, hh, mm, tzinfo=MSK).timestamp()
+            if t <= now:
+                ends.append(t)
+    return max(ends, default=0.0)
+
+
+def _fut_params_stale(rec: Optional[dict], now: float) -> bool:
+    if not rec:
+        return True
+    ts = rec.get("ts", 0)
+    return now - ts > FUT_PARAMS_TTL or ts < _last_clearing(now)
+
+
+FUT_INDEX = ContractIndex(FUT_INDEX_FILE or None)
+_FUT_INDEX_TRIED: float = 0.0
+
+
+async def _ensure_fut_index(client: httpx.AsyncClient, now: float) -> None:
+    """Rebuild the contract index from the board listing once per trading
+    day.  A failed download keeps the previous index and is retried a
+    minute later."""
+    global _FUT_INDEX_TRIED
+    day = int(datetime.fromtimestamp(now, MSK).strftime("%Y%m%d"))
+    if FUT_INDEX.day == day or now - _FUT_INDEX_TRIED < 60:
+        return
+    _FUT_INDEX_TRIED = now
+    rows = await fetch_fut_listing(client)
+    if rows:
+        FUT_INDEX.build(rows, day)
+        FUT_INDEX.save()
 
 
-async def _refresh_futures(client: httpx.AsyncClient, now: float) -> None:
-    """Fetch futures contracts concurrently and update the cache.
+async def _refresh_futures(client: httpx.AsyncClient, now: float, shares: Optional[List[str]] = None) -> None:
+    """Fetch futures contracts in batches and update the cache.
 
-    For each share we first try to locate the December contract via the
-    securities list; failing that we fall back to the letter code.  Even
+    For each share we first look up the December contract in the daily
+    contract index; failing that we fall back to the letter code.  Even
     when we cannot fetch quotes we still register the mapping so that
-    ``build_row`` produces a sensible UI code.
+    ``build_snapshot`` produces a sensible UI code.
+
+    Quotes of all contracts come from one batched market data request per
+    ``ISS_BATCH`` contracts.  Contract parameters live in the slow
+    ``fut_params`` tier and are refetched only after ``FUT_PARAMS_TTL`` or a
+    clearing; the orderbook and trades fallbacks run only for contracts
+    without quotes.
     """
-    async def process_share(share: str) -> None:
-        try:
-            # Attempt to locate a contract via the securities list
-            found = await find_fut_secid_on_board(client, share, year_dec=YEAR_DEC)
-        except Exception:
-            found = None
-        fut_secid: Optional[str] = None
-        if found:
-            fut_secid = found.get("secid")
+    await _ensure_fut_index(client, now)
+    today = datetime.fromtimestamp(now, MSK).date()
+
+    def resolve(share: str) -> Optional[str]:
+        root = FUT_ROOT.get(share.upper())
+        fut_secid = FUT_INDEX.resolve(root, YEAR_DEC, today) if root else None
         # Fall back to letter code if necessary
         if not fut_secid:
             fut_secid = letter_fut_code(share)
         # Always set up the mapping for UI; use letter code for display
         CACHE["map"].setdefault(share, {"secid": fut_secid, "ui": ui_fut_code(share)})
-        if not fut_secid:
-            return
-        # Fetch market data & parameters
-        try:
-            mdp = await fetch_fut_md_and_params(client, fut_secid)
-        except Exception:
-            mdp = None
-        if mdp:
-            CACHE["fut"][fut_secid] = {**mdp, "ts": now}
-            CACHE["map"][share] = {"secid": fut_secid, "ui": ui_fut_code(share)}
-    # launch tasks
-    tasks = [process_share(s) for s in SYMBOLS]
-    await asyncio.gather(*tasks)
+        return fut_secid
+
+    secids = {share: resolve(share) for share in (SYMBOLS if shares is None else shares)}
+    contracts = sorted({s for s in secids.values() if s})
+    if not contracts:
+        return
+    params = CACHE.setdefault("fut_params", {})
+    stale = [s for s in contracts if _fut_params_stale(params.get(s), now)]
+    md, fresh = await asyncio.gather(fetch_fut_marketdata(client, contracts), fetch_fut_params(client, stale))
+    for secid, p in fresh.items():
+        params[secid] = {**p, "ts": now}
+
+    results: Dict[str, dict] = {}
+    for secid in contracts:
+        result = {"last": None, "bid": None, "offer": None, "exp": None, "im": None,
+                  "minstep": None, "stepprice": None, "lotvolume": None}
+        result.update({k: v for k, v in (params.get(secid) or {}).items() if k != "ts"})
+        result.update(md.get(secid, {}))
+        results[secid] = result
+    missing = [s for s, r in results.items() if r["bid"] is None or r["offer"] is None or r["last"] is None]
+    await asyncio.gather(*(fetch_fut_fallback(client, s, results[s]) for s in missing))
+
+    for share, fut_secid in secids.items():
+        r = results.get(fut_secid or "")
+        if r is None or (r["last"] is None and r["bid"] is None and r["offer"] is None):
+            continue
+        CACHE["fut"][fut_secid] = {**r, "ts": now}
+        CACHE["map"][share] = {"secid": fut_secid, "ui": ui_fut_code(share)}
 
 
 async def refresh_cache() -> None:
+    if USE_QUIK and QUIK_STREAM:
+        # в потоковом режиме кэш обновляет _quik_stream_loop
+        return
     if USE_QUIK:
         # запускаем блокирующий QUIK‑сбор в отдельном потоке
         await asyncio.get_running_loop().run_in_executor(EXECUTOR, refresh_cache_quik_blocking)
@@ -532,54 +875,93 @@ async def refresh_cache() -> None:
             }
             CACHE["divs"][share] = {"ex_date": None, "value": None, "ts": now}
         return
-    # Disable environment proxy settings to avoid requiring the optional
-    # socksio package (see https://www.python-httpx.org/advanced/#environment-proxies).
-    async with httpx.AsyncClient(
-        headers={"User-Agent": "screener/0.4"}, trust_env=False
-    ) as client:
-        # refresh concurrently
-        await asyncio.gather(
-            _refresh_spot(client, now),
-            _refresh_dividends(client, now),
-            _refresh_futures(client, now),
-        )
+    client = iss_client()
+    if client.breaker.state == "open":
+        # ISS is down: keep serving the last good cache entries
+        return
+    # refresh concurrently
+    await asyncio.gather(
+        _refresh_spot(client, now),
+        _refresh_dividends(client, now),
+        _refresh_futures(client, now),
+    )
+
+SCHEDULER = RefreshScheduler(
+    {market: TradingCalendar(windows, MOEX_HOLIDAYS) for market, windows in SESSIONS.items()},
+    min_interval=REFRESH_SEC, max_interval=REFRESH_MAX_SEC, closed_interval=REFRESH_CLOSED_SEC,
+)
+
+
+def _quote_sig(market: str, share: str) -> tuple:
+    """What a refresh of ``(market, share)`` is judged by: the cached L1 quote."""
+    if market == "spot":
+        q = CACHE["spot"].get(share) or {}
+    else:
+        q = CACHE["fut"].get((CACHE["map"].get(share) or {}).get("secid") or "") or {}
+    return q.get("last"), q.get("bid"), q.get("offer")
+
+
+async def refresh_scheduled(keys: List[Tuple[str, str]]) -> None:
+    """Refresh only the given ``("spot"|"fut", share)`` keys."""
+    spot = [share for market, share in keys if market == "spot"]
+    fut = [share for market, share in keys if market == "fut"]
+    if USE_QUIK:
+        instruments = [(QUIK_SPOT_CLASS, share) for share in spot]
+        instruments += [(QUIK_FUT_CLASS, code) for code in map(quik_fut_code_for_share, fut) if code]
+        await asyncio.get_running_loop().run_in_executor(EXECUTOR, refresh_cache_quik_blocking, instruments)
+        return
+    if OFFLINE:
+        await refresh_cache()
+        return
+    client = iss_client()
+    if client.breaker.state == "open":
+        # ISS is down: keep serving the last good cache entries
+        return
+    now = _now_ts()
+    await asyncio.gather(
+        _refresh_spot(client, now, spot),
+        _refresh_futures(client, now, fut),
+    )
+
 
 # Refresh из QUIK
-def _refresh_spot_quik(qp: QuikPy, now: float) -> None:
-    for secid in SYMBOLS:
-        last  = quik_param(qp, QUIK_SPOT_CLASS, secid, "LAST")
-        bid   = quik_param(qp, QUIK_SPOT_CLASS, secid, "BID")
-        offer = quik_param(qp, QUIK_SPOT_CLASS, secid, "OFFER")
+QUIK_SPOT_PARAMS = ("LAST", "BID", "OFFER", "LOTSIZE")
+# Параметры для ГО%: INITIAL_MARGIN, MINSTEP, STEPPRICE, LOTSIZE (имена могут отличаться у брокеров —
+# если что‑то None, просто пропускаем расчёт ГО). Дата экспирации — 'MAT_DATE' (ддммГГГГ), строкой
+QUIK_FUT_PARAMS = ("LAST", "BID", "OFFER", "INITIAL_MARGIN", "MINSTEP", "STEPPRICE", "LOTSIZE", "MAT_DATE")
+
+
+def _quik_mat_date_iso(mat_date_raw: Optional[str]) -> Optional[str]:
+    if mat_date_raw and len(mat_date_raw) == 8 and mat_date_raw.isdigit():
+        # формат QUIK: ДДММГГГГ → ISO: ГГГГ-ММ-ДД
+        d = mat_date_raw
+        return f"{d[4:]}-{d[2:4]}-{d[0:2]}"
+    return None
+
+
+def _refresh_spot_quik(qp: QuikPy, now: float, shares: Optional[List[str]] = None) -> None:
+    shares = SYMBOLS if shares is None else shares
+    n = len(QUIK_SPOT_PARAMS)
+    values = quik_params(qp, [(QUIK_SPOT_CLASS, secid, p) for secid in shares for p in QUIK_SPOT_PARAMS])
+    for i, secid in enumerate(shares):
+        last, bid, offer, lotsize = (_num(v) for v in values[i * n:(i + 1) * n])
         if any(v is not None for v in (last, bid, offer)):
-            CACHE["spot"][secid] = {"last": last, "bid": bid, "offer": offer, "ts": now}
+            CACHE["spot"][secid] = {"last": last, "bid": bid, "offer": offer, "lotsize": lotsize, "ts": now}
 
-def _refresh_futures_quik(qp: QuikPy, now: float) -> None:
-    for share in SYMBOLS:
+def _refresh_futures_quik(qp: QuikPy, now: float, shares: Optional[List[str]] = None) -> None:
+    codes: List[tuple] = []
+    for share in (SYMBOLS if shares is None else shares):
         fut_code = quik_fut_code_for_share(share)  # например, 'SBRF-12.25'
-        ui_code  = ui_fut_code(share)
+        CACHE["map"].setdefault(share, {"secid": fut_code, "ui": ui_fut_code(share)})
+        if fut_code:
+            codes.append((share, fut_code))
 
-        CACHE["map"].setdefault(share, {"secid": fut_code, "ui": ui_code})
-        if not fut_code:
-            continue
-
-        last   = quik_param(qp, QUIK_FUT_CLASS, fut_code, "LAST")
-        bid    = quik_param(qp, QUIK_FUT_CLASS, fut_code, "BID")
-        offer  = quik_param(qp, QUIK_FUT_CLASS, fut_code, "OFFER")
-
-        # Параметры для ГО%: INITIAL_MARGIN, MINSTEP, STEPPRICE, LOTSIZE (имена могут отличаться у брокеров —
-        # если что‑то None, просто пропускаем расчёт ГО)
-        im         = quik_param(qp, QUIK_FUT_CLASS, fut_code, "INITIAL_MARGIN")
-        minstep    = quik_param(qp, QUIK_FUT_CLASS, fut_code, "MINSTEP")
-        stepprice  = quik_param(qp, QUIK_FUT_CLASS, fut_code, "STEPPRICE")
-        lotvolume  = quik_param(qp, QUIK_FUT_CLASS, fut_code, "LOTSIZE")  # иногда LOTSIZE/LOT_SIZE
-
-        # Дата экспирации (строкой). В QUIK часто 'MAT_DATE' (ддммГГГГ) и/или 'DAYS_TO_MAT_DATE'
-        mat_date_raw = quik_param_str(qp, QUIK_FUT_CLASS, fut_code, "MAT_DATE")
-        exp_iso = None
-        if mat_date_raw and len(mat_date_raw) == 8 and mat_date_raw.isdigit():
-            # формат QUIK: ДДММГГГГ → ISO: ГГГГ-ММ-ДД
-            d = mat_date_raw
-            exp_iso = f"{d[4:]}-{d[2:4]}-{d[0:2]}"
+    n = len(QUIK_FUT_PARAMS)
+    values = quik_params(qp, [(QUIK_FUT_CLASS, fut_code, p) for _, fut_code in codes for p in QUIK_FUT_PARAMS])
+    for i, (share, fut_code) in enumerate(codes):
+        raw = values[i * n:(i + 1) * n]
+        last, bid, offer, im, minstep, stepprice, lotvolume = (_num(v) for v in raw[:-1])
+        exp_iso = _quik_mat_date_iso(raw[-1])
 
         if any(v is not None for v in (last, bid, offer, im, minstep, stepprice, lotvolume, exp_iso)):
             CACHE["fut"][fut_code] = {
@@ -593,9 +975,18 @@ def _refresh_futures_quik(qp: QuikPy, now: float) -> None:
                 "lotvolume": lotvolume,
                 "ts": now,
             }
-            CACHE["map"][share] = {"secid": fut_code, "ui": ui_code}
+            CACHE["map"][share] = {"secid": fut_code, "ui": ui_fut_code(share)}
 
-def refresh_cache_quik_blocking() -> None:
+def refresh_cache_quik_blocking(instruments: Optional[Iterable[Tuple[str, str]]] = None) -> None:
+    """Read QUIK parameters into the cache.  ``instruments`` limits the read
+    to the given ``(class_code, sec_code)`` pairs; ``None`` reads everything."""
+    if QUIK_SESSION is None:
+        return
+    try:
+        qp = QUIK_SESSION.client(timeout=REFRESH_SEC)
+    except QuikUnavailableError:
+        # терминал недоступен — сессия переподключится сама, кэш оставляем как есть
+        return
     now = _now_ts()
     # обнуляем разделы, чтобы избежать "старого" мусора
     CACHE.setdefault("spot", {})
@@ -603,120 +994,303 @@ def refresh_cache_quik_blocking() -> None:
     CACHE.setdefault("divs", {})
     CACHE.setdefault("map", {})
 
-    with QuikPy() as qp:
+    if instruments is None:
         _refresh_spot_quik(qp, now)
         _refresh_futures_quik(qp, now)
-        # Дивиденды из QUIK не тянем — оставляем None
-        for secid in SYMBOLS:
-            rec = CACHE["divs"].get(secid) or {}
-            if not rec:
-                CACHE["divs"][secid] = {"ex_date": None, "value": None, "ts": now}
+    else:
+        tracked = _quik_instruments()
+        spot = [tracked[k] for k in instruments if k[0] == QUIK_SPOT_CLASS and k in tracked]
+        fut = [tracked[k] for k in instruments if k[0] == QUIK_FUT_CLASS and k in tracked]
+        if spot:
+            _refresh_spot_quik(qp, now, spot)
+        if fut:
+            _refresh_futures_quik(qp, now, fut)
+    # Дивидендов в QUIK нет: их загружает из ISS _dividends_loop, до загрузки — None
+    for secid in SYMBOLS:
+        rec = CACHE["divs"].get(secid) or {}
+        if not rec:
+            CACHE["divs"][secid] = {"ex_date": None, "value": None, "ts": now}
+
+# Потоковый режим QUIK
+def _quik_instruments() -> Dict[Tuple[str, str], str]:
+    """Every ``(class_code, sec_code)`` the screener reads, mapped to its share."""
+    out: Dict[Tuple[str, str], str] = {}
+    for share in SYMBOLS:
+        out[(QUIK_SPOT_CLASS, share)] = share
+        fut_code = quik_fut_code_for_share(share)
+        if fut_code:
+            out[(QUIK_FUT_CLASS, fut_code)] = share
+    return out
 
-# -----------------------------------------------------------------------------
-# Row computations
-# -----------------------------------------------------------------------------
-def build_row(share: str) -> ScreenerRow:
-    """Assemble a ``ScreenerRow`` from cached spot, futures and dividend data."""
-    # spot quote
-    s = CACHE["spot"].get(share, {})
-    s_last, s_bid, s_offer = s.get("last"), s.get("bid"), s.get("offer")
-    # futures mapping & quote
-    m = CACHE["map"].get(share, {})
-    fut_secid = m.get("secid")
-    ui_code   = m.get("ui") or ui_fut_code(share)
-    f = CACHE["fut"].get(fut_secid or "", {})
-    f_last, f_bid, f_offer = f.get("last"), f.get("bid"), f.get("offer")
-    im, minstep, stepprice = f.get("im"), f.get("minstep"), f.get("stepprice")
-    exp = f.get("exp")
-    # dividends
-    d = CACHE["divs"].get(share, {})
-    ex_date, div_val = d.get("ex_date"), d.get("value")
-    # ГО calculation: initial margin to contract value
-    go_pct: Optional[float] = None
-    multiplier: Optional[float] = None
-    if minstep and stepprice and minstep != 0:
-        multiplier = stepprice / minstep
-    if im and f_last and multiplier:
-        try:
-            go_pct = round(im / (f_last * multiplier) * 100, 4)
-        except ZeroDivisionError:
-            go_pct = None
-    # Spreads (enter and exit)
-    spread_in_pct: Optional[float] = None
-    if f_offer and s_bid:
-        spread_in_pct = round((f_offer - s_bid) / s_bid * 100, 4)
-    spread_out_pct: Optional[float] = None
-    if s_offer and f_bid:
-        spread_out_pct = round((s_offer - f_bid) / s_offer * 100, 4)
-    # Delta (futures minus spot)
-    delta_pct: Optional[float] = None
-    if (f_last is not None) and (s_last is not None) and s_last != 0:
-        delta_pct = round((f_last - s_last) / s_last * 100, 4)
-    # Dividend yield
-    div_pct: Optional[float] = None
-    if (div_val is not None) and (s_last is not None) and s_last != 0:
-        div_pct = round((div_val / s_last) * 100, 4)
-    # Total return: sum of delta and dividend
-    total_pct: Optional[float] = None
-    if div_pct is not None or delta_pct is not None:
-        total_pct = round((div_pct or 0.0) + (delta_pct or 0.0), 4)
-    # Fair value (Справ. Стоимость) – simple theoretical value: spot + dividend
-    fair_value: Optional[float] = None
-    if (s_last is not None) and (div_val is not None):
-        fair_value = round(s_last + div_val, 4)
-    # Days differences
-    def days_to(iso: Optional[str]) -> Optional[int]:
-        if not iso:
-            return None
+
+_QUIK_TRACKED: Dict[Tuple[str, str], str] = {}
+_QUIK_DIRTY: Set[Tuple[str, str]] = set()
+_QUIK_DIRTY_LOCK = threading.Lock()
+_QUIK_DIRTY_EVENT = threading.Event()
+_QUIK_STREAM_STOP = threading.Event()
+_QUIK_STREAM_THREAD: Optional[threading.Thread] = None
+
+
+def _quik_mark_dirty(keys: Iterable[Tuple[str, str]]) -> None:
+    with _QUIK_DIRTY_LOCK:
+        _QUIK_DIRTY.update(keys)
+    _QUIK_DIRTY_EVENT.set()
+
+
+def _on_quik_param(data: dict) -> None:
+    """OnParam handler: only remember what changed, reads happen off the
+    callback thread."""
+    d = data.get("data") or {}
+    key = (d.get("class_code"), d.get("sec_code"))
+    if key in _QUIK_TRACKED:
+        _quik_mark_dirty((key,))
+
+
+def _quik_stream_subscribe(qp: QuikPy) -> None:
+    """Session connect hook: order every screener parameter and listen to
+    OnParam.  Runs again after each reconnect."""
+    global _QUIK_TRACKED
+    _QUIK_TRACKED = _quik_instruments()
+    qp.on_param = _on_quik_param
+    specs = [
+        f"{c}|{s}|{p}"
+        for (c, s) in _QUIK_TRACKED
+        for p in (QUIK_SPOT_PARAMS if c == QUIK_SPOT_CLASS else QUIK_FUT_PARAMS)
+    ]
+    qp.param_request_bulk(specs)
+    # после (пере)подключения перечитываем всё
+    _quik_mark_dirty(_QUIK_TRACKED)
+
+
+def _quik_stream_loop() -> None:
+    """Re‑read instruments reported by OnParam.  Changes that arrive while a
+    read is running are merged into the next one; a full resync runs if
+    nothing was reported for ``QUIK_STREAM_RESYNC_SEC``."""
+    while not _QUIK_STREAM_STOP.is_set():
+        changed = _QUIK_DIRTY_EVENT.wait(QUIK_STREAM_RESYNC_SEC)
+        if _QUIK_STREAM_STOP.is_set():
+            break
+        _QUIK_DIRTY_EVENT.clear()
+        with _QUIK_DIRTY_LOCK:
+            dirty = set(_QUIK_DIRTY)
+            _QUIK_DIRTY.clear()
         try:
-            return (datetime.fromisoformat(str(iso)).date() - datetime.now(timezone.utc).date()).days
+            refresh_cache_quik_blocking(dirty if changed else None)
         except Exception:
-            return None
-    return ScreenerRow(
-        Акция=share,
-        Фьючерс=ui_code,
-        Дата_див_отсечки=ex_date,
-        Размер_див_руб=div_val,
-        Див_pct=div_pct,
-        Цена_акции=round(s_last, 4) if s_last is not None else None,
-        Цена_фьючерса=round(f_last, 4) if f_last is not None else None,
-        ГО_pct=go_pct,
-        Спред_Входа_pct=spread_in_pct,
-        Спред_Выхода_pct=spread_out_pct,
-        Справ_Стоимость=fair_value,
-        Дельта_pct=delta_pct,
-        Всего_pct=total_pct,
-        Дней_до_отсечки=days_to(ex_date),
-        Дней_до_эксп=days_to(exp),
-        Доход_к_отсечке_pct=div_pct,
-        Доход_к_эксп_pct=total_pct,
-    )
+            pass
+
+
+# Справочник тикеров QUIK
+def _quik_prefetch_symbols(qp: QuikPy) -> None:
+    """Session connect hook: fill the symbol store for every screener
+    instrument in two bulk requests, so price conversions stay local."""
+    qp.prefetch_symbols(list(_quik_instruments()))
+
+
+# Стаканы QUIK
+BOOKS = BookStore(max(1, QUIK_BOOK_DEPTH))
+
+
+def _quik_books_subscribe(qp: QuikPy) -> None:
+    """Session connect hook: order level‑2 quotes of every screener
+    instrument and seed the books.  Runs again after each reconnect."""
+    qp.on_quote = BOOKS.on_quote
+    for class_code, sec_code in _quik_instruments():
+        BOOKS.track(class_code, sec_code)
+        qp.subscribe_level2_quotes(class_code, sec_code)
+        snapshot = (qp.get_quote_level2(class_code, sec_code) or {}).get("data")
+        if isinstance(snapshot, dict):
+            BOOKS.apply(class_code, sec_code, snapshot)
+
+
+# Свечи QUIK
+CANDLES = CandleStore(CANDLES_DIR)
+# серии, которые уже запрашивали: после переподключения догружаются и подписываются снова
+_CANDLE_SUBS: Set[Tuple[str, str, int]] = set()
+_CANDLE_SUBS_LOCK = threading.Lock()
+
+
+def _quik_candles_attach(qp: QuikPy, class_code: str, sec_code: str, interval: int) -> None:
+    CANDLES.backfill(qp, class_code, sec_code, interval)
+    qp.subscribe_to_candles(class_code, sec_code, interval)
+
+
+def _quik_candles_subscribe(qp: QuikPy) -> None:
+    """Session connect hook: route NewCandle to the store, then catch up
+    and resubscribe every series requested so far."""
+    qp.on_new_candle = CANDLES.on_new_candle
+    with _CANDLE_SUBS_LOCK:
+        subs = list(_CANDLE_SUBS)
+    for class_code, sec_code, interval in subs:
+        _quik_candles_attach(qp, class_code, sec_code, interval)
+
 
+# Лента обезличенных сделок QUIK
+TRADES: Optional[TradeRecorder] = TradeRecorder(QUIK_TRADES_DIR) if QUIK_TRADES_DIR else None
+
+
+def _quik_trades_record(qp: QuikPy) -> None:
+    """Session connect hook: write every OnAllTrade into the tape."""
+    qp.on_all_trade = TRADES.on_all_trade
+
+
+# -----------------------------------------------------------------------------
+# Row computations
+# -----------------------------------------------------------------------------
+def build_snapshot(shares: List[str]) -> Snapshot:
+    """Gather the cached inputs of ``shares`` into a columnar :class:`Snapshot`."""
+    spot, fut, divs, mapping = CACHE["spot"], CACHE["fut"], CACHE["divs"], CACHE["map"]
+    cols: Dict[str, list] = {name: [] for name in ("s_last", "s_bid", "s_offer", "s_lot", "f_last", "f_bid",
+                                                   "f_offer", "im", "minstep", "stepprice", "div")}
+    ui: List[str] = []
+    fut_codes: List[Optional[str]] = []
+    ex_dates: List[Optional[str]] = []
+    exp_dates: List[Optional[str]] = []
+    for share in shares:
+        sq = spot.get(share, {})
+        m = mapping.get(share, {})
+        fut_secid = m.get("secid")
+        fq = fut.get(fut_secid or "", {})
+        d = divs.get(share, {})
+        cols["s_last"].append(sq.get("last"))
+        cols["s_bid"].append(sq.get("bid"))
+        cols["s_offer"].append(sq.get("offer"))
+        cols["s_lot"].append(sq.get("lotsize"))
+        cols["f_last"].append(fq.get("last"))
+        cols["f_bid"].append(fq.get("bid"))
+        cols["f_offer"].append(fq.get("offer"))
+        cols["im"].append(fq.get("im"))
+        cols["minstep"].append(fq.get("minstep"))
+        cols["stepprice"].append(fq.get("stepprice"))
+        cols["div"].append(d.get("value"))
+        ui.append(m.get("ui") or ui_fut_code(share))
+        fut_codes.append(fut_secid)
+        ex_dates.append(d.get("ex_date"))
+        exp_dates.append(fq.get("exp"))
+    snap = Snapshot(shares, ui, ex_dates, exp_dates, cols)
+    if QUIK_BOOK_DEPTH:
+        # VWAP over the books: the same legs as the quoted spreads, for BOOK_SIZE_RUB
+        mult = snap.multiplier().tolist()
+        lots = snap.cols["s_lot"].tolist()
+        x = {name: snap.cols[name] for name in ("f_ask_x", "f_bid_x", "s_bid_x", "s_ask_x")}
+        for i, (share, fut_secid) in enumerate(zip(shares, fut_codes)):
+            if not (fut_secid and mult[i] == mult[i] and lots[i]):
+                continue
+            x["f_ask_x"][i] = BOOKS.vwap(QUIK_FUT_CLASS, fut_secid, "ask", BOOK_SIZE_RUB, mult[i]) or np.nan
+            x["f_bid_x"][i] = BOOKS.vwap(QUIK_FUT_CLASS, fut_secid, "bid", BOOK_SIZE_RUB, mult[i]) or np.nan
+            x["s_bid_x"][i] = BOOKS.vwap(QUIK_SPOT_CLASS, share, "bid", BOOK_SIZE_RUB, lots[i]) or np.nan
+            x["s_ask_x"][i] = BOOKS.vwap(QUIK_SPOT_CLASS, share, "ask", BOOK_SIZE_RUB, lots[i]) or np.nan
+    return snap
+
+
+_ROWS: Tuple[float, List[dict]] = (float("-inf"), [])
+_ROWS_LOCK = threading.Lock()
+
+
+def screener_rows() -> List[dict]:
+    """Screener rows of all symbols as plain dicts, recomputed at most every
+    ``SNAPSHOT_TTL_SEC`` seconds."""
+    global _ROWS
+    ts, rows = _ROWS
+    if time.monotonic() - ts < SNAPSHOT_TTL_SEC:
+        return rows
+    with _ROWS_LOCK:
+        ts, rows = _ROWS
+        if time.monotonic() - ts >= SNAPSHOT_TTL_SEC:
+            rows = build_snapshot(SYMBOLS).rows(datetime.now(timezone.utc).date())
+            _ROWS = (time.monotonic(), rows)
+    return rows
 
 # -----------------------------------------------------------------------------
 # FastAPI endpoints
 # -----------------------------------------------------------------------------
+_REFRESH_TASK: Optional[asyncio.Task] = None
+_DIVIDENDS_TASK: Optional[asyncio.Task] = None
+
+
 @app.on_event("startup")
 async def _startup() -> None:
     """Kick off the background refresh loop on startup."""
+    global QUIK_SESSION, SYMBOL_SPECS, _REFRESH_TASK, _DIVIDENDS_TASK, _QUIK_STREAM_THREAD
+    # dividend columns are served from the store right away
+    _load_dividends()
+    if USE_QUIK:
+        SYMBOL_SPECS = SymbolSpecStore(QUIK_SYMBOLS_FILE or None, step_price_ttl=QUIK_STEPPRICE_TTL)
+        QUIK_SESSION = QuikSession(_new_quik, ping_interval=QUIK_PING_SEC,
+                                   backoff_max=QUIK_RECONNECT_MAX_SEC)
+        QUIK_SESSION.add_connect_hook(_quik_prefetch_symbols)
+        QUIK_SESSION.add_connect_hook(_quik_candles_subscribe)
+        if TRADES is not None:
+            QUIK_SESSION.add_connect_hook(_quik_trades_record)
+        if QUIK_STREAM:
+            QUIK_SESSION.add_connect_hook(_quik_stream_subscribe)
+            _QUIK_STREAM_STOP.clear()
+            _QUIK_STREAM_THREAD = threading.Thread(target=_quik_stream_loop, name="QuikStreamThread", daemon=True)
+            _QUIK_STREAM_THREAD.start()
+        if QUIK_BOOK_DEPTH:
+            QUIK_SESSION.add_connect_hook(_quik_books_subscribe)
+        QUIK_SESSION.start()
     # Perform an initial refresh synchronously to populate the cache
     await refresh_cache()
+    if not OFFLINE:
+        async def dividends() -> None:
+            while True:
+                try:
+                    await _refresh_dividends(iss_client(), _now_ts())
+                except Exception:
+                    pass
+                await asyncio.sleep(min(DIV_REFRESH_SEC, 60))
+        _DIVIDENDS_TASK = asyncio.create_task(dividends())
+    if USE_QUIK and QUIK_STREAM:
+        # в потоковом режиме кэш обновляет _quik_stream_loop
+        return
+    SCHEDULER.add([(market, share) for share in SYMBOLS for market in ("spot", "fut")], _now_ts() + REFRESH_SEC)
     async def worker() -> None:
         while True:
-            try:
-                await refresh_cache()
-            except Exception:
-                # suppress exceptions – they'll be logged by httpx but should not
-                # crash the background task
-                pass
-            await asyncio.sleep(REFRESH_SEC)
-    asyncio.create_task(worker())
-
-
-@app.get("/screener", response_model=List[ScreenerRow])
-def get_screener() -> List[ScreenerRow]:
+            keys = SCHEDULER.due(_now_ts())
+            if keys:
+                before = {k: _quote_sig(*k) for k in keys}
+                try:
+                    await refresh_scheduled(keys)
+                except Exception:
+                    # suppress exceptions – they'll be logged by httpx but should not
+                    # crash the background task
+                    pass
+                now = _now_ts()
+                for k in keys:
+                    SCHEDULER.done(k, _quote_sig(*k) != before[k], now)
+            next_due = SCHEDULER.next_due()
+            await asyncio.sleep(REFRESH_SEC if next_due is None else max(0.0, next_due - _now_ts()))
+    _REFRESH_TASK = asyncio.create_task(worker())
+
+
+@app.on_event("shutdown")
+async def _shutdown() -> None:
+    """Stop the refresh loop, close the QUIK session and the ISS client."""
+    global QUIK_SESSION
+    if _REFRESH_TASK is not None:
+        _REFRESH_TASK.cancel()
+    if _DIVIDENDS_TASK is not None:
+        _DIVIDENDS_TASK.cancel()
+    if ISS_CLIENT is not None:
+        await ISS_CLIENT.aclose()
+    _QUIK_STREAM_STOP.set()
+    _QUIK_DIRTY_EVENT.set()
+    if QUIK_SESSION is not None:
+        await asyncio.get_running_loop().run_in_executor(EXECUTOR, QUIK_SESSION.close)
+        QUIK_SESSION = None
+    if SYMBOL_SPECS is not None:
+        SYMBOL_SPECS.save()
+    CANDLES.flush()
+    if TRADES is not None:
+        TRADES.close()
+    DIVIDENDS.close()
+
+
+@app.get("/screener", response_class=JSONResponse, responses={200: {"model": List[ScreenerRow]}})
+def get_screener() -> JSONResponse:
     """Return the current screener rows for all configured symbols."""
-    return [build_row(s) for s in SYMBOLS]
+    return JSONResponse(screener_rows())
 
 
 @app.websocket("/ws/screener")
@@ -725,13 +1299,39 @@ async def ws_screener(ws: WebSocket) -> None:
     await ws.accept()
     try:
         while True:
-            rows = [build_row(s) for s in SYMBOLS]
-            await ws.send_json({"type": "screener", "data": [r.model_dump() for r in rows]})
+            await ws.send_json({"type": "screener", "data": screener_rows()})
             await asyncio.sleep(1.0)
     except WebSocketDisconnect:
         pass
 
 
+@app.get("/candles/{class_code}/{sec_code}/{interval}")
+def get_candles(class_code: str, sec_code: str, interval: int,
+                start: Optional[int] = None, end: Optional[int] = None) -> Dict[str, Any]:
+    """Candles with ``start <= time < end`` (UTC epoch seconds) from the
+    local store.  The first request for a series loads its history from
+    QUIK and subscribes to live bars.  Only instruments the screener
+    tracks and QUIK candle intervals are served."""
+    class_code, sec_code = class_code.upper(), sec_code.upper()
+    if interval not in CANDLE_INTERVALS:
+        raise HTTPException(400, f"interval must be one of {sorted(CANDLE_INTERVALS)}")
+    if (class_code, sec_code) not in _quik_instruments():
+        raise HTTPException(404, f"{class_code}.{sec_code} is not tracked")
+    key = (class_code, sec_code, interval)
+    with _CANDLE_SUBS_LOCK:
+        new = key not in _CANDLE_SUBS
+    if new and QUIK_SESSION is not None:
+        try:
+            _quik_candles_attach(QUIK_SESSION.client(timeout=QUIK_REQUEST_TIMEOUT), class_code, sec_code, interval)
+        except (QuikUnavailableError, OSError, FutureTimeoutError):
+            pass  # отдаём сохранённое; следующий запрос попробует подписаться снова
+        else:
+            with _CANDLE_SUBS_LOCK:
+                _CANDLE_SUBS.add(key)
+    bars = CANDLES.series(class_code, sec_code, interval).slice(start, end)
+    return {name: col.tolist() for name, col in bars.items()}
+
+
 @app.get("/symbols", response_model=List[str])
 def get_symbols() -> List[str]:
     """Return the configured list of share SECIDs."""
@@ -749,24 +1349,67 @@ def debug_peek(secid: str) -> Dict[str, Any]:
 async def debug_peek_fut(share: str) -> Dict[str, Any]:
     """Find and fetch futures data for a share without touching the cache."""
     share = share.upper()
-    async with httpx.AsyncClient(headers={"User-Agent": "screener/debug"}, trust_env=False) as client:
-        found = await find_fut_secid_on_board(client, share, year_dec=YEAR_DEC)
-        info = None
-        if found:
-            try:
-                info = await fetch_fut_md_and_params(client, found["secid"])
-            except Exception:
-                info = None
-        return {"share": share, "found": found, "info": info}
+    client = iss_client()
+    found = await find_fut_secid_on_board(client, share, year_dec=YEAR_DEC)
+    info = None
+    if found:
+        try:
+            info = await fetch_fut_md_and_params(client, found["secid"])
+        except Exception:
+            info = None
+    return {"share": share, "found": found, "info": info}
+
+
+@app.get("/debug/scheduler")
+def debug_scheduler() -> dict:
+    """Refresh scheduler state: cadences, missed deadlines, open sessions."""
+    return SCHEDULER.stats(_now_ts())
+
+
+@app.get("/debug/iss_client")
+def debug_iss_client() -> dict:
+    """Connection pool statistics of the ISS client."""
+    return ISS_CLIENT.stats() if ISS_CLIENT is not None else {}
 
 from QuikPy import QuikPy
 
 @app.get("/debug/quik/{secid}")
 def debug_quik(secid: str) -> dict:
     """Прямой запрос к терминалу QUIK через QuikPy"""
-    with QuikPy(callbacks=False) as qp:
-        info = qp.getParam_ex2("TQBR", secid.upper(), "LAST")
-    return info
+    if QUIK_SESSION is not None:
+        try:
+            return QUIK_SESSION.client(timeout=QUIK_REQUEST_TIMEOUT).get_param_ex2(QUIK_SPOT_CLASS, secid.upper(), "LAST")
+        except QuikUnavailableError as e:
+            return {"error": str(e)}
+    # без общей сессии — разовое подключение только для запросов (одно соединение, без счетов)
+    with QuikPy(host=QUIK_HOST, requests_port=QUIK_REQUESTS_PORT, callbacks=False) as qp:
+        return qp.get_param_ex2(QUIK_SPOT_CLASS, secid.upper(), "LAST")
+
+@app.get("/debug/quik_session")
+def debug_quik_session() -> dict:
+    """Состояние долгоживущего соединения с QUIK"""
+    status = QUIK_SESSION.status() if QUIK_SESSION is not None else {"connected": False}
+    return {**status, "single_flight": QUIK_FLIGHTS.stats()}
+
+@app.get("/debug/quik_callbacks")
+def debug_quik_callbacks() -> dict:
+    """Счётчики и время обработчиков функций обратного вызова QUIK"""
+    if QUIK_SESSION is None:
+        return {}
+    try:
+        return QUIK_SESSION.client().get_callback_stats()
+    except QuikUnavailableError as e:
+        return {"error": str(e)}
+
+@app.get("/debug/quik_book/{class_code}/{sec_code}")
+def debug_quik_book(class_code: str, sec_code: str) -> dict:
+    """Стакан инструмента из памяти и общая статистика стаканов"""
+    book = BOOKS.get(class_code.upper(), sec_code.upper())
+    return {
+        "stats": BOOKS.stats(),
+        "ts": book.ts if book is not None else None,
+        "book": book.levels() if book is not None else None,
+    }
 
 @app.get("/debug/quik_cache/{share}")
 def debug_quik_cache(share: str) -> dict:
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+# Level‑2 order books kept in flat arrays, updated from QUIK OnQuote
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+def _fill(px: array, qty: array, levels: Sequence[dict], reverse: bool) -> int:
+    """Copy up to ``len(px)`` levels into ``px``/``qty`` best first."""
+    total = len(levels)
+    n = min(total, len(px))
+    for i in range(n):
+        level = levels[total - 1 - i] if reverse else levels[i]
+        px[i] = float(level["price"])
+        qty[i] = float(level["quantity"])
+    return n
+
+
+class OrderBook:
+    """Best‑first price levels of one instrument in preallocated arrays.
+
+    Each side keeps at most ``depth`` levels.  :meth:`update` overwrites the
+    arrays in place, so a new snapshot costs O(depth) and allocates nothing
+    but the parsed numbers.
+    """
+
+    __slots__ = ("depth", "bid_px", "bid_qty", "n_bid", "ask_px", "ask_qty", "n_ask", "ts", "updates")
+
+    def __init__(self, depth: int = 20) -> None:
+        self.depth = depth
+        self.bid_px = array("d", [0.0]) * depth
+        self.bid_qty = array("d", [0.0]) * depth
+        self.ask_px = array("d", [0.0]) * depth
+        self.ask_qty = array("d", [0.0]) * depth
+        self.n_bid = 0
+        self.n_ask = 0
+        self.ts: Optional[float] = None
+        self.updates = 0
+
+    def update(self, bids: Sequence[dict], offers: Sequence[dict], ts: Optional[float] = None) -> None:
+        """Replace the book with a QUIK snapshot.
+
+        QUIK lists both sides by ascending price, so the best bid comes last;
+        either order is accepted.
+        """
+        self.n_bid = self.n_ask = 0  # a failed parse leaves an empty book, not a torn one
+        self.n_bid = _fill(self.bid_px, self.bid_qty, bids,
+                           len(bids) > 1 and float(bids[0]["price"]) < float(bids[-1]["price"]))
+        self.n_ask = _fill(self.ask_px, self.ask_qty, offers,
+                           len(offers) > 1 and float(offers[0]["price"]) > float(offers[-1]["price"]))
+        self.ts = time.time() if ts is None else ts
+        self.updates += 1
+
+    def best(self, side: str) -> Optional[float]:
+        """Top‑of‑book price of ``'bid'`` or ``'ask'``."""
+        if side == "bid":
+            return self.bid_px[0] if self.n_bid else None
+        return self.ask_px[0] if self.n_ask else None
+
+    def vwap(self, side: str, value: float, unit: float = 1.0) -> Optional[float]:
+        """Average price paid when taking ``value`` money from ``side``.
+
+        A level is worth ``price * quantity * unit``, where ``unit`` converts
+        one lot at one price point into money (shares per lot for stocks,
+        ``STEPPRICE / MINSTEP`` for futures).  ``None`` if the visible book
+        is too thin; ``value <= 0`` gives the best price.
+        """
+        if side == "bid":
+            px, qty, n = self.bid_px, self.bid_qty, self.n_bid
+        else:
+            px, qty, n = self.ask_px, self.ask_qty, self.n_ask
+        if not n:
+            return None
+        if value <= 0:
+            return px[0]
+        left, filled, cost = value, 0.0, 0.0
+        for i in range(n):
+            p = px[i]
+            level_value = p * qty[i] * unit
+            if level_value >= left:
+                take = left / (p * unit)
+                return (cost + take * p) / (filled + take)
+            cost += p * qty[i]
+            filled += qty[i]
+            left -= level_value
+        return None
+
+    def levels(self) -> Dict[str, List[Tuple[float, float]]]:
+        """Both sides as ``(price, quantity)`` lists, for diagnostics."""
+        return {
+            "bid": [(self.bid_px[i], self.bid_qty[i]) for i in range(self.n_bid)],
+            "ask": [(self.ask_px[i], self.ask_qty[i]) for i in range(self.n_ask)],
+        }
+
+
+class BookStore:
+    """Order books of the tracked instruments, keyed by ``(class_code, sec_code)``.
+
+    :meth:`on_quote` is a QuikPy ``on_quote`` handler; snapshots of
+    instruments that were not :meth:`track`-ed are ignored, so no book is
+    allocated on the callback path.
+    """
+
+    def __init__(self, depth: int = 20) -> None:
+        self.depth = depth
+        self._books: Dict[Tuple[str, str], OrderBook] = {}
+        self._lock = threading.Lock()
+        self.ignored = 0
+
+    def track(self, class_code: str, sec_code: str) -> OrderBook:
+        key = (class_code, sec_code)
+        with self._lock:
+            book = self._books.get(key)
+            if book is None:
+                book = self._books[key] = OrderBook(self.depth)
+            return book
+
+    def get(self, class_code: str, sec_code: str) -> Optional[OrderBook]:
+        return self._books.get((class_code, sec_code))
+
+    def apply(self, class_code: str, sec_code: str, snapshot: Dict[str, Any], ts: Optional[float] = None) -> bool:
+        """Apply a QUIK level‑2 snapshot (``bid``/``offer`` lists of
+        ``{price, quantity}``).  Returns ``False`` for untracked instruments."""
+        book = self._books.get((class_code, sec_code))
+        if book is None:
+            self.ignored += 1
+            return False
+        with self._lock:
+            book.update(snapshot.get("bid") or (), snapshot.get("offer") or (), ts)
+        return True
+
+    def on_quote(self, data: dict) -> None:
+        """QUIK OnQuote handler."""
+        d = data.get("data") or {}
+        self.apply(d.get("class_code"), d.get("sec_code"), d)
+
+    def vwap(self, class_code: str, sec_code: str, side: str, value: float, unit: float = 1.0) -> Optional[float]:
+        """:meth:`OrderBook.vwap` of one instrument; ``None`` without a book."""
+        book = self._books.get((class_code, sec_code))
+        if book is None:
+            return None
+        with self._lock:
+            return book.vwap(side, value, unit)
+
+    def stats(self) -> Dict[str, Any]:
+        books = list(self._books.values())
+        return {
+            "books": len(books),
+            "filled": sum(1 for b in books if b.ts is not None),
+            "updates": sum(b.updates for b in books),
+            "ignored": self.ignored,
+        }
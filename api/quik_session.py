@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+# Long‑lived QUIK connection shared by the whole process
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from QuikPy import QuikPy
+
+logger = logging.getLogger("QuikSession")
+
+
+class QuikUnavailableError(ConnectionError):
+    """Raised when no live QUIK connection is available."""
+
+
+class QuikSession:
+    """Own one ``QuikPy`` for the lifetime of the application.
+
+    A background health thread connects, pings the terminal every
+    ``ping_interval`` seconds and, when the connection breaks, closes it and
+    reconnects with exponential backoff between ``backoff_min`` and
+    ``backoff_max`` seconds.  Callers borrow the current client with
+    :meth:`client`; they never open or close connections themselves.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], QuikPy],
+        ping_interval: float = 5.0,
+        ping_timeout: float = 5.0,
+        backoff_min: float = 1.0,
+        backoff_max: float = 60.0,
+    ) -> None:
+        self.factory = factory
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self._qp: Optional[QuikPy] = None
+        self._lock = threading.Lock()
+        self._connected = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._connect_hooks: List[Callable[[QuikPy], None]] = []
+        self.connects = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_ping_ts: Optional[float] = None
+
+    # -- lifecycle ---------------------------------------------------------
+    def start(self) -> None:
+        """Start the health thread.  The first connect happens there."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="QuikSessionThread", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """Stop the health thread and close the connection."""
+        self._stop.set()
+        self._drop()
+        if self._thread is not None:
+            self._thread.join(self.ping_timeout + 1)
+            self._thread = None
+
+    def add_connect_hook(self, hook: Callable[[QuikPy], None]) -> None:
+        """Call ``hook(qp)`` on every new connection before it is handed out,
+        e.g. to install callback handlers and request parameters.  Add hooks
+        before :meth:`start`."""
+        self._connect_hooks.append(hook)
+
+    # -- access ------------------------------------------------------------
+    def client(self, timeout: float = 0.0) -> QuikPy:
+        """Return the live client, waiting up to ``timeout`` seconds for a
+        (re)connect.  Raises :class:`QuikUnavailableError` otherwise."""
+        if not self._connected.wait(timeout):
+            raise QuikUnavailableError(self.last_error or "QUIK is not connected")
+        with self._lock:
+            qp = self._qp
+        if qp is None or not qp.is_alive():
+            self.invalidate(qp)
+            raise QuikUnavailableError("QUIK connection was lost")
+        return qp
+
+    def invalidate(self, qp: Optional[QuikPy] = None) -> None:
+        """Report a broken client.  The health thread reconnects it."""
+        with self._lock:
+            if qp is not None and qp is not self._qp:
+                return  # already replaced
+        self._drop()
+
+    def status(self) -> Dict[str, Any]:
+        """Connection state for diagnostics."""
+        return {
+            "connected": self._connected.is_set(),
+            "connects": self.connects,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_ping_ts": self.last_ping_ts,
+        }
+
+    # -- internals ---------------------------------------------------------
+    def _drop(self) -> None:
+        with self._lock:
+            qp, self._qp = self._qp, None
+            self._connected.clear()
+        if qp is not None:
+            try:
+                qp.close_connection_and_thread()
+            except Exception:
+                logger.exception("error closing QUIK connection")
+
+    def _connect(self) -> bool:
+        try:
+            qp = self.factory()
+        except Exception as e:
+            self.failures += 1
+            self.last_error = f"connect: {e!r}"
+            logger.warning("QUIK connect failed: %r", e)
+            return False
+        for hook in self._connect_hooks:
+            try:
+                hook(qp)
+            except Exception:
+                # a failed subscription should not keep the session down
+                logger.exception("QUIK connect hook %r failed", hook)
+        with self._lock:
+            stopped = self._stop.is_set()
+            if not stopped:
+                self._qp = qp
+                self._connected.set()
+        if stopped:  # closed while connecting: the new client must not outlive the session
+            try:
+                qp.close_connection_and_thread()
+            except Exception:
+                logger.exception("error closing QUIK connection")
+            return False
+        self.connects += 1
+        self.last_error = None
+        logger.info("QUIK connected (%d)", self.connects)
+        return True
+
+    def _ping(self) -> bool:
+        with self._lock:
+            qp = self._qp
+        if qp is None or not qp.is_alive():
+            return False
+        request = {"data": "Ping", "id": 0, "cmd": "ping", "t": ""}
+        try:
+            if qp.multiplex:  # the reply is awaited with a deadline
+                qp.send_request(request).result(self.ping_timeout)
+            else:
+                # a plain request blocks on the socket with no deadline: ping from a
+                # helper thread so a hung terminal cannot wedge the health thread.
+                # After a timeout the client is dropped, which closes the socket
+                # and releases the helper
+                reply: Future = Future()
+                threading.Thread(target=self._ping_plain, args=(qp, request, reply),
+                                 name="QuikSessionPing", daemon=True).start()
+                reply.result(self.ping_timeout)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = f"ping: {e!r}"
+            logger.warning("QUIK ping failed: %r", e)
+            return False
+        self.last_ping_ts = time.time()
+        return True
+
+    @staticmethod
+    def _ping_plain(qp: QuikPy, request: dict, reply: Future) -> None:
+        try:
+            reply.set_result(qp.process_request(request))
+        except BaseException as e:
+            reply.set_exception(e)
+
+    def _run(self) -> None:
+        delay = self.backoff_min
+        while not self._stop.is_set():
+            if not self._connected.is_set():
+                if not self._connect():
+                    self._stop.wait(delay)
+                    delay = min(delay * 2, self.backoff_max)
+                    continue
+                delay = self.backoff_min
+            if self._stop.wait(self.ping_interval):
+                break
+            if not self._ping():
+                self._drop()
+        self._drop()  # close() may have returned before a connect in progress finished
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# Per‑symbol refresh deadlines driven by quote activity and MOEX sessions
+import heapq
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+MSK = timezone(timedelta(hours=3))
+
+# Trading windows on weekdays, minutes from midnight Moscow time.  The gaps
+# are the clearing sessions (FORTS 14:00–14:05, 18:50–19:05) and the
+# closing auction/evening break of the stock market.
+SESSIONS: Dict[str, Tuple[Tuple[int, int], ...]] = {
+    "spot": ((6 * 60 + 50, 18 * 60 + 50), (19 * 60 + 5, 23 * 60 + 50)),
+    "fut": ((8 * 60 + 50, 14 * 60), (14 * 60 + 5, 18 * 60 + 50), (19 * 60 + 5, 23 * 60 + 50)),
+}
+
+
+class TradingCalendar:
+    """Weekday trading windows of one market, minus ``holidays``."""
+
+    def __init__(self, windows: Sequence[Tuple[int, int]], holidays: Iterable[date] = ()) -> None:
+        self.windows = sorted(windows)
+        self.holidays = set(holidays)
+
+    def _trading_day(self, d: date) -> bool:
+        return d.weekday() < 5 and d not in self.holidays
+
+    def is_open(self, ts: float) -> bool:
+        t = datetime.fromtimestamp(ts, MSK)
+        if not self._trading_day(t.date()):
+            return False
+        m = t.hour * 60 + t.minute
+        return any(a <= m < b for a, b in self.windows)
+
+    def next_open(self, ts: float) -> float:
+        """Start of the first window at or after ``ts`` (``ts`` itself when open)."""
+        if self.is_open(ts):
+            return ts
+        t = datetime.fromtimestamp(ts, MSK)
+        d = t.date()
+        for _ in range(30):
+            if self._trading_day(d):
+                for a, _b in self.windows:
+                    start = datetime(d.year, d.month, d.day, a // 60, a % 60, tzinfo=MSK).timestamp()
+                    if start > ts:
+                        return start
+            d += timedelta(days=1)
+        return ts + 86400.0
+
+
+class RefreshScheduler:
+    """Heap of per‑key refresh deadlines.
+
+    A key is ``(market, symbol)``; ``market`` selects the calendar.  Each key
+    has its own interval: a refresh that changed the quote resets it to
+    ``min_interval``, an unchanged one multiplies it by ``backoff`` up to
+    ``max_interval``.  Outside the market's session a key is polled every
+    ``closed_interval`` seconds or at the session open, whichever is
+    earlier.
+
+    Deadlines are fixed‑rate: the next one is the previous deadline plus
+    the interval, not the end of the work plus the interval.  A deadline
+    that has already passed when it is set (the refresh overran) is
+    skipped and counted in ``missed``, as is a key served more than half
+    an interval late.
+    """
+
+    def __init__(self, calendars: Dict[str, TradingCalendar], min_interval: float, max_interval: float,
+                 closed_interval: float, backoff: float = 2.0) -> None:
+        self.calendars = calendars
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.closed_interval = max(min_interval, closed_interval)
+        self.backoff = backoff
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._seq = 0
+        self._interval: Dict[Hashable, float] = {}
+        self._deadline: Dict[Hashable, float] = {}
+        self.refreshes = 0
+        self.changed = 0
+        self.missed = 0
+        self.late_total = 0.0
+        self.late_max = 0.0
+
+    def _push(self, key: Hashable, due: float) -> None:
+        self._seq += 1
+        self._deadline[key] = due
+        heapq.heappush(self._heap, (due, self._seq, key))
+
+    def add(self, keys: Iterable[Tuple[str, Hashable]], start: float) -> None:
+        """Schedule new keys, first due at ``start``; known keys are kept."""
+        for key in keys:
+            if key not in self._interval:
+                self._interval[key] = self.min_interval
+                self._push(key, start)
+
+    def remove(self, key: Hashable) -> None:
+        """Forget ``key``; its heap entry is dropped when it comes due."""
+        self._interval.pop(key, None)
+        self._deadline.pop(key, None)
+
+    def next_due(self) -> Optional[float]:
+        while self._heap and self._deadline.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)  # removed or rescheduled
+        return self._heap[0][0] if self._heap else None
+
+    def due(self, now: float) -> List[Hashable]:
+        """Pop every key whose deadline is at or before ``now``."""
+        keys = []
+        while self.next_due() is not None and self._heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(self._heap)
+            late = now - deadline
+            self.late_total += late
+            self.late_max = max(self.late_max, late)
+            if late > self._interval[key] / 2:
+                self.missed += 1
+            keys.append(key)
+        return keys
+
+    def done(self, key: Hashable, changed: bool, now: float) -> None:
+        """Schedule the next refresh of ``key`` after one finished at ``now``."""
+        if key not in self._interval:
+            return
+        self.refreshes += 1
+        calendar = self.calendars.get(key[0])
+        if calendar is not None and not calendar.is_open(now):
+            self._interval[key] = self.min_interval  # start the next session at full rate
+            self._push(key, min(calendar.next_open(now), now + self.closed_interval))
+            return
+        if changed:
+            self.changed += 1
+            interval = self.min_interval
+        else:
+            interval = min(self._interval[key] * self.backoff, self.max_interval)
+        self._interval[key] = interval
+        due = self._deadline.get(key, now) + interval
+        if due <= now:
+            skipped = int((now - due) // interval) + 1
+            self.missed += skipped
+            due += skipped * interval
+        self._push(key, due)
+
+    def stats(self, now: float) -> dict:
+        intervals = list(self._interval.values())
+        n = self.refreshes
+        next_due = self.next_due()
+        return {
+            "keys": len(intervals),
+            "fast": sum(1 for i in intervals if i <= self.min_interval),
+            "slowest_sec": max(intervals, default=None),
+            "refreshes": n,
+            "changed": self.changed,
+            "missed_deadlines": self.missed,
+            "late_avg_ms": round(self.late_total / n * 1e3, 3) if n else None,
+            "late_max_ms": round(self.late_max * 1e3, 3),
+            "next_due_in_sec": None if next_due is None else round(next_due - now, 3),
+            "open": {market: c.is_open(now) for market, c in self.calendars.items()},
+        }
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# Coalescing of identical upstream fetches
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+
+def _remember(recent: Dict[Hashable, Tuple[float, Any]], key: Hashable, value: Any, ttl: float,
+              now: Optional[float] = None) -> None:
+    now = time.monotonic() if now is None else now
+    if len(recent) >= 4096:  # drop expired results now and then
+        for k in [k for k, (t, _) in recent.items() if now - t >= ttl]:
+            del recent[k]
+    recent[key] = (now, value)
+
+
+class AsyncSingleFlight:
+    """Run one coroutine per key at a time; concurrent callers of the same key
+    await that one call and get its result (or its exception).  A result
+    is also served for ``ttl`` seconds after the call finished.
+
+    The call runs in a task of its own, so cancelling any caller, the one
+    that started it included, leaves the others waiting for the result.
+    Callers share the very same result object and must not modify it.
+    """
+
+    def __init__(self, ttl: float = 0.0) -> None:
+        self.ttl = ttl
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._recent: Dict[Hashable, Tuple[float, Any]] = {}
+        self.calls = 0
+        self.shared = 0
+        self.cached = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if self.ttl:
+            hit = self._recent.get(key)
+            if hit is not None:
+                if time.monotonic() - hit[0] < self.ttl:
+                    self.cached += 1
+                    return hit[1]
+                del self._recent[key]
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            self.calls += 1
+            task = self._inflight[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled():
+            return
+        if task.exception() is None:  # also marks the exception retrieved: nobody may be waiting
+            if self.ttl:
+                _remember(self._recent, key, task.result(), self.ttl)
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "shared": self.shared, "cached": self.cached, "in_flight": len(self._inflight)}
+
+
+class SingleFlight:
+    """Thread‑safe single flight for blocking fetches.
+
+    :meth:`do` coalesces one key; :meth:`do_many` takes a batch, fetches
+    only the keys no other thread is already fetching (in one call of
+    ``fetch_many``) and waits for the rest.  Results are kept ``ttl``
+    seconds; ``ttl=0`` coalesces only calls that overlap in time.
+    """
+
+    class _Call:
+        __slots__ = ("event", "value", "error")
+
+        def __init__(self) -> None:
+            self.event = threading.Event()
+            self.value: Any = None
+            self.error: Any = None
+
+    def __init__(self, ttl: float = 0.0) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, "SingleFlight._Call"] = {}
+        self._recent: Dict[Hashable, Tuple[float, Any]] = {}
+        self.calls = 0
+        self.shared = 0
+        self.cached = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        return self.do_many([key], lambda keys: [fn()])[0]
+
+    def do_many(self, keys: Sequence[Hashable], fetch_many: Callable[[List[Hashable]], List[Any]]) -> List[Any]:
+        """Values of ``keys`` in order.  ``fetch_many(keys)`` must return one
+        value per key, in order."""
+        out: List[Any] = [None] * len(keys)
+        mine: Dict[Hashable, "SingleFlight._Call"] = {}
+        waits: List[Tuple[int, "SingleFlight._Call"]] = []
+        owned: List[int] = []
+        now = time.monotonic()
+        with self._lock:
+            for i, key in enumerate(keys):
+                if self.ttl:
+                    hit = self._recent.get(key)
+                    if hit is not None and now - hit[0] < self.ttl:
+                        out[i] = hit[1]
+                        self.cached += 1
+                        continue
+                call = self._inflight.get(key) or mine.get(key)
+                if call is not None:
+                    if key not in mine:
+                        self.shared += 1
+                    waits.append((i, call))
+                    continue
+                call = mine[key] = self._inflight[key] = self._Call()
+                owned.append(i)
+            if mine:
+                self.calls += 1
+        if mine:
+            fetch_keys = list(mine)
+            try:
+                values = fetch_many(fetch_keys)
+                error = None if len(values) == len(fetch_keys) else ValueError("fetch_many returned a wrong number of values")
+            except BaseException as e:
+                values, error = None, e
+            if error is not None:
+                values = [None] * len(fetch_keys)
+            done = time.monotonic()
+            with self._lock:
+                for key, value in zip(fetch_keys, values):
+                    call = mine[key]
+                    call.value, call.error = value, error
+                    del self._inflight[key]
+                    if self.ttl and error is None:
+                        _remember(self._recent, key, value, self.ttl, done)
+                    call.event.set()
+            if error is not None:
+                raise error
+            for i in owned:
+                out[i] = mine[keys[i]].value
+        for i, call in waits:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            out[i] = call.value
+        return out
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "shared": self.shared, "cached": self.cached, "in_flight": len(self._inflight)}
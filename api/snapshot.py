@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# Columnar screener snapshot: every derived column in one vectorized pass
+from datetime import date
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Inputs, one float64 array each (NaN = no data).  ``*_x`` are VWAP prices
+# over the order books for the executable spreads.
+INPUTS = ("s_last", "s_bid", "s_offer", "s_lot", "f_last", "f_bid", "f_offer", "im", "minstep", "stepprice",
+          "div", "f_ask_x", "f_bid_x", "s_bid_x", "s_ask_x")
+
+# Output columns in ``ScreenerRow`` order
+FIELDS = ("Акция", "Фьючерс", "Дата_див_отсечки", "Размер_див_руб", "Див_pct", "Цена_акции", "Цена_фьючерса",
+          "ГО_pct", "Спред_Входа_pct", "Спред_Выхода_pct", "Спред_Входа_исп_pct", "Спред_Выхода_исп_pct",
+          "Справ_Стоимость", "Дельта_pct", "Всего_pct", "Дней_до_отсечки", "Дней_до_эксп",
+          "Доход_к_отсечке_pct", "Доход_к_эксп_pct")
+
+_EPOCH = date(1970, 1, 1).toordinal()
+
+
+def epoch_days(values: Sequence[Optional[str]]) -> np.ndarray:
+    """ISO dates (a time part is ignored) as days since 1970‑01‑01, NaN where
+    missing or unparsable."""
+    texts = [str(v)[:10] if v else "NaT" for v in values]
+    try:
+        days = np.array(texts, dtype="datetime64[D]")
+    except ValueError:  # a malformed date: parse one by one
+        out = np.full(len(texts), np.nan)
+        for i, t in enumerate(texts):
+            try:
+                out[i] = date.fromisoformat(t).toordinal() - _EPOCH
+            except ValueError:
+                pass
+        return out
+    out = days.astype("int64").astype(np.float64)
+    out[np.isnat(days)] = np.nan
+    return out
+
+
+class Snapshot:
+    """Struct of arrays for a list of shares: float64 :data:`INPUTS`, the
+    futures display codes, raw dividend dates and epoch‑day dates."""
+
+    def __init__(self, shares: List[str], ui: List[str], ex_dates: List[Optional[str]],
+                 exp_dates: List[Optional[str]], columns: Dict[str, Sequence[Optional[float]]]) -> None:
+        n = len(shares)
+        self.shares = shares
+        self.ui = ui
+        self.ex_dates = ex_dates
+        self.ex_day = epoch_days(ex_dates)
+        self.exp_day = epoch_days(exp_dates)
+        self.cols: Dict[str, np.ndarray] = {}
+        for name in INPUTS:
+            values = columns.get(name)
+            # None becomes NaN
+            self.cols[name] = np.full(n, np.nan) if values is None else np.array(values, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.shares)
+
+    def multiplier(self) -> np.ndarray:
+        """Rouble value of one price point of the future (STEPPRICE / MINSTEP)."""
+        c = self.cols
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(_set(c["minstep"]) & _set(c["stepprice"]), c["stepprice"] / c["minstep"], np.nan)
+
+    def compute(self, today: date) -> Dict[str, np.ndarray]:
+        """Derived columns, rounded like the screener shows them; NaN where an
+        input is missing (or zero where it divides)."""
+        c = self.cols
+        s_last, f_last = c["s_last"], c["f_last"]
+        have_spot = _set(s_last)
+        out: Dict[str, np.ndarray] = {}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mult = self.multiplier()
+            go = np.where(_set(c["im"]) & _set(f_last) & _set(mult), c["im"] / (f_last * mult) * 100, np.nan)
+            out["ГО_pct"] = _round(go)
+            out["Спред_Входа_pct"] = _spread(c["f_offer"], c["s_bid"], c["s_bid"])
+            out["Спред_Выхода_pct"] = _spread(c["s_offer"], c["f_bid"], c["s_offer"])
+            out["Спред_Входа_исп_pct"] = _spread(c["f_ask_x"], c["s_bid_x"], c["s_bid_x"])
+            out["Спред_Выхода_исп_pct"] = _spread(c["s_ask_x"], c["f_bid_x"], c["s_ask_x"])
+            delta = _round(np.where(have_spot & ~np.isnan(f_last), (f_last - s_last) / s_last * 100, np.nan))
+            div_pct = _round(np.where(have_spot, c["div"] / s_last * 100, np.nan))
+        total = np.where(np.isnan(div_pct) & np.isnan(delta), np.nan,
+                         np.nan_to_num(div_pct, nan=0.0) + np.nan_to_num(delta, nan=0.0))
+        out["Дельта_pct"] = delta
+        out["Див_pct"] = out["Доход_к_отсечке_pct"] = div_pct
+        out["Всего_pct"] = out["Доход_к_эксп_pct"] = _round(total)
+        out["Справ_Стоимость"] = _round(s_last + c["div"])
+        out["Цена_акции"] = _round(s_last)
+        out["Цена_фьючерса"] = _round(f_last)
+        out["Размер_див_руб"] = c["div"]
+        today_day = today.toordinal() - _EPOCH
+        out["Дней_до_отсечки"] = self.ex_day - today_day
+        out["Дней_до_эксп"] = self.exp_day - today_day
+        return out
+
+    def rows(self, today: date) -> List[dict]:
+        """JSON‑ready screener rows (``None`` for missing values)."""
+        out = self.compute(today)
+        cols: List[list] = []
+        for name in FIELDS:
+            if name == "Акция":
+                cols.append(self.shares)
+            elif name == "Фьючерс":
+                cols.append(self.ui)
+            elif name == "Дата_див_отсечки":
+                cols.append(self.ex_dates)
+            elif name.startswith("Дней_"):
+                cols.append([None if v != v else int(v) for v in out[name].tolist()])
+            else:
+                cols.append([None if v != v else v for v in out[name].tolist()])
+        return [dict(zip(FIELDS, values)) for values in zip(*cols)]
+
+
+def _set(a: np.ndarray) -> np.ndarray:
+    """Present and non‑zero: the truth test the per‑row code used."""
+    return ~np.isnan(a) & (a != 0)
+
+
+def _spread(a: np.ndarray, b: np.ndarray, base: np.ndarray) -> np.ndarray:
+    """``(a - b) / base`` in percent where both legs are present."""
+    return _round(np.where(_set(a) & _set(b), (a - b) / base * 100, np.nan))
+
+
+def _round(a: np.ndarray) -> np.ndarray:
+    """``round(x, 4)`` of every element.  ``np.round`` scales by 10⁴ and
+    rounds, which can land on the other side of a decimal tie (2046.72925);
+    the elements whose scaled value is that close to a tie are rounded
+    again in Python."""
+    scaled = a * 1e4
+    out = np.rint(scaled) / 1e4
+    with np.errstate(invalid="ignore"):
+        near = np.abs(scaled - np.floor(scaled) - 0.5) <= 4 * np.spacing(np.abs(scaled))
+    for i in np.flatnonzero(near).tolist():
+        out[i] = round(float(a[i]), 4)
+    return out
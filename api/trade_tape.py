@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# Append‑only binary log of the QUIK OnAllTrade tape
+import logging
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from QuikPy import QuikPy
+
+logger = logging.getLogger("TradeTape")
+
+# One trade = one 64‑byte little‑endian record.  ``time`` is UTC epoch
+# microseconds; ``flags`` are QUIK trade flags (bit 0 — sell, bit 1 — buy).
+RECORD = np.dtype([
+    ("time", "<i8"),
+    ("trade_num", "<i8"),
+    ("price", "<f8"),
+    ("qty", "<f8"),
+    ("value", "<f8"),
+    ("open_interest", "<f8"),
+    ("flags", "<u4"),
+    ("sec_code", "S12"),
+])
+_PACK = struct.Struct("<qqddddI12s").pack
+assert struct.calcsize("<qqddddI12s") == RECORD.itemsize == 64
+
+
+class TradeRecorder:
+    """Write OnAllTrade into ``root/YYYYMMDD/<class_code>.bin`` segments.
+
+    :meth:`on_all_trade` is a QuikPy ``on_all_trade`` handler.  A trade is
+    packed into a fixed record and written to a buffered append‑only file;
+    buffers are flushed every ``flush_interval`` seconds (by a background
+    thread too, so trades become readable when the tape goes quiet), on
+    :meth:`flush` and on :meth:`close`.  The day is the Moscow calendar date of the trade.
+    """
+
+    def __init__(self, root: str, flush_interval: float = 1.0) -> None:
+        self.root = root
+        self.flush_interval = flush_interval
+        self._files: Dict[Tuple[int, str], object] = {}
+        self._day_base: Dict[Tuple[int, int, int], int] = {}
+        self._lock = threading.Lock()
+        self._flushed = time.monotonic()
+        self._dirty = False
+        self.trades = 0
+        self.errors = 0
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        if flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name="TradeRecorderFlush", daemon=True)
+            self._flusher.start()
+
+    def _segment(self, day: int, class_code: str):
+        f = self._files.get((day, class_code))
+        if f is None:
+            path = os.path.join(self.root, str(day))
+            os.makedirs(path, exist_ok=True)
+            f = self._files[(day, class_code)] = open(os.path.join(path, f"{class_code}.bin"), "ab", buffering=1 << 20)
+            # keep only today's segments open
+            for key in [k for k in self._files if k[0] < day]:
+                self._files.pop(key).close()
+        return f
+
+    def _midnight_us(self, y: int, m: int, d: int) -> int:
+        base = self._day_base.get((y, m, d))
+        if base is None:
+            base = self._day_base[(y, m, d)] = int(QuikPy.tz_msk.localize(datetime(y, m, d)).timestamp()) * 1_000_000
+        return base
+
+    def on_all_trade(self, data: dict) -> None:
+        """QUIK OnAllTrade handler."""
+        t = data.get("data") or {}
+        try:
+            dt = t["datetime"]
+            y, m, d = dt["year"], dt["month"], dt["day"]
+            ts = (self._midnight_us(y, m, d)
+                  + ((dt["hour"] * 60 + dt["min"]) * 60 + dt["sec"]) * 1_000_000
+                  + (dt.get("mcs") or dt.get("ms", 0) * 1000))
+            record = _PACK(ts, int(t["trade_num"]), float(t["price"]), float(t["qty"]), float(t.get("value") or 0),
+                           float(t.get("open_interest") or 0), int(t.get("flags") or 0), t["sec_code"].encode("ascii"))
+            day = (y * 100 + m) * 100 + d
+            class_code = t["class_code"]
+        except (KeyError, TypeError, ValueError, UnicodeEncodeError, struct.error):
+            self.errors += 1
+            return
+        with self._lock:
+            self._segment(day, class_code).write(record)
+            self.trades += 1
+            self._dirty = True
+            now = time.monotonic()
+            if now - self._flushed >= self.flush_interval:
+                self._flush_locked(now)
+
+    def _flush_locked(self, now: float) -> None:
+        for f in self._files.values():
+            f.flush()
+        self._flushed = now
+        self._dirty = False
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            now = time.monotonic()
+            with self._lock:
+                if self._dirty and now - self._flushed >= self.flush_interval:
+                    self._flush_locked(now)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked(time.monotonic())
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join(1)
+        with self._lock:
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
+
+
+class TradeTape:
+    """Memory‑mapped reader of :class:`TradeRecorder` segments.
+
+    Records are read where they lie: a segment maps to a structured NumPy
+    array, a time range is found by binary search (the tape is appended in
+    trade order), and only an instrument filter copies.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def days(self) -> List[int]:
+        try:
+            return sorted(int(d) for d in os.listdir(self.root) if d.isdigit())
+        except FileNotFoundError:
+            return []
+
+    def classes(self, day: int) -> List[str]:
+        try:
+            return sorted(f[:-4] for f in os.listdir(os.path.join(self.root, str(day))) if f.endswith(".bin"))
+        except FileNotFoundError:
+            return []
+
+    def segment(self, day: int, class_code: str) -> np.ndarray:
+        """All complete records of a segment, as a read‑only mapping."""
+        path = os.path.join(self.root, str(day), f"{class_code}.bin")
+        try:
+            n = os.path.getsize(path) // RECORD.itemsize  # a record being written is skipped
+        except FileNotFoundError:
+            n = 0
+        if not n:
+            return np.empty(0, RECORD)
+        return np.memmap(path, dtype=RECORD, mode="r", shape=(n,))
+
+    def read(self, day: int, class_code: str, start: Optional[int] = None, end: Optional[int] = None,
+             sec_code: Optional[str] = None) -> np.ndarray:
+        """Trades with ``start <= time < end`` (UTC epoch microseconds),
+        optionally of one instrument.  Without ``sec_code`` the result is a
+        view of the mapping."""
+        seg = self.segment(day, class_code)
+        times = seg["time"]
+        lo = 0 if start is None else int(np.searchsorted(times, start, "left"))
+        hi = len(seg) if end is None else int(np.searchsorted(times, end, "left"))
+        seg = seg[lo:hi]
+        if sec_code is not None:
+            seg = seg[seg["sec_code"] == sec_code.encode("ascii")]
+        return seg